@@ -1,79 +1,87 @@
+"""
+Фабрика приложения
+Создание приложения не обращается к БД и не трогает файловую систему: схема
+обновляется отдельным шагом развёртывания (flask --app app migrate, см. migrations.py)
+"""
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-import os
-from datetime import timedelta
+from config import Config, INSTANCE_DIR
+from database import db, init_sqlite_pragmas
+from responses import ResponseProvider, compress_response
+from metrics import init_metrics
+from diagnostics import init_diagnostics
 
-app = Flask(__name__)
 
-# Конфигурация
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+def create_app(config_object=Config):
+    app = Flask(__name__, instance_path=INSTANCE_DIR)
+    
+    # Конфигурация (переменные окружения читаются в config.py)
+    app.config.from_object(config_object)
+    
+    # Кодирование ответов (orjson, MessagePack) и их сжатие
+    app.json = ResponseProvider(app)
+    app.after_request(compress_response)
+    
+    # Инициализация расширений
+    db.init_app(app)
+    init_sqlite_pragmas(app)
+    CORS(app)
+    JWTManager(app)
+    
+    # Журнал медленных SQL-запросов и профилирование по X-Profile; метрики подключаются
+    # после них, чтобы учитывать статус исходного ответа, а не ответа с профилем
+    init_diagnostics(app)
+    # Метрики запросов и SQL (GET /api/metrics)
+    init_metrics(app)
+    
+    # Импорт маршрутов (модели импортируются вместе с ними)
+    from routes.auth import auth_bp
+    from routes.video_recorders import video_recorders_bp
+    from routes.employees import employees_bp
+    from routes.issues import issues_bp
+    from routes.sync import sync_bp
+    from routes.events import events_bp
+    from routes.stats import stats_bp
+    from routes.search import search_bp
+    from routes.metrics import metrics_bp
+    
+    # Регистрация blueprint'ов
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(video_recorders_bp, url_prefix='/api/video-recorders')
+    app.register_blueprint(employees_bp, url_prefix='/api/employees')
+    app.register_blueprint(issues_bp, url_prefix='/api/issues')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
+    app.register_blueprint(search_bp, url_prefix='/api/search')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+    
+    # Команды Flask CLI (flask --app app <команда>)
+    from commands import register_commands
+    register_commands(app)
+    
+    @app.errorhandler(413)
+    def request_too_large(e):
+        return {'error': 'Размер запроса превышает допустимый'}, 413
+    
+    @app.route('/')
+    def index():
+        return {'message': 'Video Recorders Management API', 'version': '1.0'}
+    
+    @app.route('/api/health')
+    def health():
+        return {'status': 'ok'}
+    
+    return app
 
-# Абсолютный путь к instance и БД
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-INSTANCE_DIR = os.path.join(BASE_DIR, 'instance')
-os.makedirs(INSTANCE_DIR, exist_ok=True)
-DB_PATH = os.path.join(INSTANCE_DIR, 'video_recorders.db')
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-
-# Создание папки для загрузок, если её нет
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'employee_photos'), exist_ok=True)
-
-# Инициализация расширений
-from database import db
-db.init_app(app)
-cors = CORS(app)
-jwt = JWTManager(app)
-
-# Импорт моделей (после инициализации db)
-from models import Role, Employee, VideoRecorder, User, EmployeePhoto, VideoRecorderIssue, VideoRecorderReturn
-
-# Импорт маршрутов
-from routes.auth import auth_bp
-from routes.video_recorders import video_recorders_bp
-from routes.employees import employees_bp
-from routes.issues import issues_bp
-
-# Регистрация blueprint'ов
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(video_recorders_bp, url_prefix='/api/video-recorders')
-app.register_blueprint(employees_bp, url_prefix='/api/employees')
-app.register_blueprint(issues_bp, url_prefix='/api/issues')
-
-@app.route('/')
-def index():
-    return {'message': 'Video Recorders Management API', 'version': '1.0'}
-
-@app.route('/api/health')
-def health():
-    return {'status': 'ok'}
-
-def init_database():
-    """Инициализация базы данных: создание таблиц и ролей"""
-    try:
-        with app.app_context():
-            db.create_all()
-            # Создание ролей по умолчанию, если их нет
-            if Role.query.count() == 0:
-                admin_role = Role(name='admin', description='Администратор с полными правами')
-                operator_role = Role(name='operator', description='Оператор, может выдавать и принимать видеорегистраторы')
-                db.session.add(admin_role)
-                db.session.add(operator_role)
-                db.session.commit()
-                print("Роли созданы: admin, operator")
-    except Exception as e:
-        print(f"Ошибка при инициализации БД: {e}")
-
-# Инициализация БД при импорте (для WSGI на PythonAnywhere)
-# На локальной машине это также сработает
-init_database()
+# Экземпляр для WSGI-серверов (gunicorn app:app, PythonAnywhere) и flask --app app
+app = create_app()
 
 if __name__ == '__main__':
+    # Локальный запуск: схема обновляется перед стартом сервера
+    from migrations import migrate
+    with app.app_context():
+        migrate()
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,94 @@
+"""
+Нагрузочный замер входа: пропускная способность POST /api/auth/login при
+одновременных запросах и задержка остальных запросов (/api/health) под этой нагрузкой.
+Не тест: запускается вручную против работающего сервера.
+
+    python bench_login.py --url http://127.0.0.1:5000 --username admin --password admin123 \\
+        --concurrency 200 --requests 600
+
+Выводит число входов в секунду, процентили задержки входа, распределение
+кодов ответа (503 — сработало ограничение очереди хэширования) и задержку /api/health.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _request(url, body=None, timeout=60):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = 'error'
+    return status, time.perf_counter() - started
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _format_latencies(values):
+    return ', '.join(
+        f'p{percent} {_percentile(values, percent) * 1000:.0f} мс' for percent in (50, 95, 99)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер пропускной способности входа')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, default=200, help='одновременных клиентов')
+    parser.add_argument('--requests', type=int, default=600, help='всего запросов входа')
+    args = parser.parse_args()
+
+    login_url = args.url.rstrip('/') + '/api/auth/login'
+    health_url = args.url.rstrip('/') + '/api/health'
+    body = {'username': args.username, 'password': args.password}
+
+    # Фоновый опрос лёгкого эндпоинта: насколько вход замедляет остальные запросы
+    stop = threading.Event()
+    health_latencies = []
+
+    def probe():
+        while not stop.is_set():
+            status, elapsed = _request(health_url, timeout=30)
+            if status == 200:
+                health_latencies.append(elapsed)
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe, daemon=True)
+    prober.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda _: _request(login_url, body), range(args.requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    prober.join()
+
+    statuses = Counter(status for status, _ in results)
+    succeeded = [latency for status, latency in results if status == 200]
+    print(f'Запросов: {args.requests}, одновременно: {args.concurrency}, время: {elapsed:.2f} с')
+    print(f'Успешных входов в секунду: {len(succeeded) / elapsed:.1f}')
+    print(f'Коды ответа: {dict(statuses)}')
+    print(f'Задержка входа: {_format_latencies(succeeded)}')
+    print(f'Задержка /api/health под нагрузкой: {_format_latencies(health_latencies)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Команды Flask CLI для обслуживания данных
+Запуск: flask --app app <команда> (список команд: flask --app app --help)
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from importer import IMPORT_MODES, IMPORT_SPECS, ImportFormatError, read_rows, import_rows
+from database import db
+from models import EmployeePhoto, Tombstone, IdempotencyKey
+from versions import bump
+from operations import check_current_holders
+from stats import rebuild as rebuild_stats
+from migrations import MIGRATIONS, applied_versions, migrate
+from photos import (
+    Image, IMAGE_ERRORS, PHOTO_GRACE_SECONDS, photo_dir, photo_path, photo_files, file_sha256, store_photo,
+    generate_variants, touch_employees
+)
+
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_SPECS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--mode', type=click.Choice(IMPORT_MODES), default='insert',
+              help='insert — отклонять существующие записи, upsert — обновлять их')
+@click.option('--dry-run', is_flag=True, help='Только проверить файл, ничего не записывая')
+def import_data_command(kind, path, mode, dry_run):
+    """Массовый импорт сотрудников или видеорегистраторов из CSV/XLSX"""
+    with open(path, 'rb') as stream:
+        try:
+            report = import_rows(kind, read_rows(IMPORT_SPECS[kind], stream, path), mode=mode, dry_run=dry_run)
+        except (ImportFormatError, UnicodeDecodeError) as e:
+            raise click.ClickException(f'Не удалось прочитать файл: {e}')
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+@click.command('photos-backfill')
+@click.option('--force', is_flag=True, help='Пересоздать варианты, даже если они уже есть')
+def photos_backfill_command(force):
+    """
+    Переносит фотографии, загруженные до хранилища по SHA-256, в хранилище
+    и создаёт для них уменьшенные варианты и ETag
+    Старые файлы остаются на месте до запуска photos-gc
+    """
+    if Image is None:
+        click.echo('Pillow не установлен: варианты создаваться не будут', err=True)
+    moved = created = failed = 0
+    # Сотрудники, у которых сменился etag (а с ним photo_url)
+    changed = []
+    for photo in EmployeePhoto.query.all():
+        etag = photo.etag
+        try:
+            # Имена вне хранилища не содержат подкаталогов
+            if '/' not in photo.filename:
+                with open(photo_path(photo.filename), 'rb') as stream:
+                    photo.filename, photo.etag, _ = store_photo(stream)
+                moved += 1
+            elif not photo.etag:
+                photo.etag = file_sha256(photo_path(photo.filename))
+            if generate_variants(photo.filename, force=force):
+                created += 1
+        except IMAGE_ERRORS as e:
+            failed += 1
+            click.echo(f'{photo.filename}: {e}', err=True)
+        if photo.etag != etag:
+            changed.append(photo.employee_id)
+    touch_employees(changed)
+    bump('employees', 'employee_photos')
+    db.session.commit()
+    click.echo(f'Перенесено в хранилище: {moved}, варианты созданы: {created}, ошибок: {failed}')
+
+
+@click.command('photos-gc')
+@click.option('--grace', type=int, default=PHOTO_GRACE_SECONDS, show_default=True,
+              help='Не удалять файлы моложе стольких секунд (загрузки, ещё не закоммиченные в БД)')
+@click.option('--prune-missing', is_flag=True, help='Удалить записи о фотографиях, файла которых нет на диске')
+@click.option('--dry-run', is_flag=True, help='Только показать, что будет удалено')
+def photos_gc_command(grace, prune_missing, dry_run):
+    """
+    Сверяет таблицу employee_photos с файлами на диске: удаляет файлы, на которые
+    не ссылается ни одна запись (остатки после сбоев и старые имена), и сообщает
+    о записях без файла. Таблица читается одним запросом, каталог — одним обходом.
+    """
+    root = photo_dir()
+    rows = db.session.execute(db.select(EmployeePhoto.id, EmployeePhoto.filename, EmployeePhoto.employee_id)).all()
+    expected = set()
+    missing = []
+    for photo_id, filename, employee_id in rows:
+        paths = photo_files(filename)
+        expected.update(os.path.normpath(path) for path in paths)
+        if not os.path.exists(paths[0]):
+            missing.append((photo_id, filename, employee_id))
+
+    deadline = time.time() - grace
+    removed = 0
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.normpath(os.path.join(directory, name))
+            if path in expected:
+                continue
+            try:
+                if os.path.getmtime(path) > deadline:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except OSError as e:
+                click.echo(f'{path}: {e}', err=True)
+                continue
+            removed += 1
+            click.echo(f'Удалён файл без записи: {os.path.relpath(path, root)}')
+
+    for photo_id, filename, _ in missing:
+        click.echo(f'Нет файла для записи {photo_id}: {filename}', err=True)
+    if prune_missing and missing and not dry_run:
+        db.session.execute(db.delete(EmployeePhoto).where(EmployeePhoto.id.in_([photo_id for photo_id, _, _ in missing])))
+        # photo_url этих сотрудников становится пустым
+        touch_employees([employee_id for _, _, employee_id in missing])
+        bump('employees', 'employee_photos')
+        db.session.commit()
+
+    click.echo(f'Файлов удалено: {removed}, записей без файла: {len(missing)}'
+               + (' (удалены)' if prune_missing and missing and not dry_run else '')
+               + (' [dry run]' if dry_run else ''))
+
+
+@click.command('sync-prune')
+def sync_prune_command():
+    """
+    Удаляет записи об удалениях старше SYNC_TOMBSTONE_DAYS дней
+    Клиенты с более старым курсором получат 410 и выполнят полную синхронизацию
+    """
+    horizon = datetime.utcnow() - timedelta(days=current_app.config['SYNC_TOMBSTONE_DAYS'])
+    result = db.session.execute(db.delete(Tombstone).where(Tombstone.deleted_at < horizon))
+    db.session.commit()
+    click.echo(f'Удалено записей об удалениях: {result.rowcount}')
+
+
+@click.command('idempotency-prune')
+def idempotency_prune_command():
+    """Удаляет просроченные ключи идемпотентности (по индексу expires_at)"""
+    result = db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+    db.session.commit()
+    click.echo(f'Удалено ключей идемпотентности: {result.rowcount}')
+
+
+@click.command('recorders-check')
+@click.option('--fix', is_flag=True, help='Исправить расхождения по активным выдачам')
+def recorders_check_command(fix):
+    """Сверяет текущих держателей видеорегистраторов (current_issue_id, current_employee_id) с историей выдач"""
+    mismatches = check_current_holders(fix=fix)
+    for mismatch in mismatches:
+        click.echo(
+            f"Видеорегистратор {mismatch['video_recorder_id']}: "
+            f"выдача {mismatch['current_issue_id']} / сотрудник {mismatch['current_employee_id']}, "
+            f"по истории — выдача {mismatch['expected_issue_id']} / сотрудник {mismatch['expected_employee_id']}"
+        )
+    suffix = ' (исправлены)' if fix and mismatches else ''
+    click.echo(f'Расхождений: {len(mismatches)}{suffix}')
+
+
+@click.command('stats-rebuild')
+def stats_rebuild_command():
+    """Пересчитывает суточные сводки статистики из истории выдач и возвратов"""
+    days = rebuild_stats()
+    click.echo(f'Сводка пересчитана: суток — {days}')
+
+
+@click.command('migrate')
+@click.option('--status', is_flag=True, help='Только показать применённые и ожидающие миграции')
+def migrate_command(status):
+    """Применяет недостающие миграции схемы БД (один раз перед запуском воркеров)"""
+    if status:
+        applied = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            click.echo(f"{version:>4}  {name:<24} {'применена' if version in applied else 'ожидает'}")
+        return
+    applied = migrate()
+    click.echo(f'Применено миграций: {len(applied)}' if applied else 'Схема актуальна')
+
+
+def register_commands(app):
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(import_data_command)
+    app.cli.add_command(photos_backfill_command)
+    app.cli.add_command(photos_gc_command)
+    app.cli.add_command(sync_prune_command)
+    app.cli.add_command(idempotency_prune_command)
+    app.cli.add_command(recorders_check_command)
+    app.cli.add_command(stats_rebuild_command)
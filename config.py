@@ -0,0 +1,135 @@
+"""
+Конфигурация приложения из переменных окружения
+"""
+import os
+from datetime import timedelta
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+INSTANCE_DIR = os.path.join(BASE_DIR, 'instance')
+DEFAULT_DB_PATH = os.path.join(INSTANCE_DIR, 'video_recorders.db')
+
+
+def _env_int(name, default=None):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return int(value)
+
+
+def database_url():
+    """
+    URL базы данных из DATABASE_URL (по умолчанию SQLite в instance/)
+    Относительный путь sqlite:///file.db Flask-SQLAlchemy отсчитывает от папки instance
+    """
+    url = os.environ.get('DATABASE_URL') or f'sqlite:///{DEFAULT_DB_PATH}'
+    # Heroku и ряд хостингов выдают устаревшую схему postgres://
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """
+    Параметры пула соединений SQLAlchemy
+    Задаются только явно указанные в окружении, иначе используются значения SQLAlchemy по умолчанию
+    """
+    options = {}
+    for option, env_name in (
+        ('pool_size', 'DB_POOL_SIZE'),
+        ('max_overflow', 'DB_MAX_OVERFLOW'),
+        ('pool_timeout', 'DB_POOL_TIMEOUT'),
+        ('pool_recycle', 'DB_POOL_RECYCLE'),
+    ):
+        value = _env_int(env_name)
+        if value is not None:
+            options[option] = value
+    # Для серверных СУБД проверяем соединение перед выдачей из пула
+    if not url.startswith('sqlite'):
+        options['pool_pre_ping'] = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+    return options
+
+
+def sqlite_pragmas():
+    """
+    PRAGMA, выполняемые на каждом новом соединении с SQLite:
+    WAL — читатели не блокируются писателем; synchronous=NORMAL — в WAL безопасно
+    и без fsync на каждый коммит; busy_timeout — ожидание блокировки вместо
+    немедленной ошибки "database is locked"; cache_size (отрицательное — в КиБ)
+    и mmap_size — кэш страниц и чтение файла БД через отображение в память
+    """
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT', 5000),
+        'cache_size': _env_int('SQLITE_CACHE_SIZE', -20000),
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    }
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = sqlite_pragmas()
+
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+    # Предел размера тела любого запроса (фотографии, файлы импорта): больше — ответ 413
+    MAX_CONTENT_LENGTH = _env_int('MAX_CONTENT_LENGTH', 32 * 1024 * 1024)
+    # Предел размера одной фотографии сотрудника в байтах
+    PHOTO_MAX_SIZE = _env_int('PHOTO_MAX_SIZE', 10 * 1024 * 1024)
+
+    # Дельта-синхронизация (GET /api/sync): сколько последних секунд изменений отдавать
+    # повторно, чтобы не пропустить строки из транзакций, закоммиченных с опозданием,
+    # и сколько дней хранить записи об удалениях
+    SYNC_OVERLAP_SECONDS = _env_int('SYNC_OVERLAP_SECONDS', 10)
+    SYNC_TOMBSTONE_DAYS = _env_int('SYNC_TOMBSTONE_DAYS', 90)
+
+    # Поток событий (GET /api/events): интервал keepalive и длительность одного соединения
+    # (после неё клиент переподключается с Last-Event-ID, освобождая поток воркера)
+    EVENTS_HEARTBEAT_SECONDS = _env_int('EVENTS_HEARTBEAT_SECONDS', 15)
+    EVENTS_STREAM_SECONDS = _env_int('EVENTS_STREAM_SECONDS', 300)
+
+    # Сжатие ответов (gzip или brotli): тела меньше COMPRESS_MIN_SIZE байт не сжимаются;
+    # уровни — компромисс скорости и размера для ответов, сжимаемых на каждом запросе
+    COMPRESS_MIN_SIZE = _env_int('COMPRESS_MIN_SIZE', 1024)
+    COMPRESS_LEVEL = _env_int('COMPRESS_LEVEL', 6)
+    COMPRESS_BROTLI_QUALITY = _env_int('COMPRESS_BROTLI_QUALITY', 5)
+
+    # Пароли (см. passwords.py): параметры KDF в формате werkzeug, число потоков
+    # хэширования, сколько задач может ждать в очереди и сколько секунд ждать результата
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = _env_int('PASSWORD_HASH_WORKERS', os.cpu_count() or 2)
+    PASSWORD_HASH_QUEUE = _env_int('PASSWORD_HASH_QUEUE', 64)
+    PASSWORD_HASH_TIMEOUT = _env_int('PASSWORD_HASH_TIMEOUT', 10)
+
+    # Метрики (GET /api/metrics, см. metrics.py): METRICS_DIR — общая папка снимков
+    # метрик воркеров, по которой складываются метрики всех процессов (пустое значение —
+    # только метрики своего процесса), METRICS_TOKEN — токен, с которым Prometheus
+    # читает метрики (Authorization: Bearer); без него метрики доступны администратору
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(INSTANCE_DIR, 'metrics'))
+    METRICS_FLUSH_SECONDS = _env_int('METRICS_FLUSH_SECONDS', 5)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+    # Диагностика (см. diagnostics.py): SQL-запросы дольше SLOW_QUERY_MS миллисекунд
+    # (0 — выключить) записываются с планом запроса в SLOW_QUERY_LOG или в лог приложения;
+    # профилирование запроса администратора по заголовку X-Profile
+    SLOW_QUERY_MS = _env_int('SLOW_QUERY_MS', 200)
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', '')
+    SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') != '0'
+    PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', '1') != '0'
+    PROFILE_LIMIT = _env_int('PROFILE_LIMIT', 40)
+
+    # Сколько часов хранится ответ на запрос с Idempotency-Key
+    IDEMPOTENCY_TTL_HOURS = _env_int('IDEMPOTENCY_TTL_HOURS', 24)
+
+    # Отдача файлов фотографий фронтовым прокси вместо Python-воркера:
+    # 'x-accel-redirect' (nginx, внутренний location PHOTO_ACCEL_REDIRECT_PREFIX),
+    # 'x-sendfile' (Apache mod_xsendfile, lighttpd) или пусто — файл отдаёт Flask
+    PHOTO_SENDFILE = os.environ.get('PHOTO_SENDFILE', '').lower()
+    PHOTO_ACCEL_REDIRECT_PREFIX = os.environ.get('PHOTO_ACCEL_REDIRECT_PREFIX', '/protected/employee_photos')
+    USE_X_SENDFILE = PHOTO_SENDFILE == 'x-sendfile'
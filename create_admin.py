@@ -6,34 +6,12 @@ from app import app
 from database import db
 from models import User, Role
 from werkzeug.security import generate_password_hash
+from migrations import migrate
 
 with app.app_context():
-    # Создание базы данных, если её нет
-    db.create_all()
+    # Таблицы и роли создаются миграциями
+    migrate()
     
-    # Создание ролей, если их нет
-    print("Проверка ролей...")
-    admin_role = Role.query.filter_by(name='admin').first()
-    if not admin_role:
-        print("Создание роли 'admin'...")
-        admin_role = Role(name='admin', description='Администратор с полными правами')
-        db.session.add(admin_role)
-        db.session.commit()
-        print("✓ Роль 'admin' создана")
-    else:
-        print("✓ Роль 'admin' уже существует")
-    
-    operator_role = Role.query.filter_by(name='operator').first()
-    if not operator_role:
-        print("Создание роли 'operator'...")
-        operator_role = Role(name='operator', description='Оператор, может выдавать и принимать видеорегистраторы')
-        db.session.add(operator_role)
-        db.session.commit()
-        print("✓ Роль 'operator' создана")
-    else:
-        print("✓ Роль 'operator' уже существует")
-    
-    # Обновляем admin_role после возможного создания
     admin_role = Role.query.filter_by(name='admin').first()
     
     # Проверка, существует ли администратор
@@ -44,7 +22,7 @@ with app.app_context():
         response = input("Хотите изменить пароль? (y/n): ")
         if response.lower() == 'y':
             new_password = input("Введите новый пароль: ")
-            admin_user.password_hash = generate_password_hash(new_password)
+            admin_user.password_hash = generate_password_hash(new_password, app.config['PASSWORD_HASH_METHOD'])
             db.session.commit()
             print("✓ Пароль обновлён!")
     else:
@@ -60,7 +38,7 @@ with app.app_context():
         
         admin_user = User(
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=generate_password_hash(password, app.config['PASSWORD_HASH_METHOD']),
             last_name=last_name,
             first_name=first_name,
             middle_name=middle_name,
@@ -1,5 +1,29 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 # Инициализация db без привязки к app
 # app будет передан позже через init_app
 db = SQLAlchemy()
+
+
+def init_sqlite_pragmas(app):
+    """
+    Вешает на engine приложения хук, выполняющий SQLITE_PRAGMAS из конфигурации
+    на каждом новом соединении. Для других СУБД ничего не делает.
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    for name, value in pragmas.items():
+        if not str(value).lstrip('-').isalnum():
+            raise ValueError(f'Недопустимое значение PRAGMA {name}: {value!r}')
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
@@ -0,0 +1,200 @@
+"""
+Диагностика медленных запросов: журнал медленных SQL-запросов и профилирование
+отдельного HTTP-запроса.
+
+Журнал медленных запросов: SQL-запрос дольше SLOW_QUERY_MS миллисекунд
+записывается в логгер slow_queries (в файл SLOW_QUERY_LOG, если задан) одной
+JSON-строкой: текст, параметры, длительность, эндпоинт и план SQLite
+(EXPLAIN QUERY PLAN). План показывает, идёт ли запрос по индексу (SEARCH ... USING
+INDEX) или читает всю таблицу (SCAN). План запрашивается отдельным курсором того же
+соединения уже после медленного запроса, поэтому быстрые запросы ничего не платят.
+
+Профилирование: администратор присылает заголовок X-Profile, и вместо ответа
+получает профиль cProfile этого запроса — таблицу pstats (X-Profile: text)
+или файл pstats для snakeviz и pstats.Stats (X-Profile: pstats). Статус
+исходного ответа — в заголовке X-Profiled-Status. Для потоковых ответов
+профиль охватывает только работу обработчика до начала потока.
+"""
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import time
+from datetime import datetime
+from flask import g, has_request_context, request, current_app
+from flask_jwt_extended import verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from sqlalchemy import event
+from database import db
+from routes.utils import get_current_role
+
+slow_query_logger = logging.getLogger('slow_queries')
+
+# Сколько символов значения параметра попадает в журнал (фотографии, длинные строки)
+PARAMETER_MAX_LENGTH = 200
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_FORMATS = ('text', 'pstats')
+
+# Запросы, для которых EXPLAIN QUERY PLAN не имеет смысла
+_NOT_EXPLAINABLE = ('PRAGMA', 'EXPLAIN', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'CREATE', 'DROP', 'ALTER')
+
+
+def _short(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} байт>'
+    if isinstance(value, str) and len(value) > PARAMETER_MAX_LENGTH:
+        return value[:PARAMETER_MAX_LENGTH] + '…'
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return _short(str(value))
+
+
+def _loggable_parameters(parameters, executemany):
+    if executemany:
+        # Для executemany достаточно числа наборов и первого набора
+        return {'rows': len(parameters), 'first': _loggable_parameters(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: _short(value) for key, value in parameters.items()}
+    return [_short(value) for value in parameters or ()]
+
+
+def query_plan(dbapi_connection, statement, parameters):
+    """
+    План SQLite в виде дерева строк, как его печатает sqlite3 (.eqp):
+    каждая строка плана с отступом по вложенности
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+def _explainable(connection, statement):
+    return (connection.dialect.name == 'sqlite'
+            and not statement.lstrip().upper().startswith(_NOT_EXPLAINABLE))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('slow_query_started', []).append(time.perf_counter())
+
+
+def _slow_query_listener(threshold_ms, explain):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['slow_query_started'].pop()
+        if duration * 1000 < threshold_ms:
+            return
+
+        record = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'duration_ms': round(duration * 1000, 1),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'statement': statement,
+            'parameters': _loggable_parameters(parameters, executemany),
+        }
+        if explain and _explainable(conn, statement):
+            plan_parameters = parameters[0] if executemany else parameters
+            try:
+                record['plan'] = query_plan(conn.connection.dbapi_connection, statement, plan_parameters)
+            except Exception as e:
+                # Журнал не должен ломать запрос, которому он не нужен
+                record['plan_error'] = str(e)
+        slow_query_logger.warning(json.dumps(record, ensure_ascii=False, default=str))
+    return after_cursor_execute
+
+
+def _handle_error(exception_context):
+    # Запрос упал в драйвере: after_cursor_execute не будет вызван
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('slow_query_started'):
+        connection.info['slow_query_started'].pop()
+
+
+def _init_slow_query_log(app):
+    slow_query_ms = app.config.get('SLOW_QUERY_MS') or 0
+    if slow_query_ms <= 0:
+        return
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute',
+                 _slow_query_listener(slow_query_ms, app.config.get('SLOW_QUERY_EXPLAIN', True)))
+    event.listen(engine, 'handle_error', _handle_error)
+
+    path = app.config.get('SLOW_QUERY_LOG')
+    if path and not any(getattr(handler, 'baseFilename', None) == path for handler in slow_query_logger.handlers):
+        # Файл открывается при первой записи: создание приложения не трогает файловую систему
+        handler = logging.FileHandler(path, encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.WARNING)
+        slow_query_logger.propagate = False
+
+
+def _profile_requested():
+    """Формат профиля из заголовка X-Profile, если его прислал администратор; иначе None"""
+    profile_format = request.headers.get(PROFILE_HEADER)
+    if not profile_format:
+        return None
+    profile_format = profile_format.lower()
+    if profile_format not in PROFILE_FORMATS:
+        profile_format = 'text'
+    try:
+        verify_jwt_in_request()
+    except (JWTExtendedException, PyJWTError):
+        return None
+    # Чужой заголовок просто игнорируется: профиль раскрывает устройство сервера
+    return profile_format if get_current_role() == 'admin' else None
+
+
+def _start_profile():
+    profile_format = _profile_requested()
+    if profile_format is None:
+        return
+    g.profile_format = profile_format
+    g.profile = cProfile.Profile()
+    g.profile.enable()
+
+
+def _profile_response(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    profile.disable()
+    profile.create_stats()
+    status = response.status_code
+
+    if g.pop('profile_format') == 'pstats':
+        body = marshal.dumps(profile.stats)
+        result = current_app.response_class(body, mimetype='application/octet-stream')
+        result.headers['Content-Disposition'] = f'attachment; filename={request.endpoint or "request"}.pstats'
+    else:
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(current_app.config['PROFILE_LIMIT'])
+        queries = g.get('metrics_queries')
+        if queries is not None:
+            stream.write(f'SQL-запросов: {queries[0]}, время SQL: {queries[1] * 1000:.1f} мс\n')
+        result = current_app.response_class(stream.getvalue(), mimetype='text/plain')
+    result.headers['X-Profiled-Status'] = str(status)
+    result.headers['Cache-Control'] = 'no-store'
+    return result
+
+
+def init_diagnostics(app):
+    """Подключает журнал медленных запросов и профилирование (вызывается из create_app)"""
+    _init_slow_query_log(app)
+    if app.config.get('PROFILE_ENABLED'):
+        app.before_request(_start_profile)
+        app.after_request(_profile_response)
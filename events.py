@@ -0,0 +1,83 @@
+"""
+Лента изменений для клиентов: Server-Sent Events (GET /api/events).
+
+Обработчики после успешного коммита публикуют событие в брокер процесса.
+Брокер хранит последние EVENT_BUFFER_SIZE событий в кольцевом буфере (deque),
+поэтому переподключившийся клиент получает пропущенное по Last-Event-ID;
+если нужные события уже вытеснены или процесс перезапущен, клиент получает
+событие reset и перечитывает данные целиком (например, через /api/sync).
+
+Брокер живёт в памяти процесса: при нескольких воркерах клиент получает
+события только своего воркера, для общей ленты нужен внешний брокер.
+"""
+import json
+import threading
+import uuid
+from collections import deque
+from itertools import islice
+
+EVENT_BUFFER_SIZE = 1000
+# Через сколько миллисекунд клиент переподключается после обрыва (поле retry SSE)
+RECONNECT_MS = 3000
+
+
+class EventBroker:
+    """Pub/sub в памяти процесса с кольцевым буфером последних событий"""
+
+    def __init__(self, size=EVENT_BUFFER_SIZE):
+        # Часть id события: по ней видно, что id выдан другим (перезапущенным) процессом
+        self.stream_id = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=size)
+        self._last_seq = 0
+        self._condition = threading.Condition()
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def publish(self, event_type, data):
+        with self._condition:
+            self._last_seq += 1
+            self._events.append((self._last_seq, event_type, data))
+            self._condition.notify_all()
+
+    def event_id(self, seq):
+        return f'{self.stream_id}-{seq}'
+
+    def parse_event_id(self, value):
+        """Last-Event-ID -> номер события этого процесса; None, если id чужой или неверный"""
+        stream_id, _, seq = (value or '').partition('-')
+        if stream_id != self.stream_id or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, seq):
+        """События после seq по порядку; None, если часть из них уже вытеснена из буфера"""
+        with self._condition:
+            if seq > self._last_seq:
+                return None
+            first_seq = self._events[0][0] if self._events else self._last_seq + 1
+            if seq < first_seq - 1:
+                return None
+            # Номера подряд, поэтому позиция в буфере вычисляется, а не ищется
+            return list(islice(self._events, seq - first_seq + 1, None))
+
+    def wait(self, seq, timeout):
+        """Ждёт событий после seq не дольше timeout секунд; возвращает их (возможно, пустой список)"""
+        with self._condition:
+            if self._last_seq <= seq:
+                self._condition.wait(timeout)
+            return self.since(seq)
+
+
+broker = EventBroker()
+
+
+def publish(event_type, data):
+    """Публикует событие для подключённых клиентов; вызывать только после коммита"""
+    broker.publish(event_type, data)
+
+
+def format_event(event_id, event_type, data):
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
@@ -0,0 +1,181 @@
+"""
+Идемпотентность изменяющих запросов по заголовку Idempotency-Key.
+
+Клиент с нестабильной сетью повторяет запрос с тем же ключом. Первый запрос
+захватывает ключ (строка со status_code = NULL), выполняется и сохраняет свой
+ответ; повтор получает сохранённый ответ одним поиском по первичному ключу
+(user_id, key), без проверок и запросов самого обработчика. Ключ действует
+IDEMPOTENCY_TTL_HOURS часов, просроченные удаляет команда idempotency-prune.
+
+Ответ сохраняется байтами вместе с типом содержимого (JSON или MessagePack
+по заголовку Accept) и при повторе отдаётся без изменений.
+
+Ответы 5xx и 409/429 не сохраняются: такой запрос имеет смысл повторить
+по-настоящему, поэтому ключ освобождается.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, make_response, current_app, url_for
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Сколько секунд захваченный ключ считается занятым выполняющимся запросом;
+# дольше — запрос оборвался (например, упал воркер), и ключ можно захватить снова
+LOCK_SECONDS = 60
+# Ответы, после которых повтор запроса может дать другой результат
+RETRYABLE_STATUSES = {409, 429}
+
+
+def request_hash(method, path, body):
+    """Отпечаток запроса: метод, путь и тело (JSON сравнивается по содержимому, а не по байтам)"""
+    raw = json.dumps([method, path, body], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def endpoint_path(endpoint):
+    """
+    Путь эндпоинта без префикса монтирования (SCRIPT_NAME) — как request.path,
+    от которого считается отпечаток одиночного запроса
+    """
+    return url_for(endpoint)[len(request.script_root):]
+
+
+def find_keys(user_id, keys):
+    """
+    Действующие ключи пользователя одним запросом: {key: строка с колонками IdempotencyKey}
+    Строки — не ORM-объекты: коммиты claim()/complete() их не сбрасывают, и обращение
+    к полям не перечитывает ключ из БД
+    """
+    rows = db.session.execute(select(
+        IdempotencyKey.key, IdempotencyKey.request_hash, IdempotencyKey.status_code,
+        IdempotencyKey.response_body, IdempotencyKey.mimetype,
+        IdempotencyKey.created_at, IdempotencyKey.expires_at
+    ).where(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key.in_(keys),
+        IdempotencyKey.expires_at > datetime.utcnow()
+    ))
+    return {row.key: row for row in rows}
+
+
+def stored_result(stored, fingerprint):
+    """
+    Ответ на повтор по сохранённому ключу: (тело, статус, mimetype сохранённого ответа)
+    Тело — строка сохранённого ответа или словарь ошибки (тогда mimetype = None)
+    """
+    if stored.request_hash != fingerprint:
+        return {'error': 'Ключ идемпотентности уже использован для другого запроса'}, 422, None
+    if stored.status_code is None:
+        return {'error': 'Запрос с этим ключом идемпотентности ещё выполняется'}, 409, None
+    return stored.response_body, stored.status_code, stored.mimetype or 'application/json'
+
+
+def claim(user_id, key, fingerprint, stored=None):
+    """
+    Захватывает ключ перед выполнением запроса; stored — уже найденная строка ключа
+    Возвращает None, если запрос надо выполнить, иначе результат stored_result()
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=current_app.config['IDEMPOTENCY_TTL_HOURS'])
+    if stored is None:
+        try:
+            db.session.add(IdempotencyKey(
+                user_id=user_id, key=key, request_hash=fingerprint, created_at=now, expires_at=expires_at
+            ))
+            db.session.commit()
+            return None
+        except IntegrityError:
+            # Ключ уже есть: параллельный запрос или просроченная запись
+            db.session.rollback()
+            stored = db.session.get(IdempotencyKey, (user_id, key))
+            if stored is None:
+                return claim(user_id, key, fingerprint)
+
+    abandoned = stored.status_code is None and stored.created_at <= now - timedelta(seconds=LOCK_SECONDS)
+    if stored.expires_at <= now or abandoned:
+        # Условный UPDATE: из нескольких одновременных повторов ключ захватит один
+        result = db.session.execute(
+            update(IdempotencyKey)
+            .where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.created_at == stored.created_at
+            )
+            .values(request_hash=fingerprint, status_code=None, response_body=None, mimetype=None,
+                    created_at=now, expires_at=expires_at)
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return None
+        return {'error': 'Запрос с этим ключом идемпотентности ещё выполняется'}, 409, None
+    return stored_result(stored, fingerprint)
+
+
+def complete(user_id, key, body, status, mimetype='application/json'):
+    """Сохраняет ответ выполненного запроса или освобождает ключ, если ответ сохранять не нужно"""
+    if status >= 500 or status in RETRYABLE_STATUSES:
+        release(user_id, key)
+        return
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(status_code=status, response_body=body, mimetype=mimetype)
+    )
+    db.session.commit()
+
+
+def release(user_id, key):
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key))
+    db.session.commit()
+
+
+def _response(body, status, mimetype):
+    if mimetype is None:
+        return jsonify(body), status
+    response = current_app.response_class(body, status=status, mimetype=mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(fn):
+    """
+    Декоратор изменяющего эндпоинта (ставится после jwt_required/role_required):
+    запрос с заголовком Idempotency-Key выполняется один раз, повторы получают
+    сохранённый ответ с заголовком Idempotent-Replayed: true. Без заголовка — обычный запрос
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key длиннее {MAX_KEY_LENGTH} символов'}), 400
+
+        user_id = int(get_jwt_identity())
+        body = request.get_json(silent=True)
+        if body is None:
+            body = request.get_data(as_text=True)
+        fingerprint = request_hash(request.method, request.path, body)
+
+        # Повтор выполненного запроса — один поиск по первичному ключу
+        stored = db.session.get(IdempotencyKey, (user_id, key))
+        result = claim(user_id, key, fingerprint, stored)
+        if result is not None:
+            return _response(*result)
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            release(user_id, key)
+            raise
+        complete(user_id, key, response.get_data(), response.status_code, response.mimetype)
+        return response
+    return wrapper
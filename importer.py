@@ -0,0 +1,206 @@
+"""
+Массовый импорт сотрудников и видеорегистраторов из CSV или XLSX.
+
+Файл читается потоково и обрабатывается порциями: на порцию — один запрос
+на проверку уникальности ключа (табельный номер / номер регистратора) и
+executemany для вставки и обновления. Весь импорт — одна транзакция.
+Для XLSX нужен пакет openpyxl (pip install openpyxl).
+"""
+import csv
+import io
+from itertools import islice
+from sqlalchemy import insert, update
+from database import db
+from models import Employee, VideoRecorder
+from versions import bump
+
+IMPORT_CHUNK_SIZE = 1000
+# Сколько ошибок по строкам возвращать в отчёте
+MAX_REPORTED_ERRORS = 100
+
+IMPORT_MODES = ('insert', 'upsert')
+
+
+class ImportSpec:
+    """Описание импортируемой сущности: модель, ключевое поле, поля и синонимы заголовков"""
+
+    def __init__(self, model, key, required, optional, aliases, validate=None):
+        self.model = model
+        self.key = key
+        self.required = required
+        self.optional = optional
+        self.aliases = aliases
+        self.validate = validate
+
+    @property
+    def fields(self):
+        return self.required + self.optional
+
+
+def _validate_recorder(values):
+    status = values.get('status')
+    if status is not None and status not in ('available', 'issued'):
+        return 'Недопустимый статус'
+    return None
+
+
+IMPORT_SPECS = {
+    'employees': ImportSpec(
+        model=Employee,
+        key='employee_number',
+        required=['full_name', 'employee_number'],
+        optional=['position'],
+        aliases={'фио': 'full_name', 'должность': 'position', 'табельный номер': 'employee_number'},
+    ),
+    'video_recorders': ImportSpec(
+        model=VideoRecorder,
+        key='number',
+        required=['number'],
+        optional=['status'],
+        aliases={'номер': 'number', 'статус': 'status'},
+        validate=_validate_recorder,
+    ),
+}
+
+
+class ImportFormatError(ValueError):
+    """Файл не удаётся прочитать как таблицу нужного формата"""
+
+
+def _cell(value):
+    """Значение ячейки -> строка без пробелов по краям или None"""
+    if value is None:
+        return None
+    # Excel хранит числа как float: 123.0 -> '123'
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def _header(spec, names):
+    header = []
+    for name in names:
+        name = (_cell(name) or '').lower()
+        header.append(spec.aliases.get(name, name))
+    missing = [field for field in spec.required if field not in header]
+    if missing:
+        raise ImportFormatError(f'В файле нет обязательных колонок: {", ".join(missing)}')
+    return header
+
+
+def _read_csv(spec, stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    first_line = text.readline()
+    # Excel в русской локали сохраняет CSV с разделителем ';'
+    delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+    header = _header(spec, next(csv.reader([first_line], delimiter=delimiter), []))
+    for values in csv.reader(text, delimiter=delimiter):
+        yield dict(zip(header, values))
+
+
+def _read_xlsx(spec, stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError('Для импорта XLSX установите пакет openpyxl')
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _header(spec, next(rows, ()))
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(spec, stream, filename):
+    """Строки файла как словари {поле: значение}; формат определяется по расширению"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return _read_csv(spec, stream)
+    if extension == 'xlsx':
+        return _read_xlsx(spec, stream)
+    raise ImportFormatError('Поддерживаются только файлы CSV и XLSX')
+
+
+def import_rows(kind, rows, mode='insert', dry_run=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Импортирует строки в таблицу kind ('employees' или 'video_recorders')
+
+    mode='insert' — строки с уже существующим ключом отклоняются,
+    mode='upsert' — такие записи обновляются.
+    dry_run=True — всё проверяется, но изменения откатываются.
+    Возвращает отчёт: total, created, updated, failed и первые ошибки по строкам.
+    """
+    spec = IMPORT_SPECS[kind]
+    model = spec.model
+    key_column = getattr(model, spec.key)
+    report = {'total': 0, 'created': 0, 'updated': 0, 'failed': 0, 'errors': [], 'dry_run': dry_run}
+    seen_keys = set()
+
+    def fail(line, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': line, 'error': message})
+
+    # Строка 1 — заголовок, данные начинаются со 2-й
+    numbered = enumerate(rows, start=2)
+    try:
+        while True:
+            chunk = list(islice(numbered, chunk_size))
+            if not chunk:
+                break
+
+            valid = []
+            for line, raw in chunk:
+                report['total'] += 1
+                values = {field: _cell(raw.get(field)) for field in spec.fields if field in raw}
+                missing = [field for field in spec.required if not values.get(field)]
+                if missing:
+                    fail(line, f'Не заполнены обязательные поля: {", ".join(missing)}')
+                    continue
+                error = spec.validate(values) if spec.validate else None
+                if error:
+                    fail(line, error)
+                    continue
+                if values[spec.key] in seen_keys:
+                    fail(line, f'Повторяющееся значение {spec.key} в файле: {values[spec.key]}')
+                    continue
+                seen_keys.add(values[spec.key])
+                valid.append((line, values))
+
+            # Уникальность проверяется одним запросом на порцию
+            existing = dict(db.session.execute(
+                db.select(key_column, model.id).where(key_column.in_([values[spec.key] for _, values in valid]))
+            ).all()) if valid else {}
+
+            to_insert = []
+            to_update = []
+            for line, values in valid:
+                existing_id = existing.get(values[spec.key])
+                if existing_id is None:
+                    to_insert.append(values)
+                elif mode == 'upsert':
+                    to_update.append({'id': existing_id, **values})
+                else:
+                    fail(line, f'Запись с {spec.key} = {values[spec.key]} уже существует')
+
+            if to_insert:
+                db.session.execute(insert(model), to_insert)
+            if to_update:
+                db.session.execute(update(model), to_update)
+            if to_insert or to_update:
+                bump(model.__tablename__)
+            report['created'] += len(to_insert)
+            report['updated'] += len(to_update)
+
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return report
@@ -0,0 +1,385 @@
+"""
+Метрики приложения в текстовом формате Prometheus (GET /api/metrics).
+
+init_metrics(app) вешает хуки запроса и события engine и собирает:
+- число запросов по эндпоинту, методу и статусу;
+- гистограмму длительности запросов по эндпоинту;
+- число запросов, выполняемых в данный момент;
+- число SQL-запросов и их суммарное время на запрос (гистограмма и счётчики по эндпоинту);
+- состояние пула соединений БД.
+
+Метрики копятся в памяти процесса под одной блокировкой. У каждого воркера
+gunicorn своя память, поэтому процесс раз в METRICS_FLUSH_SECONDS записывает
+снимок своих метрик в файл папки METRICS_DIR (по умолчанию instance/metrics),
+а /api/metrics складывает снимки всех процессов. Файл называется по pid и
+случайному идентификатору процесса: перезапущенный воркер с тем же pid пишет
+в свой файл и не затирает снимок предыдущего. Счётчики завершившихся воркеров
+продолжают учитываться (счётчики не должны уменьшаться), а их показатели
+«сейчас» (запросы в работе, пул) — нет: /api/metrics переносит счётчики снимка
+завершившегося процесса в общий файл dead.json (под блокировкой файла) и удаляет
+снимок, поэтому файлов в папке не больше, чем живых воркеров, плюс один.
+Папку стоит очищать при развёртывании.
+С пустым METRICS_DIR каждый процесс отдаёт только свои метрики.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from database import db
+
+try:
+    import fcntl
+except ImportError:  # нет в Windows: снимки завершившихся процессов не объединяются
+    fcntl = None
+
+# Границы корзин гистограмм: длительность запроса в секундах и число SQL-запросов
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Описание метрик: имя -> (тип, справка)
+METRICS = {
+    'http_requests_total': ('counter', 'Обработанные HTTP-запросы'),
+    'http_request_duration_seconds': ('histogram', 'Длительность обработки HTTP-запроса'),
+    'http_requests_in_progress': ('gauge', 'HTTP-запросы, обрабатываемые сейчас'),
+    'db_queries_per_request': ('histogram', 'Число SQL-запросов на HTTP-запрос'),
+    'db_queries_total': ('counter', 'SQL-запросы, выполненные при обработке HTTP-запросов'),
+    'db_query_duration_seconds_total': ('counter', 'Суммарное время SQL-запросов при обработке HTTP-запросов'),
+    'db_pool_size': ('gauge', 'Размер пула соединений БД'),
+    'db_pool_checked_out': ('gauge', 'Соединения БД, выданные из пула'),
+    'db_pool_overflow': ('gauge', 'Соединения БД сверх размера пула'),
+}
+
+# Снимок со счётчиками всех завершившихся процессов и блокировка для его изменения
+DEAD_SNAPSHOT = 'dead.json'
+DEAD_LOCK = 'dead.lock'
+
+# Эндпоинт запросов, не нашедших маршрута (иначе каждый URL стал бы отдельной меткой)
+UNMATCHED_ENDPOINT = 'unmatched'
+
+
+class Registry:
+    """Метрики процесса: счётчики, гистограммы и показатели «сейчас»"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.in_progress = 0
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Счётчики корзин (последняя — +Inf) и сумма значений
+                histogram = self.histograms[key] = [[0] * (len(buckets) + 1), 0]
+            counts = histogram[0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            histogram[1] += value
+
+    def snapshot(self, gauges):
+        """Снимок для файла METRICS_DIR и для сложения с другими процессами"""
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'process': process_id(),
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(counts), total]
+                               for (name, labels), (counts, total) in self.histograms.items()],
+                'gauges': [[name, [], value] for name, value in gauges.items()],
+            }
+
+
+registry = Registry()
+
+# (pid, идентификатор) текущего процесса; после fork pid меняется и идентификатор создаётся заново
+_process = None
+
+
+def process_id():
+    """Идентификатор процесса для имени файла снимка: pid и случайная часть, уникальная при повторе pid"""
+    global _process
+    pid = os.getpid()
+    if _process is None or _process[0] != pid:
+        _process = (pid, f'{pid}-{uuid.uuid4().hex[:12]}')
+    return _process[1]
+
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def _pool_gauges():
+    """Состояние пула соединений процесса; у пулов без размера (SQLite в памяти) — пусто"""
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return {}
+    return {
+        'db_pool_size': pool.size(),
+        'db_pool_checked_out': pool.checkedout(),
+        'db_pool_overflow': max(pool.overflow(), 0),
+    }
+
+
+def _process_snapshot():
+    gauges = {'http_requests_in_progress': registry.in_progress}
+    gauges.update(_pool_gauges())
+    return registry.snapshot(gauges)
+
+
+def _snapshot_path(directory, process):
+    return os.path.join(directory, f'{process}.json')
+
+
+def _write_snapshot(path, snapshot):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    # Замена файла атомарна: читатель видит либо старый, либо новый снимок
+    os.replace(tmp_path, path)
+
+
+def _read_snapshot(path):
+    """Снимок из файла; None, если файла нет или он повреждён"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush(app, force=False):
+    """Записывает снимок метрик процесса в METRICS_DIR не чаще раза в METRICS_FLUSH_SECONDS"""
+    global _last_flush
+    directory = app.config.get('METRICS_DIR')
+    # Процесс без запросов (например, команда flask migrate) файл не создаёт
+    if not directory or not registry.counters:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < app.config['METRICS_FLUSH_SECONDS']:
+        return
+    if not _flush_lock.acquire(blocking=False):
+        # Снимок уже пишет другой поток
+        return
+    try:
+        _last_flush = now
+        with app.app_context():
+            snapshot = _process_snapshot()
+        os.makedirs(directory, exist_ok=True)
+        _write_snapshot(_snapshot_path(directory, snapshot['process']), snapshot)
+    finally:
+        _flush_lock.release()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fold_dead(directory, path):
+    """
+    Переносит счётчики и гистограммы снимка завершившегося процесса в DEAD_SNAPSHOT
+    и удаляет снимок. Под блокировкой файла: снимок, уже перенесённый параллельным
+    /api/metrics другого воркера, второй раз не учитывается
+    """
+    with open(os.path.join(directory, DEAD_LOCK), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        snapshot = _read_snapshot(path)
+        if snapshot is None:
+            return
+        snapshot['gauges'] = []
+        dead_path = os.path.join(directory, DEAD_SNAPSHOT)
+        dead = _read_snapshot(dead_path) or {'counters': [], 'histograms': [], 'gauges': []}
+        counters, histograms = _merge([dead, snapshot])
+        _write_snapshot(dead_path, {
+            'pid': None,
+            'process': 'dead',
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), counts, total]
+                           for (name, labels), (counts, total) in histograms.items()],
+            'gauges': [],
+        })
+        os.remove(path)
+
+
+def collect(app):
+    """Снимки всех процессов: свой — текущий, остальные — из файлов METRICS_DIR"""
+    own = _process_snapshot()
+    snapshots = [own]
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        flush(app, force=True)
+        dead_path = os.path.join(directory, DEAD_SNAPSHOT)
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            if path == dead_path:
+                continue
+            snapshot = _read_snapshot(path)
+            if snapshot is None or snapshot.get('process') == own['process']:
+                continue
+            # Тот же pid, но другой процесс: предыдущий воркер с этим pid завершился
+            if snapshot['pid'] == own['pid'] or not _process_alive(snapshot['pid']):
+                if fcntl is not None:
+                    _fold_dead(directory, path)
+                    continue
+                snapshot['gauges'] = []
+            snapshots.append(snapshot)
+        # Читается после переноса: счётчики перенесённых снимков не пропадают из суммы
+        dead = _read_snapshot(dead_path)
+        if dead is not None:
+            snapshots.append(dead)
+    return snapshots
+
+
+def _merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters'] + snapshot['gauges']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [list(counts), total]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+_HISTOGRAM_BUCKETS = {
+    'http_request_duration_seconds': LATENCY_BUCKETS,
+    'db_queries_per_request': QUERY_COUNT_BUCKETS,
+}
+
+
+def render(snapshots):
+    """Текст в формате Prometheus exposition format 0.0.4"""
+    counters, histograms = _merge(snapshots)
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        if metric_type == 'histogram':
+            bounds = [str(bound) for bound in _HISTOGRAM_BUCKETS[name]] + ['+Inf']
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(total)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        else:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = [0, 0.0]
+    with registry.lock:
+        registry.in_progress += 1
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(app):
+    def teardown(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+        with registry.lock:
+            registry.in_progress -= 1
+        endpoint = request.endpoint or UNMATCHED_ENDPOINT
+        # Без ответа (необработанное исключение) клиент получит 500
+        status = g.pop('metrics_status', 500)
+        queries, query_seconds = g.pop('metrics_queries')
+
+        registry.inc('http_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', str(status))))
+        registry.observe('http_request_duration_seconds', (('endpoint', endpoint),), duration, LATENCY_BUCKETS)
+        registry.observe('db_queries_per_request', (('endpoint', endpoint),), queries, QUERY_COUNT_BUCKETS)
+        if queries:
+            registry.inc('db_queries_total', (('endpoint', endpoint),), queries)
+            registry.inc('db_query_duration_seconds_total', (('endpoint', endpoint),), query_seconds)
+        flush(app)
+    return teardown
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['metrics_started'].pop()
+    if has_request_context():
+        queries = g.get('metrics_queries')
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += time.perf_counter() - started
+
+
+def _handle_error(exception_context):
+    # Запрос упал в драйвере: after_cursor_execute не будет вызван
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('metrics_started'):
+        connection.info['metrics_started'].pop()
+
+
+def init_metrics(app):
+    """Подключает сбор метрик к приложению (вызывается из create_app)"""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request(app))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+    if app.config.get('METRICS_DIR'):
+        atexit.register(flush, app, True)
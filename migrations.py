@@ -0,0 +1,223 @@
+"""
+Версионированные миграции схемы БД.
+
+Применённые миграции записываются в таблицу schema_version. migrate()
+(команда flask migrate, скрипт init_db.py) применяет по порядку те из MIGRATIONS,
+которых в ней ещё нет. Приложение при запуске БД не трогает: миграции —
+отдельный шаг развёртывания, выполняемый один раз до запуска воркеров.
+
+Миграция initial_schema создаёт таблицы моделей, а в БД, созданной до появления
+schema_version, досоздаёт недостающие колонки (ALTER TABLE ... ADD COLUMN)
+и индексы. Поэтому новые модели и колонки в свежей БД уже есть к моменту
+следующих миграций: миграции, добавляющие колонки, вызывают ensure_columns(),
+которая добавляет только отсутствующие, а заполнение данных пишется так,
+чтобы повторный запуск ничего не портил.
+"""
+import os
+from flask import current_app
+from sqlalchemy import inspect, select, update, union_all, literal, literal_column, null, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from database import db
+from models import Role, SchemaVersion, VideoRecorderIssue, VideoRecorderReturn
+from operations import check_current_holders, hold_duration
+from stats import rebuild as rebuild_stats
+from search import ensure_search_index
+
+
+def ensure_columns():
+    """
+    Добавляет в существующие таблицы колонки моделей, которых нет в БД.
+    Добавить можно только колонку, допускающую NULL или со значением по
+    умолчанию на стороне БД; для остальных выводится предупреждение.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    print(f"Не удалось добавить колонку {table.name}.{column.name}: NOT NULL без значения по умолчанию")
+                    continue
+                ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+
+
+def ensure_indexes():
+    """
+    Создаёт индексы моделей, отсутствующие в БД (вызывать внутри app context).
+    Уникальный индекс, который противоречит уже имеющимся данным, не создаётся:
+    выводится предупреждение, остальные индексы создаются как обычно.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except IntegrityError as e:
+                print(f"Не удалось создать индекс {index.name}: данные нарушают уникальность ({e.orig})")
+
+
+# Откуда брать updated_at для строк, созданных до появления колонки
+UPDATED_AT_SOURCES = {
+    'employees': 'created_at',
+    'video_recorders': 'created_at',
+    'video_recorder_issues': 'issue_date',
+}
+
+
+def backfill_updated_at():
+    """
+    Заполняет пустые updated_at датой создания записи
+    Поиск пустых значений идёт по индексу (updated_at, id), поэтому на
+    уже заполненной БД это несколько быстрых запросов
+    """
+    with db.engine.begin() as connection:
+        for table, source in UPDATED_AT_SOURCES.items():
+            connection.exec_driver_sql(
+                f'UPDATE {table} SET updated_at = COALESCE({source}, CURRENT_TIMESTAMP) WHERE updated_at IS NULL'
+            )
+
+
+def backfill_return_links():
+    """
+    Связывает возвраты, записанные до появления issue_id, с выдачами и заполняет
+    returned_at/duration выдач. Выдачи и возвраты читаются одним запросом в порядке
+    (дата, выдача раньше возврата, id) и обходятся за один проход: у регистратора
+    одновременно не больше одной активной выдачи, поэтому возврат закрывает последнюю
+    открытую выдачу того же регистратора (если регистратор удалён — того же сотрудника)
+    """
+    issues = select(
+        literal(0).label('kind'), VideoRecorderIssue.id, VideoRecorderIssue.issue_date.label('event_date'),
+        VideoRecorderIssue.video_recorder_id, VideoRecorderIssue.employee_id, VideoRecorderIssue.status
+    ).where(VideoRecorderIssue.returned_at.is_(None))
+    returns = select(
+        literal(1).label('kind'), VideoRecorderReturn.id, VideoRecorderReturn.return_date.label('event_date'),
+        VideoRecorderReturn.video_recorder_id, VideoRecorderReturn.employee_id, null().label('status')
+    ).where(VideoRecorderReturn.issue_id.is_(None))
+    events = union_all(issues, returns).order_by(
+        literal_column('event_date'), literal_column('kind'), literal_column('id')
+    )
+
+    open_issues = {}
+    issue_updates = []
+    return_updates = []
+    for kind, row_id, event_date, video_recorder_id, employee_id, status in db.session.execute(events):
+        if video_recorder_id is not None:
+            key = ('video_recorder', video_recorder_id)
+        elif employee_id is not None:
+            key = ('employee', employee_id)
+        else:
+            continue
+        if kind == 0:
+            open_issues[key] = (row_id, event_date, status)
+            continue
+        opened = open_issues.pop(key, None)
+        if opened is None or opened[2] != 'returned':
+            continue
+        issue_id, issue_date, _ = opened
+        issue_updates.append({
+            'id': issue_id, 'returned_at': event_date, 'duration': hold_duration(issue_date, event_date)
+        })
+        return_updates.append({'id': row_id, 'issue_id': issue_id})
+
+    # ORM-обновление по первичному ключу: один executemany на таблицу
+    if issue_updates:
+        db.session.execute(update(VideoRecorderIssue), issue_updates)
+        db.session.execute(update(VideoRecorderReturn), return_updates)
+    db.session.commit()
+    return len(return_updates)
+
+
+def _initial_schema():
+    """Таблицы моделей, затем недостающие колонки и индексы"""
+    db.create_all()
+    ensure_columns()
+    ensure_indexes()
+
+
+def _current_holders():
+    """Держатели регистраторов (current_issue_id, current_employee_id) по активным выдачам"""
+    check_current_holders(fix=True)
+
+
+def _default_roles():
+    """Роли admin и operator"""
+    existing = set(db.session.scalars(select(Role.name)))
+    for name, description in DEFAULT_ROLES:
+        if name not in existing:
+            db.session.add(Role(name=name, description=description))
+            print(f"Роль создана: {name}")
+    db.session.commit()
+
+
+def _daily_stats_active():
+    """Колонка daily_stats.active и её значения по истории"""
+    ensure_columns()
+    rebuild_stats()
+
+
+def _idempotency_binary_responses():
+    """Сохранённые ответы idempotency_keys.response_body — байты (BLOB), а не текст"""
+    db.session.execute(text(
+        "UPDATE idempotency_keys SET response_body = CAST(response_body AS BLOB) WHERE typeof(response_body) = 'text'"
+    ))
+    db.session.commit()
+
+
+DEFAULT_ROLES = (
+    ('admin', 'Администратор с полными правами'),
+    ('operator', 'Оператор, может выдавать и принимать видеорегистраторы'),
+)
+
+# (версия, имя, функция) по возрастанию версий; новые миграции добавляются в конец
+MIGRATIONS = (
+    (1, 'initial_schema', _initial_schema),
+    (2, 'backfill_updated_at', backfill_updated_at),
+    (3, 'current_holders', _current_holders),
+    (4, 'return_links', backfill_return_links),
+    (5, 'daily_stats', rebuild_stats),
+    (6, 'search_index', ensure_search_index),
+    (7, 'default_roles', _default_roles),
+    (8, 'daily_stats_active', _daily_stats_active),
+    (9, 'idempotency_binary_responses', _idempotency_binary_responses),
+)
+
+
+def applied_versions():
+    """Версии применённых миграций (таблица schema_version создаётся при необходимости)"""
+    SchemaVersion.__table__.create(bind=db.engine, checkfirst=True)
+    return set(db.session.scalars(select(SchemaVersion.version)))
+
+
+def pending_migrations():
+    """Ещё не применённые миграции в порядке применения"""
+    applied = applied_versions()
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def _prepare_directories():
+    os.makedirs(current_app.instance_path, exist_ok=True)
+    os.makedirs(os.path.join(current_app.config['UPLOAD_FOLDER'], 'employee_photos'), exist_ok=True)
+
+
+def migrate():
+    """
+    Применяет недостающие миграции по порядку (вызывать внутри app context)
+    Каждая миграция записывается в schema_version сразу после выполнения: если
+    миграция упала, уже применённые не повторяются при следующем запуске.
+    Возвращает список применённых версий
+    """
+    _prepare_directories()
+    applied = []
+    for version, name, apply in pending_migrations():
+        print(f"Миграция {version}: {name}")
+        apply()
+        db.session.add(SchemaVersion(version=version, name=name))
+        db.session.commit()
+        applied.append(version)
+    return applied
@@ -12,12 +12,20 @@ class Role(db.Model):
 
 class Employee(db.Model):
     __tablename__ = 'employees'
+    # Индексы под сортировки и фильтры списка сотрудников (keyset-пагинация по (поле, id))
+    __table_args__ = (
+        db.Index('ix_employees_full_name_id', 'full_name', 'id'),
+        db.Index('ix_employees_position_id', 'position', 'id'),
+        db.Index('ix_employees_updated_at_id', 'updated_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(200), nullable=False)
     position = db.Column(db.Text)
     employee_number = db.Column(db.String(6), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Время последнего изменения для дельта-синхронизации (GET /api/sync)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     photo = db.relationship('EmployeePhoto', backref='employee', uselist=False, lazy=True, cascade='all, delete-orphan')
     # Не удаляем историю при удалении сотрудника
@@ -31,17 +39,33 @@ class Employee(db.Model):
             'position': self.position,
             'employee_number': self.employee_number,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'photo_url': f'/api/employees/{self.id}/photo' if self.photo else None
+            'photo_url': self.photo.url() if self.photo else None,
+            'photo_thumb_url': self.photo.url('thumb') if self.photo else None
         }
 
 class VideoRecorder(db.Model):
     __tablename__ = 'video_recorders'
+    # Индексы под фильтр по статусу с сортировкой по id или номеру
+    __table_args__ = (
+        db.Index('ix_video_recorders_status_id', 'status', 'id'),
+        db.Index('ix_video_recorders_status_number', 'status', 'number'),
+        db.Index('ix_video_recorders_updated_at_id', 'updated_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.String(100), unique=True, nullable=False)
     status = db.Column(db.String(20), default='available', nullable=False)  # available/issued
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Текущая выдача и у кого регистратор сейчас (NULL — не выдан). Копия данных активной
+    # выдачи, которую обновляют issue_recorder/return_recorder в той же транзакции;
+    # сверка с историей — команда recorders-check. Без внешнего ключа на выдачи:
+    # таблицы ссылались бы друг на друга
+    current_issue_id = db.Column(db.Integer)
+    current_employee_id = db.Column(db.Integer, db.ForeignKey('employees.id', ondelete='SET NULL'))
     
+    # Держатель загружается тем же запросом (LEFT JOIN), to_dict не делает отдельных SELECT
+    current_employee = db.relationship('Employee', foreign_keys=[current_employee_id], lazy='joined')
     # Не удаляем историю при удалении видеорегистратора
     issues = db.relationship('VideoRecorderIssue', backref='video_recorder', lazy=True, passive_deletes=True)
     returns = db.relationship('VideoRecorderReturn', backref='video_recorder', lazy=True, passive_deletes=True)
@@ -51,7 +75,10 @@ class VideoRecorder(db.Model):
             'id': self.id,
             'number': self.number,
             'status': self.status,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'current_issue_id': self.current_issue_id,
+            'current_employee_id': self.current_employee_id,
+            'current_employee_name': self.current_employee.full_name if self.current_employee else None
         }
 
 class User(db.Model):
@@ -86,9 +113,38 @@ class EmployeePhoto(db.Model):
     filename = db.Column(db.String(255), nullable=False)
     mime_type = db.Column(db.String(100), nullable=False)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), unique=True, nullable=False)
+    # SHA-256 содержимого оригинала: ETag фотографии и версия в её URL
+    etag = db.Column(db.String(64))
+    
+    def url(self, size=None):
+        """
+        URL фотографии; с известным etag он содержит версию (?v=...), меняется
+        вместе с содержимым и может кэшироваться клиентом бессрочно
+        """
+        params = []
+        if size:
+            params.append(f'size={size}')
+        if self.etag:
+            params.append(f'v={self.etag}')
+        query = f"?{'&'.join(params)}" if params else ''
+        return f'/api/employees/{self.employee_id}/photo{query}'
 
 class VideoRecorderIssue(db.Model):
     __tablename__ = 'video_recorder_issues'
+    # Индексы под фильтры истории и ленты событий (регистратор/сотрудник + дата)
+    # и под проверку активной выдачи сотрудника
+    __table_args__ = (
+        db.Index('ix_video_recorder_issues_issue_date_id', 'issue_date', 'id'),
+        db.Index('ix_video_recorder_issues_video_recorder_id_issue_date', 'video_recorder_id', 'issue_date'),
+        db.Index('ix_video_recorder_issues_employee_id_issue_date', 'employee_id', 'issue_date'),
+        db.Index('ix_video_recorder_issues_employee_id_status', 'employee_id', 'status'),
+        db.Index('ix_video_recorder_issues_updated_at_id', 'updated_at', 'id'),
+        # Не больше одной активной выдачи на видеорегистратор и на сотрудника
+        db.Index('uq_video_recorder_issues_active_video_recorder', 'video_recorder_id', unique=True,
+                 sqlite_where=db.text("status = 'issued'"), postgresql_where=db.text("status = 'issued'")),
+        db.Index('uq_video_recorder_issues_active_employee', 'employee_id', unique=True,
+                 sqlite_where=db.text("status = 'issued'"), postgresql_where=db.text("status = 'issued'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     # Используем ondelete='SET NULL' чтобы история сохранялась при удалении родительских записей
@@ -97,6 +153,10 @@ class VideoRecorderIssue(db.Model):
     issued_by_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     issue_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     status = db.Column(db.String(20), default='issued', nullable=False)  # issued/returned
+    # Заполняются при возврате: дата возврата и длительность выдачи в секундах
+    returned_at = db.Column(db.DateTime)
+    duration = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def to_dict(self):
         return {
@@ -108,16 +168,26 @@ class VideoRecorderIssue(db.Model):
             'issued_by_user_id': self.issued_by_user_id,
             'issued_by_user_name': f"{self.issued_by_user.first_name} {self.issued_by_user.last_name}" if self.issued_by_user else None,
             'issue_date': self.issue_date.isoformat() if self.issue_date else None,
-            'status': self.status
+            'status': self.status,
+            'returned_at': self.returned_at.isoformat() if self.returned_at else None,
+            'duration': self.duration
         }
 
 class VideoRecorderReturn(db.Model):
     __tablename__ = 'video_recorder_returns'
+    __table_args__ = (
+        db.Index('ix_video_recorder_returns_return_date_id', 'return_date', 'id'),
+        db.Index('ix_video_recorder_returns_video_recorder_id_return_date', 'video_recorder_id', 'return_date'),
+        db.Index('ix_video_recorder_returns_employee_id_return_date', 'employee_id', 'return_date'),
+        db.Index('ix_video_recorder_returns_issue_id', 'issue_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     # Используем ondelete='SET NULL' чтобы история сохранялась при удалении родительских записей
     video_recorder_id = db.Column(db.Integer, db.ForeignKey('video_recorders.id', ondelete='SET NULL'), nullable=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id', ondelete='SET NULL'), nullable=True)
+    # Выдача, которую закрывает этот возврат
+    issue_id = db.Column(db.Integer, db.ForeignKey('video_recorder_issues.id', ondelete='SET NULL'), nullable=True)
     returned_by_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     return_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
@@ -130,5 +200,76 @@ class VideoRecorderReturn(db.Model):
             'employee_name': self.employee.full_name if self.employee else None,
             'returned_by_user_id': self.returned_by_user_id,
             'returned_by_user_name': f"{self.returned_by_user.first_name} {self.returned_by_user.last_name}" if self.returned_by_user else None,
-            'return_date': self.return_date.isoformat() if self.return_date else None
+            'return_date': self.return_date.isoformat() if self.return_date else None,
+            'issue_id': self.issue_id
         }
+
+class SchemaVersion(db.Model):
+    """Применённая миграция схемы БД (см. migrations.py)"""
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class TableVersion(db.Model):
+    """Счётчик изменений таблицы: увеличивается при каждой записи (см. versions.py)"""
+    __tablename__ = 'table_versions'
+    
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+class Tombstone(db.Model):
+    """Запись об удалённой строке: по ним клиенты синхронизации узнают об удалениях"""
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        db.Index('ix_tombstones_deleted_at_id', 'deleted_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class DailyStat(db.Model):
+    """Сводка выдач и возвратов за сутки (UTC), обновляется вместе с ними (см. stats.py)"""
+    __tablename__ = 'daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    issues = db.Column(db.Integer, default=0, nullable=False)
+    returns = db.Column(db.Integer, default=0, nullable=False)
+    # Суммарная длительность выдач, закрытых за день, в секундах
+    hold_seconds = db.Column(db.Integer, default=0, nullable=False)
+    # Наибольшее число одновременно выданных регистраторов
+    peak_active = db.Column(db.Integer, default=0, nullable=False)
+    # Число выданных регистраторов после последней операции за сутки
+    active = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+
+class EmployeeDailyStat(db.Model):
+    """Сводка выдач и возвратов сотрудника за сутки (UTC)"""
+    __tablename__ = 'employee_daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    # Без внешнего ключа: сводка остаётся и после удаления сотрудника
+    employee_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    issues = db.Column(db.Integer, default=0, nullable=False)
+    returns = db.Column(db.Integer, default=0, nullable=False)
+    hold_seconds = db.Column(db.Integer, default=0, nullable=False)
+
+class IdempotencyKey(db.Model):
+    """Сохранённый ответ на запрос с заголовком Idempotency-Key (см. idempotency.py)"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+    
+    # Ключи у каждого пользователя свои: поиск — по первичному ключу (user_id, key)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    key = db.Column(db.String(255), primary_key=True)
+    # Хэш метода, пути и тела запроса: тот же ключ с другим запросом — ошибка клиента
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)  # NULL — запрос ещё выполняется
+    response_body = db.Column(db.LargeBinary)  # байты ответа как есть: JSON или MessagePack
+    mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
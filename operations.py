@@ -0,0 +1,203 @@
+"""
+Выдача и возврат видеорегистраторов: общая логика для одиночных запросов
+и пакетной обработки.
+
+Функции только готовят изменения в текущей сессии; коммит (и обработка
+IntegrityError от частичных уникальных индексов) остаётся за вызывающим кодом.
+"""
+from datetime import datetime
+from sqlalchemy import update
+from database import db
+from models import VideoRecorder, Employee, VideoRecorderIssue, VideoRecorderReturn
+from versions import bump
+from stats import record_issue, record_return
+
+
+class OperationError(Exception):
+    """Операция не может быть выполнена; status — HTTP-код ответа"""
+
+    def __init__(self, message, status=409):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def hold_duration(issue_date, returned_at):
+    """Длительность выдачи в целых секундах"""
+    return int((returned_at - issue_date).total_seconds())
+
+
+def issue_recorder(video_recorder_id, employee_id, user_id):
+    """
+    Выдача: условный UPDATE статуса регистратора и новая запись о выдаче
+    Из двух одновременных выдач одного регистратора строку обновит только первая
+    """
+    result = db.session.execute(
+        update(VideoRecorder)
+        .where(VideoRecorder.id == video_recorder_id, VideoRecorder.status == 'available')
+        .values(status='issued', current_employee_id=employee_id)
+    )
+    if result.rowcount != 1:
+        raise OperationError('Видеорегистратор уже выдан')
+
+    new_issue = VideoRecorderIssue(
+        video_recorder_id=video_recorder_id,
+        employee_id=employee_id,
+        issued_by_user_id=user_id,
+        status='issued'
+    )
+    db.session.add(new_issue)
+    # id выдачи нужен для current_issue_id; регистратор уже заблокирован первым UPDATE
+    db.session.flush()
+    db.session.execute(
+        update(VideoRecorder)
+        .where(VideoRecorder.id == video_recorder_id)
+        .values(current_issue_id=new_issue.id)
+    )
+    record_issue(employee_id, new_issue.issue_date)
+    return new_issue
+
+
+def return_recorder(video_recorder_id, employee_id, user_id):
+    """
+    Возврат: условный UPDATE активной выдачи, статус регистратора и запись о возврате
+    Повторный или одновременный возврат той же выдачи не найдёт строку со статусом 'issued'
+    """
+    active = db.session.execute(
+        db.select(VideoRecorderIssue.id, VideoRecorderIssue.issue_date).where(
+            VideoRecorderIssue.video_recorder_id == video_recorder_id,
+            VideoRecorderIssue.employee_id == employee_id,
+            VideoRecorderIssue.status == 'issued'
+        )
+    ).first()
+    if active is None:
+        raise OperationError('Этот видеорегистратор не был выдан данному сотруднику')
+
+    returned_at = datetime.utcnow()
+    duration = hold_duration(active.issue_date, returned_at)
+    result = db.session.execute(
+        update(VideoRecorderIssue)
+        .where(VideoRecorderIssue.id == active.id, VideoRecorderIssue.status == 'issued')
+        .values(status='returned', returned_at=returned_at, duration=duration)
+    )
+    if result.rowcount != 1:
+        raise OperationError('Этот видеорегистратор не был выдан данному сотруднику')
+
+    db.session.execute(
+        update(VideoRecorder)
+        .where(VideoRecorder.id == video_recorder_id)
+        .values(status='available', current_issue_id=None, current_employee_id=None)
+    )
+
+    new_return = VideoRecorderReturn(
+        video_recorder_id=video_recorder_id,
+        employee_id=employee_id,
+        issue_id=active.id,
+        returned_by_user_id=user_id,
+        return_date=returned_at
+    )
+    db.session.add(new_return)
+    record_return(employee_id, returned_at, duration)
+    return new_return
+
+
+class BatchState:
+    """
+    Снимок состояния, нужного для проверки пакета операций, загруженный
+    тремя запросами на весь пакет: регистраторы, сотрудники и активные выдачи
+    """
+
+    def __init__(self, operations):
+        recorder_ids = {op['video_recorder_id'] for op in operations}
+        employee_ids = {op['employee_id'] for op in operations}
+
+        self.recorder_status = dict(db.session.execute(
+            db.select(VideoRecorder.id, VideoRecorder.status).where(VideoRecorder.id.in_(recorder_ids))
+        ).all())
+        self.employee_ids = set(db.session.scalars(
+            db.select(Employee.id).where(Employee.id.in_(employee_ids))
+        ))
+        self.holder_by_recorder = {}
+        self.recorder_by_employee = {}
+        active = db.session.execute(
+            db.select(VideoRecorderIssue.video_recorder_id, VideoRecorderIssue.employee_id).where(
+                VideoRecorderIssue.status == 'issued',
+                db.or_(
+                    VideoRecorderIssue.video_recorder_id.in_(recorder_ids),
+                    VideoRecorderIssue.employee_id.in_(employee_ids)
+                )
+            )
+        )
+        for recorder_id, employee_id in active:
+            self.holder_by_recorder[recorder_id] = employee_id
+            self.recorder_by_employee[employee_id] = recorder_id
+
+    def check(self, op):
+        """
+        Проверяет операцию против текущего снимка и, если она допустима, применяет её
+        к снимку, чтобы следующие операции пакета видели результат предыдущих
+        """
+        recorder_id, employee_id = op['video_recorder_id'], op['employee_id']
+        if recorder_id not in self.recorder_status:
+            raise OperationError('Видеорегистратор не найден', 404)
+        if employee_id not in self.employee_ids:
+            raise OperationError('Сотрудник не найден', 404)
+
+        if op['operation'] == 'issue':
+            if self.recorder_status[recorder_id] == 'issued' or recorder_id in self.holder_by_recorder:
+                raise OperationError('Видеорегистратор уже выдан')
+            if employee_id in self.recorder_by_employee:
+                raise OperationError('Сотруднику уже выдан видеорегистратор. Сначала оформите возврат.')
+            self.recorder_status[recorder_id] = 'issued'
+            self.holder_by_recorder[recorder_id] = employee_id
+            self.recorder_by_employee[employee_id] = recorder_id
+        else:
+            if self.recorder_status[recorder_id] == 'available':
+                raise OperationError('Видеорегистратор не был выдан')
+            if self.holder_by_recorder.get(recorder_id) != employee_id:
+                raise OperationError('Этот видеорегистратор не был выдан данному сотруднику')
+            self.recorder_status[recorder_id] = 'available'
+            del self.holder_by_recorder[recorder_id]
+            del self.recorder_by_employee[employee_id]
+
+
+def check_current_holders(fix=False):
+    """
+    Сверяет current_issue_id/current_employee_id регистраторов с активными выдачами
+    (два запроса на всю таблицу) и при fix=True исправляет расхождения одним
+    executemany. Возвращает список расхождений:
+    {'video_recorder_id', 'current_issue_id', 'current_employee_id', 'expected_issue_id', 'expected_employee_id'}
+    """
+    expected = {
+        video_recorder_id: (issue_id, employee_id)
+        for video_recorder_id, issue_id, employee_id in db.session.execute(
+            db.select(VideoRecorderIssue.video_recorder_id, VideoRecorderIssue.id, VideoRecorderIssue.employee_id)
+            .where(VideoRecorderIssue.status == 'issued', VideoRecorderIssue.video_recorder_id.isnot(None))
+        )
+    }
+    mismatches = []
+    for video_recorder_id, issue_id, employee_id in db.session.execute(
+        db.select(VideoRecorder.id, VideoRecorder.current_issue_id, VideoRecorder.current_employee_id)
+    ):
+        expected_issue_id, expected_employee_id = expected.get(video_recorder_id, (None, None))
+        if (issue_id, employee_id) != (expected_issue_id, expected_employee_id):
+            mismatches.append({
+                'video_recorder_id': video_recorder_id,
+                'current_issue_id': issue_id,
+                'current_employee_id': employee_id,
+                'expected_issue_id': expected_issue_id,
+                'expected_employee_id': expected_employee_id,
+            })
+
+    if fix and mismatches:
+        db.session.execute(update(VideoRecorder), [
+            {
+                'id': mismatch['video_recorder_id'],
+                'current_issue_id': mismatch['expected_issue_id'],
+                'current_employee_id': mismatch['expected_employee_id'],
+            }
+            for mismatch in mismatches
+        ])
+        bump('video_recorders')
+        db.session.commit()
+    return mismatches
@@ -0,0 +1,93 @@
+"""
+Хэширование и проверка паролей в ограниченном пуле потоков.
+
+Вычисление KDF (scrypt, pbkdf2) занимает процессор на десятки и сотни
+миллисекунд. Если при пересменке одновременно входят сотни пользователей,
+проверки паролей прямо в потоках запросов занимают все ядра, и остальные
+запросы воркера ждут. Поэтому KDF считается в пуле из PASSWORD_HASH_WORKERS
+потоков (hashlib отпускает GIL на время вычисления). В очереди пула ждут не
+больше PASSWORD_HASH_QUEUE задач: сверх этого, как и при ожидании дольше
+PASSWORD_HASH_TIMEOUT секунд, вызывающий код получает PasswordHashBusy
+и отвечает 503 с Retry-After вместо бесконечного роста очереди.
+
+Параметры KDF задаёт PASSWORD_HASH_METHOD (формат werkzeug, например
+scrypt:32768:8:1 или pbkdf2:sha256:600000). Хэш, созданный с другими
+параметрами, пересчитывается при следующем успешном входе (needs_rehash).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Через сколько секунд клиенту повторить вход, если пул занят (заголовок Retry-After)
+RETRY_AFTER_SECONDS = 1
+
+
+class PasswordHashBusy(Exception):
+    """Пул хэширования переполнен или задача ждала дольше PASSWORD_HASH_TIMEOUT"""
+
+
+class HashExecutor:
+    """ThreadPoolExecutor с ограничением числа ожидающих и выполняемых задач"""
+
+    def __init__(self, workers, queue_size):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def run(self, fn, *args, timeout=None):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Место освобождается по завершении задачи, даже если её результат уже никто не ждёт
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Ещё не начатая задача отменяется; начатая досчитается, результат будет отброшен
+            future.cancel()
+            raise PasswordHashBusy()
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _executor():
+    """Пул процесса; создаётся при первом обращении, то есть уже после fork воркера"""
+    config = current_app.config
+    key = (config['PASSWORD_HASH_WORKERS'], config['PASSWORD_HASH_QUEUE'])
+    with _executors_lock:
+        if key not in _executors:
+            _executors[key] = HashExecutor(*key)
+        return _executors[key]
+
+
+def _run(fn, *args):
+    return _executor().run(fn, *args, timeout=current_app.config['PASSWORD_HASH_TIMEOUT'])
+
+
+def hash_password(password):
+    """Хэш пароля с текущими PASSWORD_HASH_METHOD; PasswordHashBusy, если пул занят"""
+    return _run(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def verify_password(password_hash, password):
+    """Проверка пароля по хэшу; PasswordHashBusy, если пул занят"""
+    return _run(check_password_hash, password_hash, password)
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # Полная запись параметров, как её сохраняет werkzeug ('scrypt' -> 'scrypt:32768:8:1');
+    # вычисляется один раз на процесс
+    return generate_password_hash('', method, salt_length=1).partition('$')[0]
+
+
+def needs_rehash(password_hash):
+    """Хэш создан не с текущими PASSWORD_HASH_METHOD"""
+    return password_hash.partition('$')[0] != _method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
@@ -0,0 +1,219 @@
+"""
+Фотографии сотрудников: хранилище файлов и уменьшенные варианты.
+
+Файлы адресуются содержимым: оригинал называется SHA-256 своего содержимого
+и лежит без расширения в подкаталогах по первым символам хэша (ab/cd/abcd...),
+поэтому одинаковые загрузки хранятся один раз, а файл по имени не меняется.
+Загрузка пишется во временный файл и переносится на место атомарным rename.
+Файлы, на которые больше не ссылается ни одна запись, удаляются после коммита
+(release_photo_files), а всё, что осталось после сбоев, — командой photos-gc.
+
+Варианты (thumb, medium) создаются один раз при загрузке: уменьшенное
+изображение, перекодированное в JPEG, лежит рядом с оригиналом под именем
+<имя без расширения>.<вариант>.jpg. Для фотографий, загруженных раньше,
+их создаёт команда flask --app app photos-backfill.
+Для создания вариантов нужен Pillow; без него отдаётся только оригинал.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import update
+from database import db
+from models import Employee, EmployeePhoto
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow необязателен
+    Image = None
+
+# Наибольшая сторона варианта в пикселях; thumb — аватар в списках (64pt на экранах 2x)
+PHOTO_SIZES = {
+    'thumb': 128,
+    'medium': 640,
+}
+PHOTO_VARIANT_MIMETYPE = 'image/jpeg'
+# Ошибки чтения изображения: не изображение, повреждённый файл или «бомба распаковки»
+# (пикселей больше Image.MAX_IMAGE_PIXELS; это исключение Pillow — не OSError)
+IMAGE_ERRORS = (OSError, Image.DecompressionBombError) if Image is not None else (OSError,)
+JPEG_QUALITY = 80
+
+# Сколько секунд файл после загрузки не удаляется ни release_photo_files, ни photos-gc:
+# загрузка того же содержимого могла найти файл и ещё не закоммитить ссылку на него
+PHOTO_GRACE_SECONDS = 3600
+
+# Каталог недописанных загрузок внутри хранилища (тот же диск — rename атомарен)
+PHOTO_TMP_DIR = '.tmp'
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class PhotoTooLarge(ValueError):
+    """Загружаемый файл больше допустимого размера"""
+
+
+def photo_dir():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'employee_photos')
+
+
+def variant_filename(filename, size):
+    return f'{os.path.splitext(filename)[0]}.{size}.jpg'
+
+
+def photo_path(filename, size='full'):
+    """Путь к оригиналу (size='full') или к варианту фотографии"""
+    if size != 'full':
+        filename = variant_filename(filename, size)
+    return os.path.join(photo_dir(), filename)
+
+
+def file_sha256(path):
+    """SHA-256 содержимого файла в hex; файл читается блоками"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_filename(digest):
+    """
+    Имя оригинала в хранилище: <ab>/<cd>/<sha256>
+    Без расширения: одно содержимое — один файл и один набор вариантов,
+    под каким бы именем его ни загрузили; тип файла хранится в записи
+    """
+    return f'{digest[:2]}/{digest[2:4]}/{digest}'
+
+
+def _temp_file(suffix):
+    tmp_dir = os.path.join(photo_dir(), PHOTO_TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tempfile.mkstemp(dir=tmp_dir, suffix=suffix)
+
+
+def store_photo(stream, max_size=None):
+    """
+    Сохраняет фотографию из потока в хранилище
+    Поток копируется блоками во временный файл с подсчётом SHA-256 и переносится
+    на место через os.replace; если такое содержимое уже есть, копия удаляется.
+    Возвращает (filename, sha256, created); PhotoTooLarge, если файл больше max_size байт
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = _temp_file('.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for block in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+                size += len(block)
+                if max_size is not None and size > max_size:
+                    raise PhotoTooLarge(f'Размер фотографии превышает {max_size} байт')
+                digest.update(block)
+                f.write(block)
+            # Данные на диске до rename: после сбоя под итоговым именем не окажется недописанный файл
+            f.flush()
+            os.fsync(f.fileno())
+
+        filename = content_filename(digest.hexdigest())
+        target = photo_path(filename)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+            # Файл снова «свежий»: до коммита этой загрузки его не удалят как ненужный
+            for path in photo_files(filename):
+                if os.path.exists(path):
+                    os.utime(path)
+            return filename, digest.hexdigest(), False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        return filename, digest.hexdigest(), True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def touch_employees(employee_ids):
+    """
+    Отмечает сотрудников изменёнными в текущей транзакции, когда меняется их photo_url
+    (новая фотография, новый etag, удалённая запись): дельта-синхронизация
+    находит изменённых сотрудников по updated_at, а не по employee_photos
+    """
+    if employee_ids:
+        db.session.execute(
+            update(Employee).where(Employee.id.in_(employee_ids)).values(updated_at=datetime.utcnow())
+        )
+
+
+def variant_etag(etag, size):
+    """ETag варианта: варианты однозначно получаются из оригинала, поэтому выводятся из его хэша"""
+    return etag if size == 'full' else f'{etag}-{size}'
+
+
+def generate_variants(filename, force=False):
+    """
+    Создаёт отсутствующие варианты фотографии (все — при force=True)
+    Возвращает список созданных вариантов; пустой, если Pillow не установлен
+    """
+    if Image is None:
+        return []
+
+    source = photo_path(filename)
+    sizes = [size for size in PHOTO_SIZES if force or not os.path.exists(photo_path(filename, size))]
+    if not sizes:
+        return []
+
+    with Image.open(source) as image:
+        # Телефоны пишут поворот в EXIF, а не в пиксели; для GIF берётся первый кадр
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in sizes:
+            variant = image.copy()
+            variant.thumbnail((PHOTO_SIZES[size], PHOTO_SIZES[size]), Image.LANCZOS)
+            # Как и оригинал, вариант появляется под своим именем только целиком
+            fd, tmp_path = _temp_file('.jpg')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    variant.save(f, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                os.replace(tmp_path, photo_path(filename, size))
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+    return sizes
+
+
+def photo_files(filename):
+    """Пути оригинала и всех вариантов фотографии"""
+    return [photo_path(filename, size) for size in ['full', *PHOTO_SIZES]]
+
+
+def remove_photo_files(filename):
+    """Удаляет оригинал и все варианты фотографии"""
+    for path in photo_files(filename):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def release_photo_files(filenames):
+    """
+    Удаляет файлы фотографий, на которые больше не ссылается ни одна запись
+    Вызывается после коммита: если удалить файлы до него, откат оставит запись
+    без файла. Ошибки удаления не мешают ответу — остатки уберёт photos-gc.
+    Файл может быть общим у нескольких сотрудников (одинаковые загрузки), а файлы
+    моложе PHOTO_GRACE_SECONDS пропускаются: на них может сослаться загрузка, ещё
+    не закоммиченная (их уберёт photos-gc, если ссылка так и не появится).
+    """
+    filenames = {filename for filename in filenames if filename}
+    if not filenames:
+        return
+    referenced = set(db.session.scalars(
+        db.select(EmployeePhoto.filename).where(EmployeePhoto.filename.in_(filenames))
+    ))
+    deadline = time.time() - PHOTO_GRACE_SECONDS
+    for filename in filenames - referenced:
+        try:
+            path = photo_path(filename)
+            if os.path.exists(path) and os.path.getmtime(path) > deadline:
+                continue
+            remove_photo_files(filename)
+        except OSError as e:
+            current_app.logger.warning('Не удалось удалить фотографию %s: %s', filename, e)
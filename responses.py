@@ -0,0 +1,114 @@
+"""
+Кодирование и сжатие ответов API.
+
+Тела-словари ответов (jsonify и dict, возвращённый обработчиком) кодирует
+JSON-провайдер приложения ResponseProvider:
+- через orjson, если он установлен (в разы быстрее стандартного json);
+- в MessagePack, если клиент прислал Accept: application/msgpack и установлен msgpack.
+
+compress_response() (after_request) сжимает тело gzip или brotli (если установлен
+пакет brotli), когда клиент это принимает (Accept-Encoding), тело не меньше
+COMPRESS_MIN_SIZE байт, а тип содержимого — JSON, MessagePack или текст.
+Потоковые ответы (SSE, выгрузка истории) и файлы фотографий не сжимаются.
+"""
+import gzip
+from flask import current_app, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack необязателен
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+COMPRESSIBLE_MIMETYPES = {JSON_MIMETYPE, MSGPACK_MIMETYPE, 'text/csv', 'text/plain', 'text/html'}
+
+# Статусы без тела или с частичным телом
+_UNCOMPRESSED_STATUSES = {204, 206, 304}
+
+
+def wants_msgpack():
+    """Клиент предпочитает MessagePack (заголовок Accept), и пакет msgpack установлен"""
+    if msgpack is None or not has_request_context():
+        return False
+    # При Accept: */* или без заголовка выбирается JSON — первый в списке
+    return request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES) in MSGPACK_MIMETYPES
+
+
+class ResponseProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask: orjson вместо json и MessagePack по запросу клиента"""
+
+    # Как у стандартного провайдера: ключи по порядку, даты через default (формат Flask)
+    orjson_options = (
+        (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+    )
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.orjson_options).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if wants_msgpack():
+            response = self._app.response_class(
+                msgpack.packb(obj, default=self.default, use_bin_type=True), mimetype=MSGPACK_MIMETYPE
+            )
+        elif orjson is not None:
+            response = self._app.response_class(
+                orjson.dumps(obj, default=self.default, option=self.orjson_options), mimetype=self.mimetype
+            )
+        else:
+            response = self._app.response_class(self.dumps(obj), mimetype=self.mimetype)
+        if msgpack is not None:
+            response.vary.add('Accept')
+        return response
+
+
+def decode_body(data, mimetype):
+    """Тело ответа, закодированное ResponseProvider, обратно в объект (JSON или MessagePack)"""
+    if mimetype in MSGPACK_MIMETYPES:
+        return msgpack.unpackb(data, raw=False)
+    return current_app.json.loads(data)
+
+
+def _choose_encoding():
+    offered = ('br', 'gzip') if brotli is not None else ('gzip',)
+    return request.accept_encodings.best_match(offered)
+
+
+def compress_response(response):
+    """after_request: сжатие тела ответа по Accept-Encoding (см. описание модуля)"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code in _UNCOMPRESSED_STATUSES or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    # Ответ на тот же URL может быть сжатым или нет в зависимости от заголовка запроса
+    response.vary.add('Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        body = brotli.compress(data, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    else:
+        body = gzip.compress(data, compresslevel=current_app.config['COMPRESS_LEVEL'], mtime=0)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
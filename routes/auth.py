@@ -1,14 +1,27 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import check_password_hash, generate_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
 from models import User, Role
 from database import db
+from routes.utils import role_required, get_current_user as get_cached_user
+from passwords import RETRY_AFTER_SECONDS, PasswordHashBusy, hash_password, verify_password, needs_rehash
 
 auth_bp = Blueprint('auth', __name__)
 
+def _hash_busy():
+    """Пул хэширования паролей перегружен: клиенту повторить запрос позже"""
+    response = jsonify({'error': 'Сервер перегружен, повторите попытку'})
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response, 503
+
 @auth_bp.route('/login', methods=['POST'])
 def login():
-    """UC1: Авторизация пользователя в системе"""
+    """
+    UC1: Авторизация пользователя в системе
+    Пароль проверяется в ограниченном пуле потоков (passwords.py); при перегрузке — 503 с Retry-After.
+    Хэш, созданный с устаревшими параметрами, пересчитывается после успешного входа
+    """
     data = request.get_json()
     
     if not data or not data.get('username') or not data.get('password'):
@@ -17,33 +30,48 @@ def login():
     username = data.get('username')
     password = data.get('password')
     
-    user = User.query.filter_by(username=username).first()
+    user = User.query.options(joinedload(User.role)).filter_by(username=username).first()
     
-    if not user or not check_password_hash(user.password_hash, password):
+    if not user:
         return jsonify({'error': 'Неверный логин или пароль'}), 401
     
-    # Используем user.id как строку для JWT identity
-    access_token = create_access_token(identity=str(user.id))
+    user_id = user.id
+    password_hash = user.password_hash
+    role_name = user.role.name if user.role else None
+    user_data = user.to_dict()
+    # Пока пароль проверяется (возможно, в очереди), соединение с БД не удерживается
+    db.session.close()
+    
+    try:
+        if not verify_password(password_hash, password):
+            return jsonify({'error': 'Неверный логин или пароль'}), 401
+        new_hash = hash_password(password) if needs_rehash(password_hash) else None
+    except PasswordHashBusy:
+        return _hash_busy()
+    
+    if new_hash:
+        # Условие на прежний хэш: пароль, сменённый за это время, не перезаписывается
+        db.session.execute(
+            update(User).where(User.id == user_id, User.password_hash == password_hash).values(password_hash=new_hash)
+        )
+        db.session.commit()
+    
+    # Используем user.id как строку для JWT identity; роль кладём в claims,
+    # чтобы проверка прав в role_required не обращалась к БД
+    access_token = create_access_token(
+        identity=str(user_id),
+        additional_claims={'role': role_name}
+    )
     
     return jsonify({
         'access_token': access_token,
-        'user': user.to_dict()
+        'user': user_data
     }), 200
 
 @auth_bp.route('/register', methods=['POST'])
-@jwt_required()
+@role_required('admin')  # Только администратор может создавать пользователей
 def register():
     """Создание нового пользователя (требуется авторизация)"""
-    try:
-        current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    except (ValueError, TypeError):
-        return jsonify({'error': 'Неверный формат токена'}), 401
-    current_user = User.query.get(current_user_id)
-    
-    # Проверка прав (только администратор может создавать пользователей)
-    if not current_user or (current_user.role.name != 'admin'):
-        return jsonify({'error': 'Недостаточно прав'}), 403
-    
     data = request.get_json()
     
     required_fields = ['username', 'password', 'last_name', 'first_name', 'role_id']
@@ -57,9 +85,14 @@ def register():
     if not role:
         return jsonify({'error': 'Роль не найдена'}), 404
     
+    try:
+        password_hash = hash_password(data['password'])
+    except PasswordHashBusy:
+        return _hash_busy()
+    
     new_user = User(
         username=data['username'],
-        password_hash=generate_password_hash(data['password']),
+        password_hash=password_hash,
         last_name=data['last_name'],
         first_name=data['first_name'],
         middle_name=data.get('middle_name'),
@@ -75,13 +108,9 @@ def register():
 @jwt_required()
 def get_current_user():
     """Получение информации о текущем пользователе"""
-    try:
-        current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    except (ValueError, TypeError):
-        return jsonify({'error': 'Неверный формат токена'}), 401
-    user = User.query.get(current_user_id)
+    user = get_cached_user()
     
     if not user:
         return jsonify({'error': 'Пользователь не найден'}), 404
     
-    return jsonify(user.to_dict()), 200
+    return jsonify(user), 200
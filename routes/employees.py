@@ -1,35 +1,78 @@
 from flask import Blueprint, request, jsonify, send_file, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
-from models import Employee, EmployeePhoto, User, VideoRecorderIssue, VideoRecorderReturn
+from flask_jwt_extended import jwt_required
+from models import Employee, EmployeePhoto, VideoRecorder, VideoRecorderIssue, VideoRecorderReturn
 from database import db
+from routes.utils import (
+    role_required, table_etag, parse_sort_arg, parse_fields_arg, parse_page_args, paginate_query, page_response,
+    import_from_request
+)
+from serializers import EMPLOYEE_FIELDS, fields_load_options, fields_to_dict
+from versions import bump, record_deletion
+from idempotency import idempotent
+from events import publish
+from photos import (
+    PHOTO_SIZES, PHOTO_VARIANT_MIMETYPE, IMAGE_ERRORS, PhotoTooLarge, photo_dir, photo_path, file_sha256,
+    variant_etag, store_photo, generate_variants, remove_photo_files, release_photo_files, touch_employees
+)
 import os
+from datetime import datetime
 
 employees_bp = Blueprint('employees', __name__)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Допустимые поля сортировки списка; id всегда добавляется последним ключом для стабильного порядка
+SORT_FIELDS = {
+    'id': Employee.id,
+    'full_name': Employee.full_name,
+    'employee_number': Employee.employee_number,
+}
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @employees_bp.route('', methods=['GET'])
 @jwt_required()
+@table_etag('employees', 'employee_photos')
 def get_employees():
-    """UC4: Просмотр списка сотрудников"""
-    employees = Employee.query.all()
-    return jsonify([emp.to_dict() for emp in employees]), 200
+    """
+    UC4: Просмотр списка сотрудников
+    Параметры запроса (опционально): position, sort (id, full_name, employee_number; '-' — по убыванию),
+    limit и cursor — постраничная выдача, fields — только перечисленные поля ответа
+    ETag меняется при изменении сотрудников и их фотографий (photo_url); с If-None-Match — 304
+    """
+    try:
+        sort, field, _ = parse_sort_arg(SORT_FIELDS, 'id')
+        page = parse_page_args()
+        fields = parse_fields_arg(EMPLOYEE_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    columns = [SORT_FIELDS[field]] if field == 'id' else [SORT_FIELDS[field], Employee.id]
+    # Только колонки и связи запрошенных полей (без fields — всех полей to_dict())
+    options = fields_load_options(EMPLOYEE_FIELDS, fields or EMPLOYEE_FIELDS, columns)
+    query = Employee.query.options(*options)
+    
+    position = request.args.get('position')
+    if position:
+        query = query.filter(Employee.position == position)
+    
+    try:
+        employees, next_cursor = paginate_query(query, columns, sort, page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if fields:
+        items = [fields_to_dict(EMPLOYEE_FIELDS, emp, fields) for emp in employees]
+    else:
+        items = [emp.to_dict() for emp in employees]
+    return jsonify(page_response(items, next_cursor, page)), 200
 
 @employees_bp.route('', methods=['POST'])
-@jwt_required()
+@role_required('admin')  # Только администратор может добавлять
+@idempotent
 def create_employee():
     """UC4: Добавление сотрудника"""
-    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    current_user = User.query.get(current_user_id)
-    
-    # Проверка прав (только администратор может добавлять)
-    if not current_user or current_user.role.name != 'admin':
-        return jsonify({'error': 'Недостаточно прав'}), 403
-    
     data = request.get_json()
     
     required_fields = ['full_name', 'employee_number']
@@ -46,9 +89,21 @@ def create_employee():
     )
     
     db.session.add(new_employee)
+    bump('employees')
     db.session.commit()
     
-    return jsonify({'message': 'Сотрудник добавлен', 'employee': new_employee.to_dict()}), 201
+    employee = new_employee.to_dict()
+    publish('employee', employee)
+    return jsonify({'message': 'Сотрудник добавлен', 'employee': employee}), 201
+
+@employees_bp.route('/import', methods=['POST'])
+@role_required('admin')  # Только администратор может добавлять
+def import_employees():
+    """
+    UC4: Массовый импорт сотрудников из CSV/XLSX
+    Колонки: full_name, employee_number, position; параметры запроса: mode (insert/upsert), dry_run
+    """
+    return import_from_request('employees')
 
 @employees_bp.route('/<int:employee_id>', methods=['GET'])
 @jwt_required()
@@ -62,16 +117,10 @@ def get_employee(employee_id):
     return jsonify(employee.to_dict()), 200
 
 @employees_bp.route('/<int:employee_id>', methods=['PUT'])
-@jwt_required()
+@role_required('admin')  # Только администратор может редактировать
+@idempotent
 def update_employee(employee_id):
     """UC4: Редактирование сотрудника"""
-    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    current_user = User.query.get(current_user_id)
-    
-    # Проверка прав (только администратор может редактировать)
-    if not current_user or current_user.role.name != 'admin':
-        return jsonify({'error': 'Недостаточно прав'}), 403
-    
     employee = Employee.query.get(employee_id)
     
     if not employee:
@@ -92,60 +141,60 @@ def update_employee(employee_id):
             return jsonify({'error': 'Сотрудник с таким табельным номером уже существует'}), 400
         employee.employee_number = data['employee_number']
     
+    bump('employees')
     db.session.commit()
     
-    return jsonify({'message': 'Сотрудник обновлён', 'employee': employee.to_dict()}), 200
+    employee = employee.to_dict()
+    publish('employee', employee)
+    return jsonify({'message': 'Сотрудник обновлён', 'employee': employee}), 200
+
+def _clear_holder(employee_id):
+    """SQLite не проверяет внешние ключи, поэтому держатель регистратора обнуляется явно"""
+    VideoRecorder.query.filter_by(current_employee_id=employee_id).update({'current_employee_id': None})
 
 @employees_bp.route('/<int:employee_id>', methods=['DELETE'])
-@jwt_required()
+@role_required('admin')  # Только администратор может удалять
+@idempotent
 def delete_employee(employee_id):
     """UC4: Удаление сотрудника"""
-    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    current_user = User.query.get(current_user_id)
-    
-    # Проверка прав (только администратор может удалять)
-    if not current_user or current_user.role.name != 'admin':
-        return jsonify({'error': 'Недостаточно прав'}), 403
-    
     employee = Employee.query.get(employee_id)
     
     if not employee:
         return jsonify({'error': 'Сотрудник не найден'}), 404
     
-    # Удаление фотографии, если есть
-    if employee.photo:
-        photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'employee_photos', employee.photo.filename)
-        if os.path.exists(photo_path):
-            os.remove(photo_path)
-        db.session.delete(employee.photo)
+    # Запись о фотографии удаляется вместе с сотрудником (cascade), файлы — после коммита
+    photo_filename = employee.photo.filename if employee.photo else None
     
     try:
         # Удаляем сотрудника, история выдач/возвратов сохранится
         # (внешние ключи установятся в NULL благодаря ondelete='SET NULL')
+        _clear_holder(employee_id)
         db.session.delete(employee)
+        record_deletion('employees', employee_id)
+        bump('employees', 'employee_photos', 'video_recorder_issues', 'video_recorder_returns')
         db.session.commit()
-        return jsonify({'message': 'Сотрудник удалён'}), 200
+        message = 'Сотрудник удалён'
     except Exception as e:
         db.session.rollback()
         # Если БД не поддерживает SET NULL, обновляем внешние ключи вручную
         from models import VideoRecorderIssue, VideoRecorderReturn
         VideoRecorderIssue.query.filter_by(employee_id=employee_id).update({'employee_id': None})
         VideoRecorderReturn.query.filter_by(employee_id=employee_id).update({'employee_id': None})
+        _clear_holder(employee_id)
         db.session.delete(employee)
+        record_deletion('employees', employee_id)
+        bump('employees', 'employee_photos', 'video_recorder_issues', 'video_recorder_returns')
         db.session.commit()
-        return jsonify({'message': 'Сотрудник удалён, история сохранена'}), 200
+        message = 'Сотрудник удалён, история сохранена'
+    
+    release_photo_files([photo_filename])
+    publish('employee_deleted', {'id': employee_id})
+    return jsonify({'message': message}), 200
 
 @employees_bp.route('/<int:employee_id>/photo', methods=['POST'])
-@jwt_required()
+@role_required('admin')  # Только администратор может загружать фотографии
 def upload_employee_photo(employee_id):
     """Загрузка фотографии сотрудника"""
-    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    current_user = User.query.get(current_user_id)
-    
-    # Проверка прав (только администратор может загружать фотографии)
-    if not current_user or current_user.role.name != 'admin':
-        return jsonify({'error': 'Недостаточно прав'}), 403
-    
     employee = Employee.query.get(employee_id)
     
     if not employee:
@@ -162,41 +211,124 @@ def upload_employee_photo(employee_id):
     if not allowed_file(file.filename):
         return jsonify({'error': 'Недопустимый тип файла'}), 400
     
-    filename = secure_filename(f"employee_{employee_id}_{file.filename}")
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], 'employee_photos', filename)
-    file.save(filepath)
+    try:
+        filename, etag, created = store_photo(file.stream, current_app.config['PHOTO_MAX_SIZE'])
+    except PhotoTooLarge as e:
+        return jsonify({'error': str(e)}), 413
     
-    # Удаление старой фотографии, если есть
+    # Уменьшенные варианты создаются один раз здесь, а не при каждом запросе фотографии;
+    # для уже хранящегося содержимого они обычно уже есть
+    try:
+        generate_variants(filename, force=created)
+    except IMAGE_ERRORS:
+        if created:
+            remove_photo_files(filename)
+        return jsonify({'error': 'Файл не является изображением'}), 400
+    
+    # Старый файл удаляется только после коммита и только если на него никто не ссылается
+    old_filename = None
     if employee.photo:
-        old_filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], 'employee_photos', employee.photo.filename)
-        if os.path.exists(old_filepath):
-            os.remove(old_filepath)
+        if employee.photo.filename != filename:
+            old_filename = employee.photo.filename
         employee.photo.filename = filename
         employee.photo.mime_type = file.content_type
+        employee.photo.etag = etag
     else:
         new_photo = EmployeePhoto(
             filename=filename,
             mime_type=file.content_type,
-            employee_id=employee_id
+            employee_id=employee_id,
+            etag=etag
         )
         db.session.add(new_photo)
     
+    # photo_url содержит версию фотографии: сотрудник попадает в дельта-синхронизацию
+    employee.updated_at = datetime.utcnow()
+    bump('employees', 'employee_photos')
     db.session.commit()
+    release_photo_files([old_filename])
+    publish('employee', employee.to_dict())
     
     return jsonify({'message': 'Фотография загружена'}), 200
 
+def _photo_cache_headers(response, photo, fallback=False):
+    """
+    URL с версией (?v=<etag>) меняется вместе с содержимым, поэтому кэшируется
+    бессрочно; без версии клиент каждый раз перепроверяет фотографию по ETag.
+    Оригинал вместо ещё не созданного варианта (fallback) тоже перепроверяется:
+    иначе клиент не получил бы вариант, созданный позже (photos-backfill)
+    """
+    if photo.etag and request.args.get('v') == photo.etag and not fallback:
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _photo_not_modified(etag, photo, fallback=False):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return _photo_cache_headers(response, photo, fallback)
+
+def _send_photo(path, mimetype, etag):
+    """Отдаёт файл сам или, если настроено, поручает это фронтовому прокси"""
+    if current_app.config.get('PHOTO_SENDFILE') == 'x-accel-redirect':
+        response = current_app.response_class(mimetype=mimetype)
+        prefix = current_app.config['PHOTO_ACCEL_REDIRECT_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f'{prefix}/{os.path.relpath(path, photo_dir())}'
+        response.set_etag(etag)
+        return response
+    # При USE_X_SENDFILE send_file сам ставит заголовок X-Sendfile вместо отдачи тела
+    return send_file(path, mimetype=mimetype, etag=etag, conditional=True)
+
 @employees_bp.route('/<int:employee_id>/photo', methods=['GET'])
 @jwt_required()
 def get_employee_photo(employee_id):
-    """Получение фотографии сотрудника"""
-    employee = Employee.query.get(employee_id)
-    
-    if not employee or not employee.photo:
+    """
+    Получение фотографии сотрудника
+    Параметр запроса size: full (по умолчанию, оригинал), medium или thumb (аватар);
+    v — версия из photo_url, с ней ответ кэшируется бессрочно
+    """
+    size = request.args.get('size', 'full')
+    if size != 'full' and size not in PHOTO_SIZES:
+        return jsonify({'error': 'Недопустимый размер фотографии'}), 400
+    
+    # Один запрос к employee_photos, без загрузки сотрудника
+    photo = EmployeePhoto.query.filter_by(employee_id=employee_id).first()
+    
+    if not photo:
         return jsonify({'error': 'Фотография не найдена'}), 404
     
-    photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'employee_photos', employee.photo.filename)
+    # Фотографии, загруженные до появления etag: хэш считается один раз и сохраняется
+    if not photo.etag:
+        if not os.path.exists(photo_path(photo.filename)):
+            return jsonify({'error': 'Файл фотографии не найден'}), 404
+        photo.etag = file_sha256(photo_path(photo.filename))
+        # photo_url в списке сотрудников и в синхронизации получает версию
+        touch_employees([employee_id])
+        bump('employees', 'employee_photos')
+        db.session.commit()
     
-    if not os.path.exists(photo_path):
+    # ETag запрошенного варианта выводится из строки БД: клиент с этой версией
+    # получает 304 без обращения к файлам
+    etag = variant_etag(photo.etag, size)
+    if request.if_none_match.contains_weak(etag):
+        return _photo_not_modified(etag, photo)
+    
+    # Если вариант ещё не создан (например, нет Pillow), отдаётся оригинал со своим ETag:
+    # когда вариант появится, ETag сменится и клиент получит вариант при перепроверке
+    path, mimetype = photo_path(photo.filename), photo.mime_type
+    fallback = False
+    if size != 'full':
+        variant_path = photo_path(photo.filename, size)
+        if os.path.exists(variant_path):
+            path, mimetype = variant_path, PHOTO_VARIANT_MIMETYPE
+        else:
+            # Перепроверка оригинала, отданного раньше вместо варианта
+            etag, fallback = photo.etag, True
+            if request.if_none_match.contains_weak(etag):
+                return _photo_not_modified(etag, photo, fallback)
+    
+    if not os.path.exists(path):
         return jsonify({'error': 'Файл фотографии не найден'}), 404
     
-    return send_file(photo_path, mimetype=employee.photo.mime_type)
+    return _photo_cache_headers(_send_photo(path, mimetype, etag), photo, fallback)
@@ -0,0 +1,62 @@
+import time
+from flask import Blueprint, request, current_app
+from flask_jwt_extended import jwt_required
+from events import broker, format_event, RECONNECT_MS
+
+events_bp = Blueprint('events', __name__)
+
+def _stream(seq, reset, heartbeat, duration):
+    """
+    Генератор потока SSE. БД не используется: соединение с клиентом не держит
+    соединение из пула, а ожидание событий — это ожидание условия в памяти
+    """
+    yield f'retry: {RECONNECT_MS}\n\n'
+    if reset:
+        # Пропущенных событий уже нет в буфере: клиенту нужно перечитать данные
+        yield format_event(broker.event_id(seq), 'reset', {})
+
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        events = broker.wait(seq, heartbeat)
+        if events is None:
+            # Клиент отстал больше чем на размер буфера, пока ждал отправки
+            seq = broker.last_seq
+            yield format_event(broker.event_id(seq), 'reset', {})
+        elif events:
+            for event_seq, event_type, data in events:
+                yield format_event(broker.event_id(event_seq), event_type, data)
+            seq = events[-1][0]
+        else:
+            # Комментарий SSE: держит соединение открытым через прокси
+            yield ': keepalive\n\n'
+    # Соединение закрывается периодически, клиент переподключится с Last-Event-ID
+
+@events_bp.route('', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def get_events():
+    """
+    Поток изменений в формате Server-Sent Events
+    Токен — в заголовке Authorization или в параметре jwt (браузерный EventSource
+    не умеет передавать заголовки). Заголовок Last-Event-ID (или параметр last_event_id)
+    продолжает поток с пропущенных событий.
+    События: video_recorder, video_recorder_deleted, employee, employee_deleted, issue,
+    return, reload (массовое изменение таблицы) и reset (перечитайте данные целиком)
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    seq = broker.last_seq
+    reset = False
+    if last_event_id:
+        resume_seq = broker.parse_event_id(last_event_id)
+        if resume_seq is not None and broker.since(resume_seq) is not None:
+            seq = resume_seq
+        else:
+            reset = True
+
+    response = current_app.response_class(
+        _stream(seq, reset, current_app.config['EVENTS_HEARTBEAT_SECONDS'], current_app.config['EVENTS_STREAM_SECONDS']),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,137 +1,480 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import VideoRecorderIssue, VideoRecorderReturn, VideoRecorder, Employee, User
 from database import db
+from sqlalchemy.exc import IntegrityError
+from operations import OperationError, BatchState, issue_recorder, return_recorder
+from versions import bump
+from events import publish
+from responses import decode_body
+from idempotency import (
+    MAX_KEY_LENGTH, idempotent, endpoint_path, request_hash, find_keys, claim, complete, release
+)
+import csv
+import io
+import json
+from serializers import (
+    ISSUE_EVENT, RETURN_EVENT, issues_select, returns_select, timeline_select,
+    issue_row_to_dict, return_row_to_dict, event_row_to_dict, event_row_to_record
+)
+from routes.utils import (
+    DEFAULT_PAGE_LIMIT, parse_sort_arg, parse_datetime_arg, parse_page_args,
+    encode_cursor, cursor_values, keyset_order
+)
 
 issues_bp = Blueprint('issues', __name__)
 
-@issues_bp.route('/issue', methods=['POST'])
-@jwt_required()
-def issue_video_recorder():
-    """UC5: Инициализация выдачи видеорегистратора сотруднику"""
-    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    
-    data = request.get_json()
-    
+# Ограничение размера пакета и число попыток, если данные изменились между проверкой и записью
+BATCH_MAX_OPERATIONS = 500
+BATCH_ATTEMPTS = 3
+
+# Сколько строк выгрузки читается из курсора БД и отправляется клиенту за раз
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_CSV_FIELDS = [
+    'type', 'id', 'date', 'video_recorder_id', 'video_recorder_number',
+    'employee_id', 'employee_name', 'user_id', 'user_name', 'status', 'issue_id', 'duration'
+]
+
+def _issue(data, user_id):
+    """Выдача по телу запроса /issue; возвращает (тело ответа, статус)"""
     required_fields = ['video_recorder_id', 'employee_id']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Отсутствуют обязательные поля'}), 400
+    if not isinstance(data, dict) or not all(field in data for field in required_fields):
+        return {'error': 'Отсутствуют обязательные поля'}, 400
     
     video_recorder = VideoRecorder.query.get(data['video_recorder_id'])
     if not video_recorder:
-        return jsonify({'error': 'Видеорегистратор не найден'}), 404
-    
-    if video_recorder.status == 'issued':
-        return jsonify({'error': 'Видеорегистратор уже выдан'}), 400
+        return {'error': 'Видеорегистратор не найден'}, 404
     
     employee = Employee.query.get(data['employee_id'])
     if not employee:
-        return jsonify({'error': 'Сотрудник не найден'}), 404
-
-    # Ограничение: одному сотруднику может быть выдан только один видеорегистратор одновременно
-    existing_active_issue_for_employee = VideoRecorderIssue.query.filter_by(
-        employee_id=data['employee_id'],
-        status='issued'
-    ).first()
-    if existing_active_issue_for_employee:
-        return jsonify({
+        return {'error': 'Сотрудник не найден'}, 404
+    
+    # Ограничение: одному сотруднику может быть выдан только один видеорегистратор одновременно.
+    # Его гарантирует частичный уникальный индекс по активным выдачам, а не проверка в Python
+    try:
+        new_issue = issue_recorder(video_recorder.id, employee.id, user_id)
+        bump('video_recorders', 'video_recorder_issues')
+        db.session.commit()
+    except OperationError as e:
+        db.session.rollback()
+        return {'error': e.message}, e.status
+    except IntegrityError:
+        db.session.rollback()
+        active_issue = VideoRecorderIssue.query.filter_by(employee_id=employee.id, status='issued').first()
+        if not active_issue:
+            return {'error': 'Видеорегистратор уже выдан'}, 409
+        return {
             'error': 'Сотруднику уже выдан видеорегистратор. Сначала оформите возврат.',
-            'active_issue': existing_active_issue_for_employee.to_dict()
-        }), 400
-    
-    new_issue = VideoRecorderIssue(
-        video_recorder_id=data['video_recorder_id'],
-        employee_id=data['employee_id'],
-        issued_by_user_id=current_user_id,
-        status='issued'
-    )
+            'active_issue': active_issue.to_dict()
+        }, 409
+    
+    issue = new_issue.to_dict()
+    publish('issue', issue)
+    publish('video_recorder', video_recorder.to_dict())
+    return {'message': 'Видеорегистратор выдан', 'issue': issue}, 201
+
+def _return(data, user_id):
+    """Возврат по телу запроса /return; возвращает (тело ответа, статус)"""
+    required_fields = ['video_recorder_id', 'employee_id']
+    if not isinstance(data, dict) or not all(field in data for field in required_fields):
+        return {'error': 'Отсутствуют обязательные поля'}, 400
+    
+    video_recorder = VideoRecorder.query.get(data['video_recorder_id'])
+    if not video_recorder:
+        return {'error': 'Видеорегистратор не найден'}, 404
     
-    video_recorder.status = 'issued'
+    employee = Employee.query.get(data['employee_id'])
+    if not employee:
+        return {'error': 'Сотрудник не найден'}, 404
     
-    db.session.add(new_issue)
-    db.session.commit()
+    try:
+        new_return = return_recorder(video_recorder.id, employee.id, user_id)
+        bump('video_recorders', 'video_recorder_issues', 'video_recorder_returns')
+        db.session.commit()
+    except OperationError as e:
+        db.session.rollback()
+        if video_recorder.status == 'available':
+            return {'error': 'Видеорегистратор не был выдан'}, 409
+        return {'error': e.message}, e.status
     
-    return jsonify({'message': 'Видеорегистратор выдан', 'issue': new_issue.to_dict()}), 201
+    returned = new_return.to_dict()
+    publish('return', returned)
+    publish('video_recorder', video_recorder.to_dict())
+    return {'message': 'Видеорегистратор возвращён', 'return': returned}, 201
+
+@issues_bp.route('/issue', methods=['POST'])
+@jwt_required()
+@idempotent
+def issue_video_recorder():
+    """UC5: Инициализация выдачи видеорегистратора сотруднику"""
+    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
+    body, status = _issue(request.get_json(), current_user_id)
+    return jsonify(body), status
 
 @issues_bp.route('/return', methods=['POST'])
 @jwt_required()
+@idempotent
 def return_video_recorder():
     """UC6: Инициализация возврата видеорегистратора"""
     current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
+    body, status = _return(request.get_json(), current_user_id)
+    return jsonify(body), status
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _apply_batch(operations, user_id):
+    """
+    Одна попытка применить пакет: проверка по снимку BatchState, затем все
+    допустимые операции по порядку в одной транзакции и один коммит.
+    Возвращает {index: результат} или None, если данные изменились между
+    проверкой и записью (другой оператор успел раньше) — тогда попытку надо повторить.
+    """
+    state = BatchState([op for _, op in operations])
+    results = {}
+    accepted = []
+    for index, op in operations:
+        try:
+            state.check(op)
+        except OperationError as e:
+            results[index] = {'index': index, 'operation': op['operation'], 'status': e.status, 'error': e.message}
+        else:
+            accepted.append((index, op))
+    
+    created = []
+    try:
+        for index, op in accepted:
+            apply = issue_recorder if op['operation'] == 'issue' else return_recorder
+            created.append((index, op['operation'], apply(op['video_recorder_id'], op['employee_id'], user_id)))
+        if created:
+            bump('video_recorders', 'video_recorder_issues', 'video_recorder_returns')
+        db.session.flush()
+        # id запоминаются до коммита: после него объекты истекают и каждое обращение стало бы SELECT
+        created = [(index, kind, obj.id) for index, kind, obj in created]
+        db.session.commit()
+    except (OperationError, IntegrityError):
+        db.session.rollback()
+        return None
+    
+    # Ответ собирается двумя запросами с JOIN, а не to_dict() с ленивыми загрузками на каждую запись
+    issue_ids = [obj_id for _, kind, obj_id in created if kind == 'issue']
+    return_ids = [obj_id for _, kind, obj_id in created if kind == 'return']
+    issues = {row.id: issue_row_to_dict(row) for row in db.session.execute(
+        issues_select().where(VideoRecorderIssue.id.in_(issue_ids)))} if issue_ids else {}
+    returns = {row.id: return_row_to_dict(row) for row in db.session.execute(
+        returns_select().where(VideoRecorderReturn.id.in_(return_ids)))} if return_ids else {}
+    for index, kind, obj_id in created:
+        results[index] = {
+            'index': index,
+            'operation': kind,
+            'status': 201,
+            kind: issues[obj_id] if kind == 'issue' else returns[obj_id]
+        }
+    
+    # События — в порядке операций, затем итоговое состояние затронутых регистраторов
+    for index, kind, obj_id in sorted(created):
+        publish(kind, results[index][kind])
+    recorder_ids = {op['video_recorder_id'] for _, op in accepted}
+    for video_recorder in VideoRecorder.query.filter(VideoRecorder.id.in_(recorder_ids)):
+        publish('video_recorder', video_recorder.to_dict())
+    return results
+
+@issues_bp.route('/batch', methods=['POST'])
+@jwt_required()
+@idempotent
+def batch_operations():
+    """
+    UC5/UC6: Пакетная выдача и возврат (пересменка)
+    Все операции проверяются несколькими запросами на весь пакет и применяются
+    по порядку в одной транзакции; в ответе — результат по каждой операции
+    """
+    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
     
     data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
     
-    required_fields = ['video_recorder_id', 'employee_id']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Отсутствуют обязательные поля'}), 400
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Требуется список операций'}), 400
     
-    video_recorder = VideoRecorder.query.get(data['video_recorder_id'])
-    if not video_recorder:
-        return jsonify({'error': 'Видеорегистратор не найден'}), 404
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'error': f'Не больше {BATCH_MAX_OPERATIONS} операций в одном пакете'}), 400
     
-    if video_recorder.status == 'available':
-        return jsonify({'error': 'Видеорегистратор не был выдан'}), 400
+    results = {}
+    valid = []
+    for index, op in enumerate(operations):
+        if (not isinstance(op, dict) or op.get('operation') not in ('issue', 'return')
+                or not _is_id(op.get('video_recorder_id')) or not _is_id(op.get('employee_id'))):
+            results[index] = {
+                'index': index,
+                'status': 400,
+                'error': 'Операция должна содержать operation (issue или return), video_recorder_id и employee_id'
+            }
+        else:
+            valid.append((index, op))
     
-    employee = Employee.query.get(data['employee_id'])
-    if not employee:
-        return jsonify({'error': 'Сотрудник не найден'}), 404
-    
-    # Проверка, что видеорегистратор был выдан этому сотруднику
-    active_issue = VideoRecorderIssue.query.filter_by(
-        video_recorder_id=data['video_recorder_id'],
-        employee_id=data['employee_id'],
-        status='issued'
-    ).first()
-    
-    if not active_issue:
-        return jsonify({'error': 'Этот видеорегистратор не был выдан данному сотруднику'}), 400
-    
-    # Создание записи о возврате
-    new_return = VideoRecorderReturn(
-        video_recorder_id=data['video_recorder_id'],
-        employee_id=data['employee_id'],
-        returned_by_user_id=current_user_id
-    )
+    if valid:
+        for _ in range(BATCH_ATTEMPTS):
+            applied = _apply_batch(valid, current_user_id)
+            if applied is not None:
+                results.update(applied)
+                break
+        else:
+            return jsonify({'error': 'Данные изменились во время обработки пакета, повторите запрос'}), 409
     
-    # Обновление статуса видеорегистратора и записи о выдаче
-    video_recorder.status = 'available'
-    active_issue.status = 'returned'
+    results = [results[index] for index in range(len(operations))]
+    succeeded = sum(1 for result in results if result['status'] == 201)
+    return jsonify({
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded
+    }), 200
+
+# Операции очереди и соответствующие им одиночные эндпоинты
+REPLAY_OPERATIONS = {
+    'issue': ('issues.issue_video_recorder', _issue),
+    'return': ('issues.return_video_recorder', _return),
+}
+
+@issues_bp.route('/replay', methods=['POST'])
+@jwt_required()
+def replay_operations():
+    """
+    UC5/UC6: Воспроизведение очереди офлайн-операций одним запросом
+    Тело: {"operations": [{"idempotency_key", "operation" (issue/return), "video_recorder_id", "employee_id"}, ...]}
+    Операции выполняются строго по порядку, каждая — как запрос /issue или /return со своим
+    Idempotency-Key: уже выполненные (в том числе отправленные раньше напрямую) не повторяются,
+    а возвращают сохранённый ответ. Ключи всей очереди ищутся одним запросом.
+    """
+    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
     
-    db.session.add(new_return)
-    db.session.commit()
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
     
-    return jsonify({'message': 'Видеорегистратор возвращён', 'return': new_return.to_dict()}), 201
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Требуется список операций'}), 400
+    
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'error': f'Не больше {BATCH_MAX_OPERATIONS} операций в одном запросе'}), 400
+    
+    keys = []
+    for op in operations:
+        key = op.get('idempotency_key') if isinstance(op, dict) else None
+        if (not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH
+                or op.get('operation') not in REPLAY_OPERATIONS):
+            return jsonify({'error': 'Каждая операция должна содержать idempotency_key и operation (issue или return)'}), 400
+        keys.append(key)
+    
+    if len(set(keys)) != len(keys):
+        return jsonify({'error': 'Ключи идемпотентности в очереди повторяются'}), 400
+    
+    stored = find_keys(current_user_id, keys)
+    results = []
+    for index, op in enumerate(operations):
+        key = op['idempotency_key']
+        endpoint, apply = REPLAY_OPERATIONS[op['operation']]
+        body = {field: value for field, value in op.items() if field not in ('operation', 'idempotency_key')}
+        # Отпечаток тот же, что у одиночного запроса с этим телом
+        fingerprint = request_hash('POST', endpoint_path(endpoint), body)
+        
+        result = claim(current_user_id, key, fingerprint, stored.get(key))
+        if result is not None:
+            response, status, mimetype = result
+            replayed = mimetype is not None
+            if replayed:
+                # Ответ одиночного запроса мог быть сохранён в MessagePack (Accept клиента)
+                response = decode_body(response, mimetype)
+        else:
+            try:
+                response, status = apply(body, current_user_id)
+            except Exception:
+                db.session.rollback()
+                release(current_user_id, key)
+                raise
+            complete(current_user_id, key, current_app.json.dumps(response).encode('utf-8'), status)
+            replayed = False
+        
+        results.append({
+            'index': index,
+            'idempotency_key': key,
+            'operation': op['operation'],
+            'status': status,
+            'replayed': replayed,
+            'response': response
+        })
+    
+    return jsonify({'results': results}), 200
+
+def _parse_history_args():
+    """Общие фильтры истории и ленты событий; ValueError при неверных значениях"""
+    sort, _, descending = parse_sort_arg({'date'}, 'date')
+    return {
+        'video_recorder_id': request.args.get('video_recorder_id', type=int),
+        'employee_id': request.args.get('employee_id', type=int),
+        'date_from': parse_datetime_arg('date_from'),
+        'date_to': parse_datetime_arg('date_to'),
+    }, sort, descending
+
+def _timeline_page(filters, sort, descending, page):
+    """
+    Страница общей ленты событий из timeline_select()
+    Возвращает (rows, next_cursor); ValueError, если курсор не подходит к запросу
+    """
+    limit, cursor = page
+    after = None
+    if cursor is not None:
+        if cursor.get('sort') != sort:
+            raise ValueError('Курсор не соответствует сортировке')
+        after = cursor_values([VideoRecorderIssue.issue_date, None, None], cursor.get('after'))
+    
+    rows = db.session.execute(timeline_select(after=after, descending=descending, limit=limit + 1, **filters)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor({'sort': sort, 'after': [last.event_date, last.kind, last.id]})
 
 @issues_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_history():
-    """UC7: Просмотр истории выдачи и возврата видеорегистраторов"""
-    video_recorder_id = request.args.get('video_recorder_id', type=int)
-    employee_id = request.args.get('employee_id', type=int)
+    """
+    UC7: Просмотр истории выдачи и возврата видеорегистраторов
+    Параметры запроса (опционально): video_recorder_id, employee_id, date_from, date_to,
+    sort (date или -date), limit и cursor — постраничная выдача по времени события
+    """
+    try:
+        filters, sort, descending = _parse_history_args()
+        page = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    issues = VideoRecorderIssue.query
-    returns = VideoRecorderReturn.query
+    if page is not None:
+        # Страница общей ленты одним запросом, разложенная обратно на выдачи и возвраты
+        try:
+            rows, next_cursor = _timeline_page(filters, sort, descending, page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'issues': [event_row_to_record(row) for row in rows if row.kind == ISSUE_EVENT],
+            'returns': [event_row_to_record(row) for row in rows if row.kind == RETURN_EVENT],
+            'next_cursor': next_cursor,
+            'limit': page[0]
+        }), 200
+    
+    issues = issues_select()
+    returns = returns_select()
     
     # Используем явную проверку на None, чтобы корректно обрабатывать id = 0
-    if video_recorder_id is not None:
-        issues = issues.filter_by(video_recorder_id=video_recorder_id)
-        returns = returns.filter_by(video_recorder_id=video_recorder_id)
+    if filters['video_recorder_id'] is not None:
+        issues = issues.where(VideoRecorderIssue.video_recorder_id == filters['video_recorder_id'])
+        returns = returns.where(VideoRecorderReturn.video_recorder_id == filters['video_recorder_id'])
+    
+    if filters['employee_id'] is not None:
+        issues = issues.where(VideoRecorderIssue.employee_id == filters['employee_id'])
+        returns = returns.where(VideoRecorderReturn.employee_id == filters['employee_id'])
+    
+    if filters['date_from'] is not None:
+        issues = issues.where(VideoRecorderIssue.issue_date >= filters['date_from'])
+        returns = returns.where(VideoRecorderReturn.return_date >= filters['date_from'])
     
-    if employee_id is not None:
-        issues = issues.filter_by(employee_id=employee_id)
-        returns = returns.filter_by(employee_id=employee_id)
+    if filters['date_to'] is not None:
+        issues = issues.where(VideoRecorderIssue.issue_date <= filters['date_to'])
+        returns = returns.where(VideoRecorderReturn.return_date <= filters['date_to'])
     
-    issues_list = [issue.to_dict() for issue in issues.all()]
-    returns_list = [ret.to_dict() for ret in returns.all()]
+    # Один запрос на таблицу: связи подтягиваются JOIN'ом, а не ленивой загрузкой на каждую строку
+    issues = issues.order_by(*keyset_order([VideoRecorderIssue.issue_date, VideoRecorderIssue.id], descending))
+    returns = returns.order_by(*keyset_order([VideoRecorderReturn.return_date, VideoRecorderReturn.id], descending))
     
     return jsonify({
-        'issues': issues_list,
-        'returns': returns_list
+        'issues': [issue_row_to_dict(row) for row in db.session.execute(issues)],
+        'returns': [return_row_to_dict(row) for row in db.session.execute(returns)]
     }), 200
 
+@issues_bp.route('/timeline', methods=['GET'])
+@jwt_required()
+def get_timeline():
+    """
+    UC7: Общая лента выдач и возвратов в хронологическом порядке
+    Параметры запроса (опционально): video_recorder_id, employee_id, date_from, date_to,
+    sort (date или -date), limit, cursor
+    """
+    try:
+        filters, sort, descending = _parse_history_args()
+        page = parse_page_args()
+        rows, next_cursor = _timeline_page(filters, sort, descending, page or (DEFAULT_PAGE_LIMIT, None))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'events': [event_row_to_dict(row) for row in rows],
+        'next_cursor': next_cursor,
+        'limit': page[0] if page else DEFAULT_PAGE_LIMIT
+    }), 200
+
+@issues_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_history():
+    """
+    UC7: Выгрузка полной истории выдач и возвратов потоком
+    Параметры запроса (опционально): format (ndjson — по умолчанию, или csv),
+    video_recorder_id, employee_id, date_from, date_to, sort (date или -date)
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_MIMETYPES:
+        return jsonify({'error': 'Недопустимый формат выгрузки'}), 400
+    
+    try:
+        filters, sort, descending = _parse_history_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # yield_per: строки читаются из курсора БД порциями, а не загружаются целиком
+    query = timeline_select(descending=descending, **filters).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    
+    def generate():
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_FIELDS)
+            # BOM, чтобы Excel открыл UTF-8 с кириллицей без ручного выбора кодировки
+            buffer.write('\ufeff')
+            writer.writeheader()
+            yield buffer.getvalue()
+        
+        result = db.session.execute(query)
+        for rows in result.partitions():
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_FIELDS)
+                writer.writerows(event_row_to_dict(row) for row in rows)
+                yield buffer.getvalue()
+            else:
+                yield ''.join(json.dumps(event_row_to_dict(row), ensure_ascii=False) + '\n' for row in rows)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename=history.{export_format}'}
+    )
+
+@issues_bp.route('/<int:issue_id>', methods=['GET'])
+@jwt_required()
+def get_issue(issue_id):
+    """Выдача и закрывший её возврат (поиск по индексу issue_id возвратов)"""
+    row = db.session.execute(issues_select().where(VideoRecorderIssue.id == issue_id)).first()
+    if row is None:
+        return jsonify({'error': 'Выдача не найдена'}), 404
+    
+    returned = db.session.execute(returns_select().where(VideoRecorderReturn.issue_id == issue_id)).first()
+    issue = issue_row_to_dict(row)
+    issue['return'] = return_row_to_dict(returned) if returned else None
+    return jsonify(issue), 200
+
 @issues_bp.route('/active', methods=['GET'])
 @jwt_required()
 def get_active_issues():
     """Получение списка активных выдач (видеорегистраторы, которые сейчас выданы)"""
-    active_issues = VideoRecorderIssue.query.filter_by(status='issued').all()
-    return jsonify([issue.to_dict() for issue in active_issues]), 200
+    active_issues = issues_select().where(VideoRecorderIssue.status == 'issued').order_by(VideoRecorderIssue.id)
+    return jsonify([issue_row_to_dict(row) for row in db.session.execute(active_issues)]), 200
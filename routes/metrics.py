@@ -0,0 +1,35 @@
+import hmac
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from metrics import collect, render
+from routes.utils import get_current_role
+
+metrics_bp = Blueprint('metrics', __name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _authorized():
+    """Токен METRICS_TOKEN (для Prometheus) или JWT администратора"""
+    token = current_app.config['METRICS_TOKEN']
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    try:
+        verify_jwt_in_request()
+    except (JWTExtendedException, PyJWTError):
+        return False
+    return get_current_role() == 'admin'
+
+@metrics_bp.route('', methods=['GET'])
+def get_metrics():
+    """
+    Метрики всех процессов сервера в текстовом формате Prometheus
+    Доступ: заголовок Authorization: Bearer <METRICS_TOKEN> или JWT администратора
+    """
+    if not current_app.config.get('METRICS_ENABLED'):
+        return jsonify({'error': 'Метрики отключены'}), 404
+    if not _authorized():
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    return current_app.response_class(render(collect(current_app)), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,46 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import selectinload
+from models import Employee, VideoRecorder
+from database import db
+from search import search_tokens, search_select
+
+search_bp = Blueprint('search', __name__)
+
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+SEARCH_TYPES = ('employees', 'video_recorders')
+
+@search_bp.route('', methods=['GET'])
+@jwt_required()
+def search():
+    """
+    Быстрый поиск (подсказки при наборе) сотрудников и видеорегистраторов
+    Параметры запроса: q — начало слов ФИО, табельного номера, должности или номера
+    регистратора; type (employees или video_recorders, по умолчанию оба); limit (до 50).
+    Ответ: {'employees': [...], 'video_recorders': [...]}, лучшие совпадения первыми
+    """
+    try:
+        limit = min(int(request.args.get('limit', SEARCH_DEFAULT_LIMIT)), SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'Неверное значение limit'}), 400
+    if limit < 1:
+        return jsonify({'error': 'Неверное значение limit'}), 400
+    
+    search_type = request.args.get('type')
+    if search_type and search_type not in SEARCH_TYPES:
+        return jsonify({'error': 'Недопустимый тип поиска'}), 400
+    types = [search_type] if search_type else SEARCH_TYPES
+    
+    tokens = search_tokens(request.args.get('q'))
+    response = {name: [] for name in types}
+    if not tokens:
+        return jsonify(response), 200
+    
+    if 'employees' in types:
+        query = search_select(Employee, 'employees_fts', tokens, limit).options(selectinload(Employee.photo))
+        response['employees'] = [employee.to_dict() for employee in db.session.scalars(query)]
+    if 'video_recorders' in types:
+        query = search_select(VideoRecorder, 'video_recorders_fts', tokens, limit)
+        response['video_recorders'] = [video_recorder.to_dict() for video_recorder in db.session.scalars(query)]
+    return jsonify(response), 200
@@ -0,0 +1,96 @@
+from datetime import date, datetime, timedelta
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy import select, func
+from models import DailyStat, EmployeeDailyStat, Employee
+from database import db
+from routes.utils import table_etag
+
+stats_bp = Blueprint('stats', __name__)
+
+# Период по умолчанию — последние STATS_DEFAULT_DAYS суток
+STATS_DEFAULT_DAYS = 30
+
+def _parse_date_arg(name, default):
+    """Дата YYYY-MM-DD из query string; ValueError при неверном формате"""
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Неверный формат даты в параметре {name}')
+
+def _default_period():
+    """Период без date_to отсчитывается от текущих суток (UTC): они входят в ETag ответа"""
+    return '' if request.args.get('date_to') else datetime.utcnow().date().isoformat()
+
+def _average(total, count):
+    return round(total / count) if count else None
+
+@stats_bp.route('', methods=['GET'])
+@jwt_required()
+@table_etag('video_recorder_issues', 'video_recorder_returns', 'employees', 'daily_stats', vary=_default_period)
+def get_stats():
+    """
+    Статистика использования видеорегистраторов по суточным сводкам
+    Параметры запроса (опционально): date_from, date_to (YYYY-MM-DD, сутки по UTC;
+    по умолчанию — последние 30 суток).
+    Ответ: по дням — выдачи, возвраты, средняя длительность выдачи (секунды)
+    и пик одновременно выданных регистраторов; итоги за период; по сотрудникам — то же
+    без пика. Два запроса к сводкам, история выдач не читается
+    """
+    today = datetime.utcnow().date()
+    try:
+        date_to = _parse_date_arg('date_to', today)
+        date_from = _parse_date_arg('date_from', date_to - timedelta(days=STATS_DEFAULT_DAYS - 1))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if date_from > date_to:
+        return jsonify({'error': 'date_from не может быть позже date_to'}), 400
+    
+    days = db.session.scalars(
+        select(DailyStat).where(DailyStat.day.between(date_from, date_to)).order_by(DailyStat.day)
+    ).all()
+    
+    employees = db.session.execute(
+        select(
+            EmployeeDailyStat.employee_id,
+            Employee.full_name,
+            func.sum(EmployeeDailyStat.issues).label('issues'),
+            func.sum(EmployeeDailyStat.returns).label('returns'),
+            func.sum(EmployeeDailyStat.hold_seconds).label('hold_seconds'),
+        )
+        .outerjoin(Employee, Employee.id == EmployeeDailyStat.employee_id)
+        .where(EmployeeDailyStat.day.between(date_from, date_to))
+        .group_by(EmployeeDailyStat.employee_id, Employee.full_name)
+        .order_by(func.sum(EmployeeDailyStat.issues).desc(), EmployeeDailyStat.employee_id)
+    ).all()
+    
+    issues = sum(day.issues for day in days)
+    returns = sum(day.returns for day in days)
+    hold_seconds = sum(day.hold_seconds for day in days)
+    return jsonify({
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'days': [{
+            'date': day.day.isoformat(),
+            'issues': day.issues,
+            'returns': day.returns,
+            'average_hold_seconds': _average(day.hold_seconds, day.returns),
+            'peak_active': day.peak_active
+        } for day in days],
+        'totals': {
+            'issues': issues,
+            'returns': returns,
+            'average_hold_seconds': _average(hold_seconds, returns),
+            'peak_active': max((day.peak_active for day in days), default=0)
+        },
+        'employees': [{
+            'employee_id': row.employee_id,
+            'employee_name': row.full_name,
+            'issues': row.issues,
+            'returns': row.returns,
+            'average_hold_seconds': _average(row.hold_seconds, row.returns)
+        } for row in employees]
+    }), 200
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from models import Employee, VideoRecorder, VideoRecorderIssue, Tombstone
+from database import db
+from serializers import issues_select, issue_row_to_dict
+from routes.utils import encode_cursor, decode_cursor, cursor_values, keyset_condition, keyset_order
+
+sync_bp = Blueprint('sync', __name__)
+
+# Сколько строк каждого вида отдаётся за один запрос синхронизации
+SYNC_PAGE_LIMIT = 500
+MAX_SYNC_PAGE_LIMIT = 5000
+
+# Имя таблицы в tombstones -> ключ в ответе
+DELETED_KEYS = {
+    'employees': 'employees',
+    'video_recorders': 'video_recorders',
+    'video_recorder_issues': 'issues',
+}
+
+def _changed_rows(name):
+    """(запрос, колонки keyset, сериализация) изменённых строк вида name"""
+    if name == 'employees':
+        columns = [Employee.updated_at, Employee.id]
+        query = select(Employee).options(selectinload(Employee.photo))
+        return query, columns, lambda employee: employee.to_dict()
+    if name == 'video_recorders':
+        columns = [VideoRecorder.updated_at, VideoRecorder.id]
+        return select(VideoRecorder), columns, lambda video_recorder: video_recorder.to_dict()
+    columns = [VideoRecorderIssue.updated_at, VideoRecorderIssue.id]
+    return issues_select().add_columns(VideoRecorderIssue.updated_at), columns, issue_row_to_dict
+
+def _fetch(query, columns, after, limit, orm):
+    """Строки после позиции after в порядке (updated_at, id); на одну больше limit — признак продолжения"""
+    if after is not None:
+        query = query.where(keyset_condition(columns, after))
+    result = db.session.execute(query.order_by(*keyset_order(columns)).limit(limit + 1))
+    return (result.scalars() if orm else result).all()
+
+def _next_position(last, after, more, horizon):
+    """
+    Позиция потока для следующего запроса. Пока строки не кончились — последняя
+    отданная строка. Иначе позиция не заходит дальше horizon: транзакция, начатая
+    раньше, может закоммитить строки с более ранним updated_at уже после этого
+    запроса, поэтому последние SYNC_OVERLAP_SECONDS отдаются повторно
+    """
+    if more:
+        return last
+    position = last or after
+    if position is None or position[0] > horizon:
+        return [horizon, 0]
+    return position
+
+@sync_bp.route('', methods=['GET'])
+@jwt_required()
+def sync():
+    """
+    Дельта-синхронизация для мобильного клиента
+    Параметры запроса: since — next_cursor прошлого ответа (без него — полная выгрузка),
+    limit — сколько строк каждого вида отдавать за раз.
+    Ответ: изменённые сотрудники, видеорегистраторы и выдачи, id удалённых записей
+    в deleted, next_cursor и has_more (true — сразу запросите следующую порцию).
+    Клиент применяет сначала deleted, затем изменённые строки, по id; строки могут повторяться.
+    """
+    try:
+        limit = min(int(request.args.get('limit', SYNC_PAGE_LIMIT)), MAX_SYNC_PAGE_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'Неверное значение limit'}), 400
+    if limit < 1:
+        return jsonify({'error': 'Неверное значение limit'}), 400
+
+    now = datetime.utcnow()
+    horizon = now - timedelta(seconds=current_app.config['SYNC_OVERLAP_SECONDS'])
+
+    since = request.args.get('since')
+    try:
+        positions = decode_cursor(since).get('after') if since else {}
+        if not isinstance(positions, dict):
+            raise ValueError('Неверный курсор')
+        streams = []
+        for name in ('employees', 'video_recorders', 'issues'):
+            query, columns, serialize = _changed_rows(name)
+            after = cursor_values(columns, positions.get(name)) if since else None
+            streams.append((name, query, columns, serialize, after))
+        tombstone_columns = [Tombstone.deleted_at, Tombstone.id]
+        deleted_after = cursor_values(tombstone_columns, positions.get('deleted')) if since else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Об удалениях старше срока хранения tombstones клиент уже не узнает
+    retention = now - timedelta(days=current_app.config['SYNC_TOMBSTONE_DAYS'])
+    if deleted_after is not None and deleted_after[0] < retention:
+        return jsonify({'error': 'Курсор синхронизации устарел, выполните полную синхронизацию'}), 410
+
+    response = {}
+    next_positions = {}
+    has_more = False
+    for name, query, columns, serialize, after in streams:
+        rows = _fetch(query, columns, after, limit, orm=name != 'issues')
+        more = len(rows) > limit
+        rows = rows[:limit]
+        response[name] = [serialize(row) for row in rows]
+        last = [rows[-1].updated_at, rows[-1].id] if rows else None
+        next_positions[name] = _next_position(last, after, more, horizon)
+        has_more = has_more or more
+
+    # Полной выгрузке прошлые удаления не нужны: они отслеживаются начиная с неё
+    after = deleted_after or [horizon, 0]
+    tombstones = _fetch(select(Tombstone), tombstone_columns, after, limit, orm=True)
+    more = len(tombstones) > limit
+    tombstones = tombstones[:limit]
+    deleted = {key: [] for key in DELETED_KEYS.values()}
+    for tombstone in tombstones:
+        key = DELETED_KEYS.get(tombstone.table_name)
+        if key:
+            deleted[key].append(tombstone.row_id)
+    last = [tombstones[-1].deleted_at, tombstones[-1].id] if tombstones else None
+    next_positions['deleted'] = _next_position(last, after, more, horizon)
+    has_more = has_more or more
+
+    response['deleted'] = deleted
+    response['next_cursor'] = encode_cursor({'after': next_positions})
+    response['has_more'] = has_more
+    return jsonify(response), 200
@@ -1,16 +1,297 @@
 """
-Утилиты для работы с JWT и пользователями
+Утилиты для маршрутов: работа с JWT и пользователями, разбор параметров
+запроса и keyset-пагинация списков
 """
-from flask_jwt_extended import get_jwt_identity
-from models import User
+import base64
+import json
+import time
+from datetime import datetime
+from functools import lru_cache, wraps
+from flask import request, jsonify, make_response, current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+from sqlalchemy import and_, or_, event, DateTime, Integer, String
+from sqlalchemy.orm import Session, joinedload
+from models import User, Role
+from importer import IMPORT_MODES, IMPORT_SPECS, ImportFormatError, read_rows, import_rows
+from versions import versions_etag
+from events import publish
+from responses import wants_msgpack
+
+# Размер страницы по умолчанию и максимальный размер страницы для списков
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+# Сколько пользователей держит кэш процесса и сколько секунд живёт снимок:
+# изменения из других процессов (другие воркеры, create_admin.py) сброс
+# после коммита не видит, они вступают в силу не позже чем через USER_CACHE_SECONDS
+USER_CACHE_SIZE = 1024
+USER_CACHE_SECONDS = 30
+
+@lru_cache(maxsize=USER_CACHE_SIZE)
+def _load_user_cached(user_id, period):
+    """Снимок пользователя (User.to_dict()) вместе с ролью одним запросом; None, если не найден"""
+    user = User.query.options(joinedload(User.role)).get(user_id)
+    return user.to_dict() if user else None
+
+def _load_user(user_id):
+    # Номер периода в ключе кэша: с новым периодом снимок загружается заново
+    return _load_user_cached(user_id, int(time.monotonic() // USER_CACHE_SECONDS))
+
+def invalidate_user_cache():
+    _load_user_cached.cache_clear()
+
+# Кэш сбрасывается после коммита, в котором менялись пользователи или роли:
+# сброс до коммита позволил бы другому запросу закэшировать старые данные
+@event.listens_for(Session, 'before_flush')
+def _track_user_changes(session, flush_context, instances):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (User, Role)):
+            session.info['users_changed'] = True
+            return
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('users_changed', False):
+        invalidate_user_cache()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_user_changes(session):
+    session.info.pop('users_changed', None)
 
 def get_current_user():
     """
-    Получает текущего пользователя из JWT токена
-    Возвращает User объект или None, если пользователь не найден
+    Получает текущего пользователя из JWT токена через кэш процесса
+    Возвращает словарь User.to_dict() или None, если пользователь не найден
     """
     try:
         current_user_id = int(get_jwt_identity())
-        return User.query.get(current_user_id)
     except (ValueError, TypeError):
         return None
+    return _load_user(current_user_id)
+
+def get_current_role():
+    """
+    Роль текущего пользователя из кэша процесса (при попадании в кэш — без запросов к БД)
+    None, если пользователь не найден или его роль уже не совпадает с claim 'role' токена
+    """
+    user = get_current_user()
+    if user is None:
+        return None
+    role = get_jwt().get('role')
+    if role is not None and role != user['role_name']:
+        return None
+    return user['role_name']
+
+def role_required(*roles):
+    """
+    Декоратор: jwt_required + проверка роли пользователя
+    Роль сверяется со снимком пользователя из кэша: удалённый пользователь или
+    пользователь, у которого роль сменилась после выдачи токена, получает 403.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            if get_current_role() not in roles:
+                return jsonify({'error': 'Недостаточно прав'}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def table_etag(*tables, vary=None):
+    """
+    Декоратор списка: ETag из версий tables и строки запроса, 304 на совпадающий If-None-Match
+    vary — функция без аргументов, если ответ зависит ещё от чего-то, кроме таблиц
+    и параметров запроса (например, от текущей даты); её строка входит в ETag.
+    Версии читаются до данных: если запись успела закоммититься между этими чтениями,
+    ответ получит прежний ETag, и следующий опрос просто загрузит список ещё раз
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            # JSON и MessagePack — разные представления, у них разные ETag
+            key = request.query_string + (b'#msgpack' if wants_msgpack() else b'')
+            if vary is not None:
+                key += b'#' + vary().encode('utf-8')
+            etag = versions_etag(tables, key)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def parse_datetime_arg(name):
+    """
+    Читает дату/время в формате ISO 8601 из query string
+    Возвращает datetime или None, если параметр не передан; ValueError при неверном формате
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Неверный формат даты в параметре {name}')
+
+def parse_fields_arg(allowed):
+    """
+    Читает параметр fields (список полей через запятую) для ответа с частью полей
+    Возвращает список полей в порядке запроса или None, если параметр не передан;
+    ValueError, если поле не из allowed
+    """
+    value = request.args.get('fields')
+    if not value:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Недопустимые поля в параметре fields: {', '.join(unknown)}")
+    return fields
+
+def parse_sort_arg(allowed, default):
+    """
+    Читает параметр sort: 'field' — по возрастанию, '-field' — по убыванию
+    Возвращает (sort, field, descending); ValueError, если поле не из allowed
+    """
+    sort = request.args.get('sort') or default
+    field = sort.lstrip('-')
+    if field not in allowed:
+        raise ValueError(f'Недопустимая сортировка: {sort}')
+    return sort, field, sort.startswith('-')
+
+def parse_page_args():
+    """
+    Читает параметры limit и cursor
+    Возвращает (limit, cursor_data) или None, если клиент не запрашивал постраничную выдачу
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_LIMIT))
+    except ValueError:
+        raise ValueError('Неверное значение limit')
+    if limit < 1:
+        raise ValueError('Неверное значение limit')
+    cursor = request.args.get('cursor')
+    return min(limit, MAX_PAGE_LIMIT), decode_cursor(cursor) if cursor else None
+
+def encode_cursor(data):
+    """Курсор — JSON в base64url, для клиента это непрозрачная строка"""
+    raw = json.dumps(data, separators=(',', ':'), ensure_ascii=False, default=_cursor_default)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except ValueError:
+        raise ValueError('Неверный курсор')
+    if not isinstance(data, dict):
+        raise ValueError('Неверный курсор')
+    return data
+
+def _cursor_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Значение {value!r} нельзя записать в курсор')
+
+def cursor_values(columns, values):
+    """
+    Приводит значения из курсора к типам колонок (даты хранятся в курсоре строками)
+    ValueError, если значение не строка, число или null или не подходит к типу колонки
+    (column = None — колонка без типа, например вид события ленты)
+    """
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Неверный курсор')
+    result = []
+    for column, value in zip(columns, values):
+        if value is None:
+            result.append(value)
+            continue
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError('Неверный курсор')
+        column_type = getattr(column, 'type', None)
+        if isinstance(column_type, DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise ValueError('Неверный курсор')
+        elif isinstance(column_type, Integer) and not isinstance(value, int):
+            raise ValueError('Неверный курсор')
+        elif isinstance(column_type, String) and not isinstance(value, str):
+            raise ValueError('Неверный курсор')
+        result.append(value)
+    return result
+
+def keyset_condition(columns, values, descending=False):
+    """
+    Условие "строка идёт после курсора" для сортировки по columns:
+    (c1, c2, ...) > (v1, v2, ...), развёрнутое в OR/AND, чтобы не зависеть
+    от поддержки row values в конкретной СУБД
+    """
+    condition = None
+    for column, value in reversed(list(zip(columns, values))):
+        after = column < value if descending else column > value
+        condition = after if condition is None else or_(after, and_(column == value, condition))
+    return condition
+
+def keyset_order(columns, descending=False):
+    return [column.desc() if descending else column.asc() for column in columns]
+
+def paginate_query(query, columns, sort, page):
+    """
+    Keyset-пагинация ORM-запроса, отсортированного по columns (последняя — уникальный id)
+    Возвращает (items, next_cursor); next_cursor = None на последней странице
+    """
+    descending = sort.startswith('-')
+    if page is None:
+        return query.order_by(*keyset_order(columns, descending)).all(), None
+
+    limit, cursor = page
+    if cursor is not None:
+        if cursor.get('sort') != sort:
+            raise ValueError('Курсор не соответствует сортировке')
+        query = query.filter(keyset_condition(columns, cursor_values(columns, cursor.get('after')), descending))
+
+    items = query.order_by(*keyset_order(columns, descending)).limit(limit + 1).all()
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    last = items[-1]
+    return items, encode_cursor({'sort': sort, 'after': [getattr(last, column.key) for column in columns]})
+
+def page_response(items, next_cursor, page):
+    """Тело ответа списка: массив (без limit/cursor) или объект с курсором следующей страницы"""
+    if page is None:
+        return items
+    return {'items': items, 'next_cursor': next_cursor, 'limit': page[0]}
+
+def import_from_request(kind):
+    """
+    Общий обработчик эндпоинтов массового импорта: файл в поле 'file',
+    параметры запроса mode (insert или upsert) и dry_run
+    """
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'error': 'Файл не предоставлен'}), 400
+    
+    mode = request.args.get('mode', 'insert')
+    if mode not in IMPORT_MODES:
+        return jsonify({'error': 'Недопустимый режим импорта'}), 400
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    
+    try:
+        report = import_rows(kind, read_rows(IMPORT_SPECS[kind], file.stream, file.filename), mode=mode, dry_run=dry_run)
+    except (ImportFormatError, UnicodeDecodeError) as e:
+        return jsonify({'error': f'Не удалось прочитать файл: {e}'}), 400
+    
+    # Построчные события на весь файл не нужны: клиенты перечитывают таблицу
+    if not dry_run and (report['created'] or report['updated']):
+        publish('reload', {'table': kind})
+    return jsonify(report), 200
@@ -1,28 +1,69 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import VideoRecorder, User, VideoRecorderIssue, VideoRecorderReturn
+from flask_jwt_extended import jwt_required
+from models import VideoRecorder, VideoRecorderIssue, VideoRecorderReturn
 from database import db
+from routes.utils import (
+    role_required, table_etag, parse_sort_arg, parse_fields_arg, parse_page_args, paginate_query, page_response,
+    import_from_request
+)
+from serializers import VIDEO_RECORDER_FIELDS, fields_load_options, fields_to_dict
+from versions import bump, record_deletion
+from idempotency import idempotent
+from events import publish
 
 video_recorders_bp = Blueprint('video_recorders', __name__)
 
+# Допустимые поля сортировки списка; id всегда добавляется последним ключом для стабильного порядка
+SORT_FIELDS = {
+    'id': VideoRecorder.id,
+    'number': VideoRecorder.number,
+}
+
 @video_recorders_bp.route('', methods=['GET'])
 @jwt_required()
+@table_etag('video_recorders', 'employees')
 def get_video_recorders():
-    """UC2: Просмотр списка видеорегистраторов и их статуса"""
-    video_recorders = VideoRecorder.query.all()
-    return jsonify([vr.to_dict() for vr in video_recorders]), 200
+    """
+    UC2: Просмотр списка видеорегистраторов и их статуса
+    Параметры запроса (опционально): status, sort (id, number; '-' — по убыванию),
+    limit и cursor — постраничная выдача, fields — только перечисленные поля ответа
+    Держатель (current_employee_id, current_employee_name) приходит тем же запросом через JOIN.
+    ETag меняется при изменении видеорегистраторов или сотрудников; с If-None-Match — 304
+    """
+    try:
+        sort, field, _ = parse_sort_arg(SORT_FIELDS, 'id')
+        page = parse_page_args()
+        fields = parse_fields_arg(VIDEO_RECORDER_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    columns = [SORT_FIELDS[field]] if field == 'id' else [SORT_FIELDS[field], VideoRecorder.id]
+    # Только колонки и связи запрошенных полей (без fields — всех полей to_dict())
+    options = fields_load_options(VIDEO_RECORDER_FIELDS, fields or VIDEO_RECORDER_FIELDS, columns)
+    query = VideoRecorder.query.options(*options)
+    
+    status = request.args.get('status')
+    if status:
+        if status not in ['available', 'issued']:
+            return jsonify({'error': 'Недопустимый статус'}), 400
+        query = query.filter(VideoRecorder.status == status)
+    
+    try:
+        video_recorders, next_cursor = paginate_query(query, columns, sort, page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if fields:
+        items = [fields_to_dict(VIDEO_RECORDER_FIELDS, vr, fields) for vr in video_recorders]
+    else:
+        items = [vr.to_dict() for vr in video_recorders]
+    return jsonify(page_response(items, next_cursor, page)), 200
 
 @video_recorders_bp.route('', methods=['POST'])
-@jwt_required()
+@role_required('admin')  # Только администратор может добавлять
+@idempotent
 def create_video_recorder():
     """UC3: Добавление видеорегистратора"""
-    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    current_user = User.query.get(current_user_id)
-    
-    # Проверка прав (только администратор может добавлять)
-    if not current_user or current_user.role.name != 'admin':
-        return jsonify({'error': 'Недостаточно прав'}), 403
-    
     data = request.get_json()
     
     if not data or not data.get('number'):
@@ -37,9 +78,21 @@ def create_video_recorder():
     )
     
     db.session.add(new_video_recorder)
+    bump('video_recorders')
     db.session.commit()
     
-    return jsonify({'message': 'Видеорегистратор добавлен', 'video_recorder': new_video_recorder.to_dict()}), 201
+    video_recorder = new_video_recorder.to_dict()
+    publish('video_recorder', video_recorder)
+    return jsonify({'message': 'Видеорегистратор добавлен', 'video_recorder': video_recorder}), 201
+
+@video_recorders_bp.route('/import', methods=['POST'])
+@role_required('admin')  # Только администратор может добавлять
+def import_video_recorders():
+    """
+    UC3: Массовый импорт видеорегистраторов из CSV/XLSX
+    Колонки: number, status; параметры запроса: mode (insert/upsert), dry_run
+    """
+    return import_from_request('video_recorders')
 
 @video_recorders_bp.route('/<int:video_recorder_id>', methods=['GET'])
 @jwt_required()
@@ -53,16 +106,10 @@ def get_video_recorder(video_recorder_id):
     return jsonify(video_recorder.to_dict()), 200
 
 @video_recorders_bp.route('/<int:video_recorder_id>', methods=['PUT'])
-@jwt_required()
+@role_required('admin')  # Только администратор может редактировать
+@idempotent
 def update_video_recorder(video_recorder_id):
     """UC3: Редактирование видеорегистратора"""
-    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    current_user = User.query.get(current_user_id)
-    
-    # Проверка прав (только администратор может редактировать)
-    if not current_user or current_user.role.name != 'admin':
-        return jsonify({'error': 'Недостаточно прав'}), 403
-    
     video_recorder = VideoRecorder.query.get(video_recorder_id)
     
     if not video_recorder:
@@ -82,21 +129,18 @@ def update_video_recorder(video_recorder_id):
             return jsonify({'error': 'Недопустимый статус'}), 400
         video_recorder.status = data['status']
     
+    bump('video_recorders')
     db.session.commit()
     
-    return jsonify({'message': 'Видеорегистратор обновлён', 'video_recorder': video_recorder.to_dict()}), 200
+    video_recorder = video_recorder.to_dict()
+    publish('video_recorder', video_recorder)
+    return jsonify({'message': 'Видеорегистратор обновлён', 'video_recorder': video_recorder}), 200
 
 @video_recorders_bp.route('/<int:video_recorder_id>', methods=['DELETE'])
-@jwt_required()
+@role_required('admin')  # Только администратор может удалять
+@idempotent
 def delete_video_recorder(video_recorder_id):
     """UC3: Удаление видеорегистратора"""
-    current_user_id = int(get_jwt_identity())  # Преобразуем строку в int
-    current_user = User.query.get(current_user_id)
-    
-    # Проверка прав (только администратор может удалять)
-    if not current_user or current_user.role.name != 'admin':
-        return jsonify({'error': 'Недостаточно прав'}), 403
-    
     video_recorder = VideoRecorder.query.get(video_recorder_id)
     
     if not video_recorder:
@@ -110,7 +154,10 @@ def delete_video_recorder(video_recorder_id):
         # Удаляем видеорегистратор, история выдач/возвратов сохранится
         # (внешние ключи установятся в NULL благодаря ondelete='SET NULL')
         db.session.delete(video_recorder)
+        record_deletion('video_recorders', video_recorder_id)
+        bump('video_recorders', 'video_recorder_issues', 'video_recorder_returns')
         db.session.commit()
+        publish('video_recorder_deleted', {'id': video_recorder_id})
         return jsonify({'message': 'Видеорегистратор удалён'}), 200
     except Exception as e:
         db.session.rollback()
@@ -119,5 +166,8 @@ def delete_video_recorder(video_recorder_id):
         VideoRecorderIssue.query.filter_by(video_recorder_id=video_recorder_id).update({'video_recorder_id': None})
         VideoRecorderReturn.query.filter_by(video_recorder_id=video_recorder_id).update({'video_recorder_id': None})
         db.session.delete(video_recorder)
+        record_deletion('video_recorders', video_recorder_id)
+        bump('video_recorders', 'video_recorder_issues', 'video_recorder_returns')
         db.session.commit()
+        publish('video_recorder_deleted', {'id': video_recorder_id})
         return jsonify({'message': 'Видеорегистратор удалён, история сохранена'}), 200
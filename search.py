@@ -0,0 +1,140 @@
+"""
+Поиск сотрудников и видеорегистраторов по началу слов (GET /api/search).
+
+В SQLite используются полнотекстовые индексы FTS5: employees_fts (full_name,
+employee_number, position) и video_recorders_fts (number), rowid индекса — id
+строки. Индексы поддерживаются триггерами на INSERT/UPDATE/DELETE, поэтому
+остаются актуальными при любом способе записи — через API, импорт или вручную.
+
+Каждое слово запроса ищется как префикс ("ива пет" найдёт «Иванов Пётр»),
+результаты упорядочены по bm25 с весами колонок. Если FTS5 недоступен
+(другая СУБД или SQLite без модуля fts5), поиск идёт через LIKE по началу значений.
+"""
+import re
+from sqlalchemy import select, table, column, literal_column, or_
+from sqlalchemy.exc import OperationalError
+from database import db
+
+# Индексы: имя -> (таблица, индексируемые колонки, веса bm25 в порядке колонок)
+SEARCH_INDEXES = {
+    'employees_fts': ('employees', ('full_name', 'employee_number', 'position'), (10.0, 5.0, 1.0)),
+    'video_recorders_fts': ('video_recorders', ('number',), (1.0,)),
+}
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# engine -> доступен ли FTS5 (проверяется один раз на процесс)
+_fts_enabled = {}
+
+
+def _normalized(expression):
+    # «ё» индексируется и ищется как «е»: при наборе их обычно не различают
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _create_statements(name, source, columns):
+    column_list = ', '.join(columns)
+    new_values = ', '.join(_normalized(f'new.{column}') for column in columns)
+    # prefix: отдельные индексы для префиксов из 1–3 символов — набор по первым буквам не перебирает словарь
+    yield (
+        f"CREATE VIRTUAL TABLE {name} USING fts5({column_list}, "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+    )
+    yield (
+        f'CREATE TRIGGER {name}_ai AFTER INSERT ON {source} BEGIN '
+        f'INSERT INTO {name}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+    )
+    yield f'CREATE TRIGGER {name}_ad AFTER DELETE ON {source} BEGIN DELETE FROM {name} WHERE rowid = old.id; END'
+    # Только при изменении индексируемых колонок: обновление updated_at индекс не трогает
+    yield (
+        f'CREATE TRIGGER {name}_au AFTER UPDATE OF {column_list} ON {source} BEGIN '
+        f'DELETE FROM {name} WHERE rowid = old.id; '
+        f'INSERT INTO {name}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+    )
+    yield (
+        f'INSERT INTO {name}(rowid, {column_list}) '
+        f"SELECT id, {', '.join(_normalized(column) for column in columns)} FROM {source}"
+    )
+
+
+def ensure_search_index():
+    """
+    Создаёт индексы FTS5 и триггеры, если их ещё нет, и заполняет новые индексы
+    из существующих строк (вызывать внутри app context). Для других СУБД ничего не делает
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as connection:
+        existing = {row[0] for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )}
+        for name, (source, columns, weights) in SEARCH_INDEXES.items():
+            if name in existing:
+                continue
+            try:
+                for statement in _create_statements(name, source, columns):
+                    connection.exec_driver_sql(statement)
+            except OperationalError as e:
+                print(f'Поисковый индекс {name} не создан, поиск будет работать через LIKE ({e.orig})')
+                continue
+            # Веса колонок сохраняются в самом индексе и используются в ORDER BY rank
+            connection.exec_driver_sql(
+                f"INSERT INTO {name}({name}, rank) VALUES ('rank', 'bm25({', '.join(map(str, weights))})')"
+            )
+    _fts_enabled.pop(db.engine, None)
+
+
+def fts_enabled():
+    """Есть ли в БД индексы FTS5 (один запрос к sqlite_master на процесс)"""
+    engine = db.engine
+    if engine not in _fts_enabled:
+        enabled = False
+        if engine.dialect.name == 'sqlite':
+            names = set(db.session.scalars(
+                select(literal_column('name')).select_from(table('sqlite_master'))
+                .where(literal_column('name').in_(list(SEARCH_INDEXES)))
+            ))
+            enabled = names == set(SEARCH_INDEXES)
+        _fts_enabled[engine] = enabled
+    return _fts_enabled[engine]
+
+
+def search_tokens(query):
+    """Слова запроса; знаки препинания и кавычки отбрасываются"""
+    return _TOKEN_RE.findall((query or '').replace('ё', 'е').replace('Ё', 'Е'))
+
+
+def _match_expression(tokens):
+    # Каждое слово — префикс, слова объединяются через AND
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_select(model, index_name, tokens, limit):
+    """
+    SELECT строк model, подходящих под tokens, лучшие первыми, не больше limit.
+    С FTS5 — лучшие limit кандидатов из индекса index_name (ORDER BY rank LIMIT внутри
+    индекса: FTS5 ранжирует все совпадения, но хранит только limit лучших) и соединение
+    с ними по rowid, иначе — LIKE по началу значений индексируемых колонок
+    """
+    _, columns, _ = SEARCH_INDEXES[index_name]
+    model_columns = [getattr(model, name) for name in columns]
+    if fts_enabled():
+        index = table(index_name, column('rowid'), column('rank'))
+        candidates = (
+            select(index.c.rowid, index.c.rank)
+            .where(literal_column(index_name).op('MATCH')(_match_expression(tokens)))
+            .order_by(index.c.rank)
+            .limit(limit)
+            .subquery()
+        )
+        return (
+            select(model)
+            .join(candidates, candidates.c.rowid == model.id)
+            .order_by(candidates.c.rank, model.id)
+            .limit(limit)
+        )
+    query = select(model)
+    for token in tokens:
+        pattern = token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.where(or_(*(value.ilike(pattern, escape='\\') for value in model_columns)))
+    return query.order_by(model_columns[0], model.id).limit(limit)
@@ -0,0 +1,271 @@
+"""
+Сериализация выдач и возвратов для списковых эндпоинтов.
+
+to_dict() моделей обращается к связям video_recorder, employee и
+issued_by_user/returned_by_user лениво, что даёт до трёх дополнительных
+SELECT на каждую строку. Здесь те же словари собираются из одного запроса
+с LEFT JOIN, который выбирает только нужные колонки. Общая лента событий
+собирается в SQL через UNION ALL.
+
+Для списков сотрудников и видеорегистраторов с параметром fields здесь же
+описаны поля ответа: по ним загружаются только нужные колонки и связи.
+"""
+from sqlalchemy import select, union_all, literal, literal_column, null
+from sqlalchemy.orm import MANYTOONE, load_only, noload, joinedload, selectinload
+from models import VideoRecorderIssue, VideoRecorderReturn, VideoRecorder, Employee, User
+from routes.utils import keyset_condition, keyset_order
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+# Поля списков для ?fields=: имя -> (колонки модели, связь или None, значение из объекта).
+# Набор и значения полей — те же, что в to_dict() модели
+EMPLOYEE_FIELDS = {
+    'id': ([Employee.id], None, lambda employee: employee.id),
+    'full_name': ([Employee.full_name], None, lambda employee: employee.full_name),
+    'position': ([Employee.position], None, lambda employee: employee.position),
+    'employee_number': ([Employee.employee_number], None, lambda employee: employee.employee_number),
+    'created_at': ([Employee.created_at], None, lambda employee: _isoformat(employee.created_at)),
+    'photo_url': ([], Employee.photo, lambda employee: employee.photo.url() if employee.photo else None),
+    'photo_thumb_url': ([], Employee.photo, lambda employee: employee.photo.url('thumb') if employee.photo else None),
+}
+
+VIDEO_RECORDER_FIELDS = {
+    'id': ([VideoRecorder.id], None, lambda video_recorder: video_recorder.id),
+    'number': ([VideoRecorder.number], None, lambda video_recorder: video_recorder.number),
+    'status': ([VideoRecorder.status], None, lambda video_recorder: video_recorder.status),
+    'created_at': ([VideoRecorder.created_at], None, lambda video_recorder: _isoformat(video_recorder.created_at)),
+    'current_issue_id': ([VideoRecorder.current_issue_id], None, lambda video_recorder: video_recorder.current_issue_id),
+    'current_employee_id': (
+        [VideoRecorder.current_employee_id], None, lambda video_recorder: video_recorder.current_employee_id
+    ),
+    'current_employee_name': (
+        [VideoRecorder.current_employee_id], VideoRecorder.current_employee,
+        lambda video_recorder: video_recorder.current_employee.full_name if video_recorder.current_employee else None
+    ),
+}
+
+
+def fields_load_options(spec, fields, extra_columns=()):
+    """
+    Опции загрузки ORM для полей fields из spec: только их колонки (и extra_columns —
+    ключи сортировки и курсора) и только нужные связи. Связь «многие к одному»
+    подгружается JOIN'ом, остальные — одним SELECT ... IN на страницу; ненужные не загружаются
+    """
+    columns = list(extra_columns)
+    needed = set()
+    for name in fields:
+        field_columns, relationship, _ = spec[name]
+        columns.extend(field_columns)
+        if relationship is not None:
+            needed.add(relationship.key)
+    options = [load_only(*dict.fromkeys(columns))]
+    relationships = {relationship.key: relationship for _, relationship, _ in spec.values() if relationship is not None}
+    for key, relationship in relationships.items():
+        if key not in needed:
+            options.append(noload(relationship))
+        elif relationship.property.direction is MANYTOONE:
+            options.append(joinedload(relationship))
+        else:
+            options.append(selectinload(relationship))
+    return options
+
+
+def fields_to_dict(spec, obj, fields):
+    """Словарь только с полями fields (как to_dict(), но без лишних полей)"""
+    return {name: spec[name][2](obj) for name in fields}
+
+
+def _user_name(first_name, last_name):
+    if first_name is None and last_name is None:
+        return None
+    return f"{first_name} {last_name}"
+
+
+def issues_select():
+    """SELECT выдач с номером регистратора, ФИО сотрудника и именем выдавшего пользователя"""
+    return (
+        select(
+            VideoRecorderIssue.id,
+            VideoRecorderIssue.video_recorder_id,
+            VideoRecorder.number.label('video_recorder_number'),
+            VideoRecorderIssue.employee_id,
+            Employee.full_name.label('employee_name'),
+            VideoRecorderIssue.issued_by_user_id,
+            User.first_name.label('user_first_name'),
+            User.last_name.label('user_last_name'),
+            VideoRecorderIssue.issue_date,
+            VideoRecorderIssue.status,
+            VideoRecorderIssue.returned_at,
+            VideoRecorderIssue.duration,
+        )
+        .outerjoin(VideoRecorder, VideoRecorder.id == VideoRecorderIssue.video_recorder_id)
+        .outerjoin(Employee, Employee.id == VideoRecorderIssue.employee_id)
+        .outerjoin(User, User.id == VideoRecorderIssue.issued_by_user_id)
+    )
+
+
+def returns_select():
+    """SELECT возвратов с номером регистратора, ФИО сотрудника и именем принявшего пользователя"""
+    return (
+        select(
+            VideoRecorderReturn.id,
+            VideoRecorderReturn.video_recorder_id,
+            VideoRecorder.number.label('video_recorder_number'),
+            VideoRecorderReturn.employee_id,
+            Employee.full_name.label('employee_name'),
+            VideoRecorderReturn.returned_by_user_id,
+            User.first_name.label('user_first_name'),
+            User.last_name.label('user_last_name'),
+            VideoRecorderReturn.return_date,
+            VideoRecorderReturn.issue_id,
+        )
+        .outerjoin(VideoRecorder, VideoRecorder.id == VideoRecorderReturn.video_recorder_id)
+        .outerjoin(Employee, Employee.id == VideoRecorderReturn.employee_id)
+        .outerjoin(User, User.id == VideoRecorderReturn.returned_by_user_id)
+    )
+
+
+def issue_row_to_dict(row):
+    """Строка issues_select() -> тот же словарь, что VideoRecorderIssue.to_dict()"""
+    return {
+        'id': row.id,
+        'video_recorder_id': row.video_recorder_id,
+        'video_recorder_number': row.video_recorder_number,
+        'employee_id': row.employee_id,
+        'employee_name': row.employee_name,
+        'issued_by_user_id': row.issued_by_user_id,
+        'issued_by_user_name': _user_name(row.user_first_name, row.user_last_name),
+        'issue_date': row.issue_date.isoformat() if row.issue_date else None,
+        'status': row.status,
+        'returned_at': row.returned_at.isoformat() if row.returned_at else None,
+        'duration': row.duration
+    }
+
+
+def return_row_to_dict(row):
+    """Строка returns_select() -> тот же словарь, что VideoRecorderReturn.to_dict()"""
+    return {
+        'id': row.id,
+        'video_recorder_id': row.video_recorder_id,
+        'video_recorder_number': row.video_recorder_number,
+        'employee_id': row.employee_id,
+        'employee_name': row.employee_name,
+        'returned_by_user_id': row.returned_by_user_id,
+        'returned_by_user_name': _user_name(row.user_first_name, row.user_last_name),
+        'return_date': row.return_date.isoformat() if row.return_date else None,
+        'issue_id': row.issue_id
+    }
+
+
+# Вид события в общей ленте; при равных датах выдача идёт раньше возврата
+ISSUE_EVENT = 0
+RETURN_EVENT = 1
+EVENT_TYPES = {ISSUE_EVENT: 'issue', RETURN_EVENT: 'return'}
+
+
+def timeline_select(video_recorder_id=None, employee_id=None, date_from=None, date_to=None,
+                    after=None, descending=False, limit=None):
+    """
+    Общая лента выдач и возвратов одним запросом: UNION ALL двух таблиц
+    с ORDER BY (дата, вид события, id) на уровне составного запроса.
+
+    Фильтры и условие keyset-курсора after = [дата, вид, id] применяются внутри
+    каждой ветки UNION, чтобы каждая таблица читалась по своему индексу. SQLite
+    в этом случае сливает две упорядоченные ветки (MERGE (UNION ALL)) без
+    сортировки всего результата: первая строка доступна сразу, а LIMIT
+    ограничивает число прочитанных строк.
+    """
+    branches = []
+    for kind, model, date_column, user_column in (
+        (ISSUE_EVENT, VideoRecorderIssue, VideoRecorderIssue.issue_date, VideoRecorderIssue.issued_by_user_id),
+        (RETURN_EVENT, VideoRecorderReturn, VideoRecorderReturn.return_date, VideoRecorderReturn.returned_by_user_id),
+    ):
+        branch = (
+            select(
+                literal(kind).label('kind'),
+                model.id.label('id'),
+                date_column.label('event_date'),
+                model.video_recorder_id.label('video_recorder_id'),
+                VideoRecorder.number.label('video_recorder_number'),
+                model.employee_id.label('employee_id'),
+                Employee.full_name.label('employee_name'),
+                user_column.label('user_id'),
+                User.first_name.label('user_first_name'),
+                User.last_name.label('user_last_name'),
+                (VideoRecorderIssue.status if model is VideoRecorderIssue else null()).label('status'),
+                # Выдача события: у выдачи — она сама, у возврата — закрытая им выдача
+                (model.id if model is VideoRecorderIssue else VideoRecorderReturn.issue_id).label('issue_id'),
+                (VideoRecorderIssue.returned_at if model is VideoRecorderIssue else null()).label('returned_at'),
+                (VideoRecorderIssue.duration if model is VideoRecorderIssue else null()).label('duration'),
+            )
+            .select_from(model)
+            .outerjoin(VideoRecorder, VideoRecorder.id == model.video_recorder_id)
+            .outerjoin(Employee, Employee.id == model.employee_id)
+            .outerjoin(User, User.id == user_column)
+        )
+        # Используем явную проверку на None, чтобы корректно обрабатывать id = 0
+        if video_recorder_id is not None:
+            branch = branch.where(model.video_recorder_id == video_recorder_id)
+        if employee_id is not None:
+            branch = branch.where(model.employee_id == employee_id)
+        if date_from is not None:
+            branch = branch.where(date_column >= date_from)
+        if date_to is not None:
+            branch = branch.where(date_column <= date_to)
+        if after is not None:
+            branch = branch.where(keyset_condition([date_column, literal(kind), model.id], after, descending))
+        branches.append(branch)
+
+    order = keyset_order([literal_column('event_date'), literal_column('kind'), literal_column('id')], descending)
+    query = union_all(*branches).order_by(*order)
+    return query.limit(limit) if limit is not None else query
+
+
+def event_row_to_dict(row):
+    """Строка timeline_select() -> событие ленты"""
+    return {
+        'type': EVENT_TYPES[row.kind],
+        'id': row.id,
+        'date': row.event_date.isoformat() if row.event_date else None,
+        'video_recorder_id': row.video_recorder_id,
+        'video_recorder_number': row.video_recorder_number,
+        'employee_id': row.employee_id,
+        'employee_name': row.employee_name,
+        'user_id': row.user_id,
+        'user_name': _user_name(row.user_first_name, row.user_last_name),
+        'status': row.status,
+        'issue_id': row.issue_id,
+        'duration': row.duration
+    }
+
+
+def event_row_to_record(row):
+    """Строка timeline_select() -> словарь выдачи или возврата в формате issue_row_to_dict/return_row_to_dict"""
+    if row.kind == ISSUE_EVENT:
+        return {
+            'id': row.id,
+            'video_recorder_id': row.video_recorder_id,
+            'video_recorder_number': row.video_recorder_number,
+            'employee_id': row.employee_id,
+            'employee_name': row.employee_name,
+            'issued_by_user_id': row.user_id,
+            'issued_by_user_name': _user_name(row.user_first_name, row.user_last_name),
+            'issue_date': row.event_date.isoformat() if row.event_date else None,
+            'status': row.status,
+            'returned_at': row.returned_at.isoformat() if row.returned_at else None,
+            'duration': row.duration
+        }
+    return {
+        'id': row.id,
+        'video_recorder_id': row.video_recorder_id,
+        'video_recorder_number': row.video_recorder_number,
+        'employee_id': row.employee_id,
+        'employee_name': row.employee_name,
+        'returned_by_user_id': row.user_id,
+        'returned_by_user_name': _user_name(row.user_first_name, row.user_last_name),
+        'return_date': row.event_date.isoformat() if row.event_date else None,
+        'issue_id': row.issue_id
+    }
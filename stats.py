@@ -0,0 +1,140 @@
+"""
+Статистика использования: суточные сводки выдач и возвратов.
+
+issue_recorder() и return_recorder() обновляют сводку за текущие сутки в той же
+транзакции, что и саму выдачу или возврат, поэтому /api/stats читает несколько
+сотен строк сводки вместо всей истории. rebuild() пересчитывает сводки из истории
+(команда flask stats-rebuild) — например, после правки истории вручную.
+
+Сутки считаются по UTC, как и даты в истории. Число выданных регистраторов
+ведётся в сводке (active — на момент последней операции суток): выдача
+прибавляет единицу, возврат вычитает, а пик обновляется тем же запросом, поэтому
+подсчитывать активные выдачи при каждой операции не нужно. Пик учитывается
+в моменты выдачи и возврата: сутки без операций в сводке отсутствуют.
+
+Строка сводки обновляется одним INSERT ... ON CONFLICT DO UPDATE: при первой
+операции за сутки две параллельные транзакции не вставляют одну строку дважды
+(иначе проигравшая получила бы IntegrityError и выдача — ложный 409).
+"""
+from sqlalchemy import select, insert, delete, case, func, union_all, literal, literal_column, null
+from sqlalchemy.dialects import postgresql, sqlite
+from database import db
+from models import DailyStat, EmployeeDailyStat, VideoRecorderIssue, VideoRecorderReturn
+from versions import bump
+
+
+def _insert(model):
+    """INSERT с поддержкой ON CONFLICT для СУБД текущего соединения (SQLite или PostgreSQL)"""
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    return dialect.insert(model)
+
+
+def _upsert(model, key, increments):
+    """Прибавляет increments к строке сводки key, создавая её при первой операции за сутки"""
+    values = {column: getattr(model, column) + amount for column, amount in increments.items()}
+    db.session.execute(
+        _insert(model).values(**key, **increments).on_conflict_do_update(index_elements=list(key), set_=values)
+    )
+
+
+def _record_day(day, increments, delta):
+    """
+    Учитывает операцию в сводке суток: increments к счётчикам, delta (+1 выдача,
+    -1 возврат) к числу выданных регистраторов. Пик — наибольшее из чисел
+    выданных до и после операции; всё одним запросом без подсчёта активных выдач
+    """
+    peak = DailyStat.active + max(delta, 0)
+    values = {column: getattr(DailyStat, column) + amount for column, amount in increments.items()}
+    values['active'] = DailyStat.active + delta
+    values['peak_active'] = case((DailyStat.peak_active < peak, peak), else_=DailyStat.peak_active)
+    # Первая операция за сутки: выданные на начало суток — из последней сводки до них
+    active = func.coalesce(
+        select(DailyStat.active).where(DailyStat.day < day).order_by(DailyStat.day.desc()).limit(1)
+        .scalar_subquery(), 0
+    )
+    db.session.execute(
+        _insert(DailyStat)
+        .values(**increments, day=day, active=case((active + delta < 0, 0), else_=active + delta),
+                peak_active=active + max(delta, 0))
+        .on_conflict_do_update(index_elements=['day'], set_=values)
+    )
+
+
+def record_issue(employee_id, issued_at):
+    """Учитывает выдачу в сводке"""
+    day = issued_at.date()
+    _record_day(day, {'issues': 1}, 1)
+    if employee_id is not None:
+        _upsert(EmployeeDailyStat, {'day': day, 'employee_id': employee_id}, {'issues': 1})
+
+
+def record_return(employee_id, returned_at, duration):
+    """Учитывает возврат в сводке"""
+    day = returned_at.date()
+    hold_seconds = duration or 0
+    _record_day(day, {'returns': 1, 'hold_seconds': hold_seconds}, -1)
+    if employee_id is not None:
+        _upsert(EmployeeDailyStat, {'day': day, 'employee_id': employee_id},
+                {'returns': 1, 'hold_seconds': hold_seconds})
+
+
+def rebuild():
+    """
+    Пересчитывает сводки из истории одним проходом по выдачам и возвратам
+    в хронологическом порядке и заменяет ими текущие в одной транзакции.
+    Возвращает число суток в сводке
+    """
+    issues = select(
+        literal(0).label('kind'), VideoRecorderIssue.id, VideoRecorderIssue.issue_date.label('event_date'),
+        VideoRecorderIssue.employee_id, null().label('duration')
+    )
+    returns = (
+        select(
+            literal(1).label('kind'), VideoRecorderReturn.id, VideoRecorderReturn.return_date.label('event_date'),
+            VideoRecorderReturn.employee_id, VideoRecorderIssue.duration
+        )
+        .outerjoin(VideoRecorderIssue, VideoRecorderIssue.id == VideoRecorderReturn.issue_id)
+    )
+    events = union_all(issues, returns).order_by(
+        literal_column('event_date'), literal_column('kind'), literal_column('id')
+    )
+
+    days = {}
+    employee_days = {}
+    active = 0
+    result = db.session.execute(events.execution_options(yield_per=1000))
+    for kind, _, event_date, employee_id, duration in result:
+        day = event_date.date()
+        stat = days.setdefault(day, {
+            'day': day, 'issues': 0, 'returns': 0, 'hold_seconds': 0, 'active': active, 'peak_active': active
+        })
+        employee_stat = None
+        if employee_id is not None:
+            employee_stat = employee_days.setdefault((day, employee_id), {
+                'day': day, 'employee_id': employee_id, 'issues': 0, 'returns': 0, 'hold_seconds': 0
+            })
+        if kind == 0:
+            active += 1
+            stat['issues'] += 1
+            stat['peak_active'] = max(stat['peak_active'], active)
+            if employee_stat:
+                employee_stat['issues'] += 1
+        else:
+            stat['peak_active'] = max(stat['peak_active'], active)
+            active = max(active - 1, 0)
+            stat['returns'] += 1
+            stat['hold_seconds'] += duration or 0
+            if employee_stat:
+                employee_stat['returns'] += 1
+                employee_stat['hold_seconds'] += duration or 0
+        stat['active'] = active
+
+    db.session.execute(delete(DailyStat))
+    db.session.execute(delete(EmployeeDailyStat))
+    if days:
+        db.session.execute(insert(DailyStat), list(days.values()))
+    if employee_days:
+        db.session.execute(insert(EmployeeDailyStat), list(employee_days.values()))
+    bump('daily_stats')
+    db.session.commit()
+    return len(days)
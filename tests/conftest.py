@@ -0,0 +1,65 @@
+"""
+Общие фикстуры тестов: приложение на отдельной файловой SQLite-базе со схемой
+из миграций, администратор и оператор с токенами
+"""
+import os
+
+# config.py читает окружение при импорте: снимки метрик в тестах не пишутся
+os.environ['METRICS_DIR'] = ''
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import select
+from app import create_app
+from config import Config
+from database import db
+from migrations import migrate
+from models import Role, User
+from routes.utils import invalidate_user_cache
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        METRICS_DIR = ''
+        SLOW_QUERY_MS = 0
+
+    app = create_app(TestConfig)
+    # Кэш пользователей общий для процесса, а id пользователей в каждой базе свои
+    invalidate_user_cache()
+    with app.app_context():
+        migrate()
+    yield app
+    invalidate_user_cache()
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_user(app, username, role_name):
+    """Пользователь с ролью role_name; возвращает (id, заголовки с его токеном)"""
+    with app.app_context():
+        role = db.session.scalar(select(Role).where(Role.name == role_name))
+        user = User(username=username, password_hash='-', last_name=username, first_name=username, role_id=role.id)
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=str(user.id), additional_claims={'role': role_name})
+        return user.id, {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def admin(app):
+    return create_user(app, 'admin', 'admin')
+
+
+@pytest.fixture
+def operator(app):
+    return create_user(app, 'operator', 'operator')
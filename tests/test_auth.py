@@ -0,0 +1,43 @@
+"""
+Проверка прав: роль из токена сверяется с пользователем из кэша процесса
+"""
+from sqlalchemy import select, update
+from database import db
+from models import Role, User
+from routes import utils
+
+
+def test_deleted_user_loses_access(app, client, admin):
+    user_id, headers = admin
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+
+    with app.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+
+    assert client.post('/api/auth/register', headers=headers, json={}).status_code == 403
+
+
+def test_demoted_admin_loses_access(app, client, admin):
+    user_id, headers = admin
+    with app.app_context():
+        operator_role = db.session.scalar(select(Role.id).where(Role.name == 'operator'))
+        db.session.get(User, user_id).role_id = operator_role
+        db.session.commit()
+
+    assert client.post('/api/auth/register', headers=headers, json={}).status_code == 403
+
+
+def test_change_from_other_process_applies_after_ttl(app, client, admin, monkeypatch):
+    user_id, headers = admin
+    assert client.get('/api/auth/me', headers=headers).get_json()['username'] == 'admin'
+
+    # UPDATE в обход сессии: сброс кэша после коммита его не видит, как изменение из другого процесса
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(update(User).where(User.id == user_id).values(username='renamed'))
+    assert client.get('/api/auth/me', headers=headers).get_json()['username'] == 'admin'
+
+    now = utils.time.monotonic()
+    monkeypatch.setattr(utils.time, 'monotonic', lambda: now + utils.USER_CACHE_SECONDS)
+    assert client.get('/api/auth/me', headers=headers).get_json()['username'] == 'renamed'
@@ -0,0 +1,48 @@
+"""
+Одновременные выдачи одного видеорегистратора: условный UPDATE статуса
+и частичные уникальные индексы пропускают ровно одну
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from sqlalchemy import insert, select
+from database import db
+from models import Employee, VideoRecorder, VideoRecorderIssue
+
+PARALLEL_REQUESTS = 200
+
+
+def test_parallel_issues_of_one_recorder(app, operator):
+    _, headers = operator
+    with app.app_context():
+        db.session.execute(insert(VideoRecorder), [{'id': 1, 'number': 'VR-1'}])
+        db.session.execute(insert(Employee), [
+            {'id': i, 'full_name': f'Сотрудник {i}', 'employee_number': f'{i:06d}'}
+            for i in range(1, PARALLEL_REQUESTS + 1)
+        ])
+        db.session.commit()
+
+    # Все потоки отправляют запрос одновременно, каждый — своим клиентом
+    barrier = threading.Barrier(PARALLEL_REQUESTS)
+
+    def issue(employee_id):
+        client = app.test_client()
+        barrier.wait()
+        response = client.post('/api/issues/issue', headers=headers,
+                               json={'video_recorder_id': 1, 'employee_id': employee_id})
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=PARALLEL_REQUESTS) as executor:
+        statuses = list(executor.map(issue, range(1, PARALLEL_REQUESTS + 1)))
+
+    assert statuses.count(201) == 1
+    assert statuses.count(409) == PARALLEL_REQUESTS - 1
+
+    with app.app_context():
+        active = db.session.scalars(
+            select(VideoRecorderIssue).where(VideoRecorderIssue.status == 'issued')
+        ).all()
+        assert len(active) == 1
+        recorder = db.session.get(VideoRecorder, 1)
+        assert recorder.status == 'issued'
+        assert recorder.current_issue_id == active[0].id
+        assert recorder.current_employee_id == active[0].employee_id
@@ -0,0 +1,110 @@
+"""
+Idempotency-Key: повтор запроса получает сохранённый ответ, в том числе
+когда тот же ключ приходит в очереди офлайн-операций /replay
+"""
+import msgpack
+from sqlalchemy import event, insert, text
+from database import db
+from migrations import MIGRATIONS
+from models import Employee, VideoRecorder
+
+OPERATIONS = 20
+
+
+def seed(count):
+    db.session.execute(insert(VideoRecorder), [{'id': i, 'number': f'VR-{i}'} for i in range(1, count + 1)])
+    db.session.execute(insert(Employee), [
+        {'id': i, 'full_name': f'Сотрудник {i}', 'employee_number': f'{i:06d}'} for i in range(1, count + 1)
+    ])
+    db.session.commit()
+
+
+def test_replay_matches_direct_request_under_script_root(app, operator):
+    """Отпечаток операции очереди совпадает с одиночным запросом и при монтировании под префиксом"""
+    _, headers = operator
+    with app.app_context():
+        seed(1)
+    client = app.test_client()
+    body = {'video_recorder_id': 1, 'employee_id': 1}
+
+    response = client.post('/api/issues/issue', base_url='http://localhost/prefix',
+                           headers={**headers, 'Idempotency-Key': 'op-1'}, json=body)
+    assert response.status_code == 201
+
+    response = client.post('/api/issues/replay', base_url='http://localhost/prefix', headers=headers,
+                           json={'operations': [{'idempotency_key': 'op-1', 'operation': 'issue', **body}]})
+    assert response.status_code == 200
+    [result] = response.get_json()['results']
+    assert result['status'] == 201
+    assert result['replayed'] is True
+
+
+def test_replay_reads_keys_once(app, client, operator):
+    """Ключи очереди читаются одним запросом, а не по запросу на каждую уже выполненную операцию"""
+    _, headers = operator
+    with app.app_context():
+        seed(OPERATIONS)
+        engine = db.engine
+    operations = [{'idempotency_key': f'op-{i}', 'operation': 'issue', 'video_recorder_id': i, 'employee_id': i}
+                  for i in range(1, OPERATIONS + 1)]
+    # Половина очереди уже выполнена; новые операции между ними коммитят сессию
+    response = client.post('/api/issues/replay', headers=headers, json={'operations': operations[::2]})
+    assert response.status_code == 200
+
+    selects = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'idempotency_keys' in statement:
+            selects.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.post('/api/issues/replay', headers=headers, json={'operations': operations})
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['replayed'] for result in results] == [index % 2 == 0 for index in range(OPERATIONS)]
+    assert all(result['status'] == 201 for result in results)
+    assert len(selects) == 1
+
+
+def test_msgpack_response_replayed_byte_for_byte(app, client, operator):
+    """Ответ в MessagePack сохраняется байтами: повтор получает тот же ответ, а не 500 и 409"""
+    _, headers = operator
+    with app.app_context():
+        seed(1)
+    headers = {**headers, 'Accept': 'application/msgpack', 'Idempotency-Key': 'op-1'}
+    body = {'video_recorder_id': 1, 'employee_id': 1}
+
+    first = client.post('/api/issues/issue', headers=headers, json=body)
+    assert first.status_code == 201
+    assert first.mimetype == 'application/msgpack'
+
+    retry = client.post('/api/issues/issue', headers=headers, json=body)
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.mimetype == 'application/msgpack'
+    assert retry.get_data() == first.get_data()
+
+    # Та же операция из очереди: сохранённый MessagePack раскодирован в JSON-ответ
+    response = client.post('/api/issues/replay', headers={'Authorization': headers['Authorization']},
+                           json={'operations': [{'idempotency_key': 'op-1', 'operation': 'issue', **body}]})
+    [result] = response.get_json()['results']
+    assert result['replayed'] is True
+    assert result['response'] == msgpack.unpackb(first.get_data())
+
+
+def test_text_responses_migrated_to_bytes(app):
+    """Ответы, сохранённые до перехода на BLOB текстом, после миграции читаются как байты"""
+    migration = next(apply for version, name, apply in MIGRATIONS if name == 'idempotency_binary_responses')
+    with app.app_context():
+        db.session.execute(text(
+            "INSERT INTO idempotency_keys (user_id, key, request_hash, status_code, response_body, mimetype, "
+            "created_at, expires_at) VALUES (1, 'old', 'hash', 201, :body, 'application/json', "
+            "'2024-01-01 00:00:00', '2999-01-01 00:00:00')"
+        ), {'body': '{"id":1}'})
+        db.session.commit()
+        migration()
+        assert db.session.scalar(text("SELECT typeof(response_body) FROM idempotency_keys")) == 'blob'
+        assert db.session.scalar(text("SELECT response_body FROM idempotency_keys")) == b'{"id":1}'
@@ -0,0 +1,73 @@
+"""
+Метрики нескольких процессов: снимки в METRICS_DIR
+"""
+import json
+import os
+import subprocess
+import sys
+import metrics
+
+LABELS = [['endpoint', 'health'], ['method', 'GET'], ['status', '200']]
+HEALTH_LINE = 'http_requests_total{endpoint="health",method="GET",status="200"}'
+
+
+def write_snapshot(directory, pid, process, requests):
+    with open(directory / f'{process}.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'pid': pid, 'process': process,
+            'counters': [['http_requests_total', LABELS, requests]],
+            'histograms': [['http_request_duration_seconds', [['endpoint', 'health']], [requests] + [0] * 11, 0.5]],
+            'gauges': [['http_requests_in_progress', [], 7]],
+        }, f)
+
+
+def metric_value(text, prefix):
+    return float(next(line for line in text.splitlines() if line.startswith(prefix)).split()[-1])
+
+
+def test_recycled_pid_keeps_dead_worker_counters(app, client, admin, tmp_path):
+    _, headers = admin
+    directory = tmp_path / 'metrics'
+    directory.mkdir()
+    app.config['METRICS_DIR'] = str(directory)
+
+    # Снимок завершившегося воркера, pid которого достался текущему процессу
+    write_snapshot(directory, os.getpid(), f'{os.getpid()}-old', 1000)
+
+    client.get('/api/health')
+    text = client.get('/api/metrics', headers=headers).get_data(as_text=True)
+
+    # Снимок прежнего процесса перенесён в dead.json: его счётчики входят в сумму, а показатели «сейчас» — нет
+    assert not (directory / f'{os.getpid()}-old.json').exists()
+    assert (directory / metrics.DEAD_SNAPSHOT).exists()
+    assert (directory / f'{metrics.process_id()}.json').exists()
+    assert metric_value(text, HEALTH_LINE) > 1000
+    assert metric_value(text, 'http_requests_in_progress ') < 7
+
+
+def test_dead_worker_snapshots_folded_once(app, client, admin, tmp_path):
+    _, headers = admin
+    directory = tmp_path / 'metrics'
+    directory.mkdir()
+    app.config['METRICS_DIR'] = str(directory)
+
+    # pid завершившегося процесса
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    write_snapshot(directory, process.pid, f'{process.pid}-a', 100)
+    write_snapshot(directory, process.pid, f'{process.pid}-b', 10)
+
+    first = client.get('/api/metrics', headers=headers).get_data(as_text=True)
+    second = client.get('/api/metrics', headers=headers).get_data(as_text=True)
+
+    # Остались только снимок текущего процесса и общий снимок завершившихся
+    assert sorted(path.name for path in directory.glob('*.json')) == sorted(
+        [f'{metrics.process_id()}.json', metrics.DEAD_SNAPSHOT]
+    )
+    with open(directory / metrics.DEAD_SNAPSHOT, encoding='utf-8') as f:
+        dead = json.load(f)
+    assert dead['counters'] == [['http_requests_total', LABELS, 110]]
+    assert dead['histograms'][0][2][0] == 110
+    # Повторный сбор не учитывает перенесённые снимки второй раз
+    own = metrics.registry.counters.get(('http_requests_total', tuple(map(tuple, LABELS))), 0)
+    assert metric_value(first, HEALTH_LINE) == metric_value(second, HEALTH_LINE) == 110 + own
@@ -0,0 +1,29 @@
+"""
+Keyset-пагинация списков: курсор, изменённый клиентом, отклоняется с 400
+"""
+import pytest
+from sqlalchemy import insert
+from database import db
+from models import VideoRecorder
+from routes.utils import encode_cursor
+
+
+@pytest.mark.parametrize('after', [[{'a': 1}], [[1]], [True], ['1'], [1.5]])
+def test_malformed_cursor_is_rejected(client, operator, after):
+    _, headers = operator
+    cursor = encode_cursor({'sort': 'id', 'after': after})
+    response = client.get('/api/video-recorders', headers=headers, query_string={'limit': 10, 'cursor': cursor})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Неверный курсор'
+
+
+def test_cursor_pages_through_list(app, client, operator):
+    _, headers = operator
+    with app.app_context():
+        db.session.execute(insert(VideoRecorder), [{'number': f'VR-{i}'} for i in range(1, 4)])
+        db.session.commit()
+    first = client.get('/api/video-recorders', headers=headers, query_string={'limit': 2}).get_json()
+    second = client.get('/api/video-recorders', headers=headers,
+                        query_string={'limit': 2, 'cursor': first['next_cursor']}).get_json()
+    assert [item['number'] for item in first['items'] + second['items']] == ['VR-1', 'VR-2', 'VR-3']
+    assert second['next_cursor'] is None
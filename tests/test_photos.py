@@ -0,0 +1,127 @@
+"""
+Фотографии сотрудников: ETag и кэширование вариантов
+"""
+import io
+import os
+import time
+from datetime import datetime
+from PIL import Image
+from sqlalchemy import insert, select
+from database import db
+from models import Employee, EmployeePhoto
+from photos import PHOTO_GRACE_SECONDS, generate_variants, photo_path, release_photo_files, store_photo
+
+
+def png_bytes(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def upload(client, headers, employee_id, color='red'):
+    return client.post(f'/api/employees/{employee_id}/photo', headers=headers, content_type='multipart/form-data',
+                       data={'photo': (io.BytesIO(png_bytes(color)), 'photo.png', 'image/png')})
+
+
+def test_missing_variant_falls_back_to_revalidated_original(app, client, admin):
+    _, headers = admin
+    with app.app_context():
+        db.session.execute(insert(Employee), [{'id': 1, 'full_name': 'Сотрудник', 'employee_number': '000001'}])
+        db.session.commit()
+    assert upload(client, headers, 1).status_code == 200
+
+    with app.app_context():
+        photo = db.session.scalar(select(EmployeePhoto).where(EmployeePhoto.employee_id == 1))
+        filename, etag = photo.filename, photo.etag
+        os.remove(photo_path(filename, 'thumb'))
+
+    url = f'/api/employees/1/photo?size=thumb&v={etag}'
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    fallback_etag = response.headers['ETag']
+
+    # Перепроверка оригинала даёт 304, пока варианта нет
+    response = client.get(url, headers={**headers, 'If-None-Match': fallback_etag})
+    assert response.status_code == 304
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    # После создания варианта та же перепроверка отдаёт вариант, и он кэшируется бессрочно
+    with app.app_context():
+        generate_variants(filename)
+    response = client.get(url, headers={**headers, 'If-None-Match': fallback_etag})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert response.headers['ETag'] != fallback_etag
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_photo_upload_reaches_delta_sync(app, client, admin):
+    _, headers = admin
+    with app.app_context():
+        db.session.execute(insert(Employee), [{
+            'id': 1, 'full_name': 'Сотрудник', 'employee_number': '000001', 'updated_at': datetime(2024, 1, 1)
+        }])
+        db.session.commit()
+    cursor = client.get('/api/sync', headers=headers).get_json()['next_cursor']
+
+    assert upload(client, headers, 1).status_code == 200
+
+    employees = client.get('/api/sync', headers=headers, query_string={'since': cursor}).get_json()['employees']
+    assert [employee['id'] for employee in employees] == [1]
+    with app.app_context():
+        etag = db.session.scalar(select(EmployeePhoto.etag).where(EmployeePhoto.employee_id == 1))
+    assert employees[0]['photo_url'].endswith(f'v={etag}')
+
+
+def test_decompression_bomb_is_rejected(app, client, admin, monkeypatch):
+    _, headers = admin
+    with app.app_context():
+        db.session.execute(insert(Employee), [{'id': 1, 'full_name': 'Сотрудник', 'employee_number': '000001'}])
+        db.session.commit()
+    # 800×600 пикселей больше чем вдвое превышают предел: Pillow отказывается открывать файл
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+
+    response = upload(client, headers, 1)
+    assert response.status_code == 400
+
+    with app.app_context():
+        assert db.session.scalar(select(EmployeePhoto).where(EmployeePhoto.employee_id == 1)) is None
+        stored = [name for _, _, files in os.walk(app.config['UPLOAD_FOLDER']) for name in files]
+    assert stored == []
+
+
+def test_not_modified_without_file_access(app, client, admin, monkeypatch):
+    _, headers = admin
+    with app.app_context():
+        db.session.execute(insert(Employee), [{'id': 1, 'full_name': 'Сотрудник', 'employee_number': '000001'}])
+        db.session.commit()
+    assert upload(client, headers, 1).status_code == 200
+    response = client.get('/api/employees/1/photo?size=thumb', headers=headers)
+    etag = response.headers['ETag']
+
+    def no_file_access(path):
+        raise AssertionError(f'обращение к файлу {path}')
+
+    monkeypatch.setattr(os.path, 'exists', no_file_access)
+    response = client.get('/api/employees/1/photo?size=thumb', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_dedup_hit_refreshes_mtime_and_release_keeps_young_files(app):
+    with app.app_context():
+        filename, _, created = store_photo(io.BytesIO(png_bytes()))
+        assert created
+        old = time.time() - 2 * PHOTO_GRACE_SECONDS
+        os.utime(photo_path(filename), (old, old))
+
+        # Та же загрузка ещё раз: файл считается свежим и не удаляется, хотя ссылок на него нет
+        assert store_photo(io.BytesIO(png_bytes()))[0] == filename
+        assert os.path.getmtime(photo_path(filename)) > old + PHOTO_GRACE_SECONDS
+        release_photo_files([filename])
+        assert os.path.exists(photo_path(filename))
+
+        os.utime(photo_path(filename), (old, old))
+        release_photo_files([filename])
+        assert not os.path.exists(photo_path(filename))
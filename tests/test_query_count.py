@@ -0,0 +1,72 @@
+"""
+Списки выдач и возвратов собираются фиксированным числом SQL-запросов,
+сколько бы строк ни было в истории (без ленивых загрузок на каждую строку)
+"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event, insert, func, select
+from database import db
+from models import Employee, VideoRecorder, VideoRecorderIssue, VideoRecorderReturn
+
+ENDPOINTS = ('/api/issues/history', '/api/issues/active', '/api/issues/timeline')
+
+
+def seed(count, user_id):
+    """
+    Добавляет count сотрудников и регистраторов, у каждого — закрытая выдача
+    с возвратом и активная выдача
+    """
+    start = db.session.scalar(select(func.count()).select_from(Employee))
+    started_at = datetime(2024, 1, 1)
+    employees = [{'id': start + i + 1, 'full_name': f'Сотрудник {start + i}', 'employee_number': f'{start + i:06d}'}
+                 for i in range(count)]
+    recorders = [{'id': row['id'], 'number': f'VR-{row["id"]}', 'status': 'issued', 'current_employee_id': row['id']}
+                 for row in employees]
+    issues = []
+    returns = []
+    for row in employees:
+        issued_at = started_at + timedelta(minutes=row['id'])
+        issues.append({'id': 2 * row['id'] - 1, 'video_recorder_id': row['id'], 'employee_id': row['id'],
+                       'issued_by_user_id': user_id, 'issue_date': issued_at, 'status': 'returned',
+                       'returned_at': issued_at + timedelta(hours=1), 'duration': 3600})
+        issues.append({'id': 2 * row['id'], 'video_recorder_id': row['id'], 'employee_id': row['id'],
+                       'issued_by_user_id': user_id, 'issue_date': issued_at + timedelta(hours=2), 'status': 'issued'})
+        returns.append({'video_recorder_id': row['id'], 'employee_id': row['id'], 'issue_id': 2 * row['id'] - 1,
+                        'returned_by_user_id': user_id, 'return_date': issued_at + timedelta(hours=1)})
+    db.session.execute(insert(Employee), employees)
+    db.session.execute(insert(VideoRecorder), recorders)
+    db.session.execute(insert(VideoRecorderIssue), issues)
+    db.session.execute(insert(VideoRecorderReturn), returns)
+    db.session.commit()
+
+
+def count_queries(app, client, headers, url):
+    """Число SQL-запросов, выполненных при обработке GET url"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('url', ENDPOINTS)
+def test_query_count_does_not_grow_with_rows(app, client, operator, url):
+    user_id, headers = operator
+    counts = []
+    for count in (5, 45):
+        with app.app_context():
+            seed(count, user_id)
+        counts.append(count_queries(app, client, headers, url))
+
+    # 5 строк, затем 50 строк: одинаковое и небольшое число запросов
+    assert counts[0] == counts[1]
+    assert counts[0] <= 2
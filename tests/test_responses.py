@@ -0,0 +1,25 @@
+"""
+Кодирование ответов: MessagePack по заголовку Accept и сжатие brotli
+"""
+import brotli
+import msgpack
+from sqlalchemy import insert
+from database import db
+from models import VideoRecorder
+
+
+def test_msgpack_and_brotli(app, client, operator):
+    _, headers = operator
+    with app.app_context():
+        db.session.execute(insert(VideoRecorder), [{'id': i, 'number': f'VR-{i}'} for i in range(1, 101)])
+        db.session.commit()
+
+    response = client.get('/api/video-recorders', headers={
+        **headers, 'Accept': 'application/msgpack', 'Accept-Encoding': 'br'
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'application/msgpack'
+    assert response.headers['Content-Encoding'] == 'br'
+    recorders = msgpack.unpackb(brotli.decompress(response.get_data()))
+    assert [recorder['number'] for recorder in recorders][:2] == ['VR-1', 'VR-2']
+    assert len(recorders) == 100
@@ -0,0 +1,22 @@
+"""
+Поиск по началу слов: ранжирование bm25 по всем совпадениям
+"""
+from sqlalchemy import insert
+from database import db
+from models import Employee
+
+
+def test_best_match_found_beyond_first_rows(app, client, operator):
+    _, headers = operator
+    # Тысячи совпадений по должности (малый вес) идут в индексе раньше единственного совпадения по ФИО
+    rows = [{'id': i, 'full_name': f'Сотрудник {i}', 'employee_number': f'{i:06d}', 'position': 'Иванов-стажёр'}
+            for i in range(1, 3001)]
+    rows.append({'id': 3001, 'full_name': 'Иванов Пётр', 'employee_number': '003001', 'position': 'Водитель'})
+    with app.app_context():
+        db.session.execute(insert(Employee), rows)
+        db.session.commit()
+
+    response = client.get('/api/search', headers=headers, query_string={'q': 'ив', 'type': 'employees', 'limit': 5})
+    employees = response.get_json()['employees']
+    assert len(employees) == 5
+    assert employees[0]['id'] == 3001
@@ -0,0 +1,81 @@
+"""
+Статистика по суточным сводкам
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+import routes.stats
+from database import db
+from models import DailyStat, Employee, VideoRecorder
+from stats import rebuild
+
+
+class FrozenDatetime(datetime):
+    """datetime с подменённым utcnow()"""
+    now_value = None
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now_value
+
+
+def test_default_period_etag_changes_at_midnight(client, operator, monkeypatch):
+    _, headers = operator
+    monkeypatch.setattr(routes.stats, 'datetime', FrozenDatetime)
+
+    FrozenDatetime.now_value = datetime(2024, 5, 1, 23, 59)
+    response = client.get('/api/stats', headers=headers)
+    assert response.get_json()['date_to'] == '2024-05-01'
+    etag = response.headers['ETag']
+    assert client.get('/api/stats', headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+    FrozenDatetime.now_value = datetime(2024, 5, 2, 0, 1)
+    response = client.get('/api/stats', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['date_to'] == '2024-05-02'
+
+
+def test_explicit_period_etag_does_not_depend_on_date(client, operator, monkeypatch):
+    _, headers = operator
+    monkeypatch.setattr(routes.stats, 'datetime', FrozenDatetime)
+    query = {'date_from': '2024-04-01', 'date_to': '2024-04-30'}
+
+    FrozenDatetime.now_value = datetime(2024, 5, 1)
+    etag = client.get('/api/stats', headers=headers, query_string=query).headers['ETag']
+    FrozenDatetime.now_value = datetime(2024, 5, 2)
+    response = client.get('/api/stats', headers={**headers, 'If-None-Match': etag}, query_string=query)
+    assert response.status_code == 304
+
+
+def test_incremental_summary_matches_rebuild(app, client, operator):
+    _, headers = operator
+    with app.app_context():
+        db.session.execute(insert(VideoRecorder), [{'id': i, 'number': f'VR-{i}'} for i in range(1, 4)])
+        db.session.execute(insert(Employee), [
+            {'id': i, 'full_name': f'Сотрудник {i}', 'employee_number': f'{i:06d}'} for i in range(1, 4)
+        ])
+        # Вчера остался выданным один регистратор: сегодняшние сутки начинаются с него
+        db.session.execute(insert(DailyStat), [{
+            'day': datetime.utcnow().date() - timedelta(days=1), 'issues': 1, 'returns': 0, 'hold_seconds': 0,
+            'active': 1, 'peak_active': 1
+        }])
+        db.session.commit()
+
+    def post(kind, recorder_id, employee_id):
+        response = client.post(f'/api/issues/{kind}', headers=headers,
+                               json={'video_recorder_id': recorder_id, 'employee_id': employee_id})
+        assert response.status_code == 201
+
+    post('issue', 1, 1)
+    post('issue', 2, 2)
+    post('return', 1, 1)
+    post('issue', 3, 3)
+    post('return', 2, 2)
+
+    with app.app_context():
+        today = db.session.get(DailyStat, datetime.utcnow().date())
+        assert (today.issues, today.returns, today.active, today.peak_active) == (3, 2, 2, 3)
+
+        # Пересчёт по истории (в ней нет вчерашней выдачи) даёт те же сутки без неё
+        rebuild()
+        today = db.session.get(DailyStat, datetime.utcnow().date())
+        assert (today.issues, today.returns, today.active, today.peak_active) == (3, 2, 1, 2)
@@ -0,0 +1,53 @@
+"""
+Отслеживание изменений: версии таблиц для условных GET списков
+и записи об удалениях для дельта-синхронизации.
+
+Каждый обработчик, изменяющий таблицу, вызывает bump() в той же транзакции,
+что и само изменение, поэтому версия меняется ровно тогда, когда коммитятся
+данные. Списки отдают ETag из версий своих таблиц и строки запроса; на запрос
+с совпадающим If-None-Match отвечают 304 после одного чтения table_versions,
+не обращаясь к самим таблицам.
+
+Изменённые строки синхронизация находит по updated_at, а удалённых строк
+в таблице уже нет — поэтому обработчики удаления вызывают record_deletion().
+"""
+import hashlib
+import json
+from sqlalchemy import select, update, insert
+from database import db
+from models import TableVersion, Tombstone
+
+
+def bump(*tables):
+    """Увеличивает версии таблиц в текущей транзакции; коммит — за вызывающим кодом"""
+    tables = sorted(set(tables))
+    result = db.session.execute(
+        update(TableVersion)
+        .where(TableVersion.table_name.in_(tables))
+        .values(version=TableVersion.version + 1)
+    )
+    if result.rowcount != len(tables):
+        # Первое изменение таблицы: строки счётчика ещё нет
+        existing = set(db.session.scalars(select(TableVersion.table_name).where(TableVersion.table_name.in_(tables))))
+        db.session.execute(insert(TableVersion), [
+            {'table_name': table, 'version': 1} for table in tables if table not in existing
+        ])
+
+
+def record_deletion(table, *row_ids):
+    """Записывает удаление строк таблицы в текущей транзакции"""
+    db.session.execute(insert(Tombstone), [{'table_name': table, 'row_id': row_id} for row_id in row_ids])
+
+
+def table_versions(tables):
+    """Текущие версии таблиц одним запросом, в порядке tables; 0 — таблица ещё не менялась"""
+    versions = dict(db.session.execute(
+        select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(tables))
+    ).all())
+    return [versions.get(table, 0) for table in tables]
+
+
+def versions_etag(tables, query_string=b''):
+    """ETag ответа, зависящего только от содержимого tables и параметров запроса"""
+    raw = json.dumps([list(tables), table_versions(tables)], separators=(',', ':')).encode('utf-8')
+    return hashlib.sha1(raw + b'?' + query_string).hexdigest()